@@ -1,25 +1,20 @@
 from haystack.query import SQ
 from django.db.models import Q
-from ovp.apps.projects.models import Category
 from ovp.apps.projects.models import Project
-from ovp.apps.projects.models import Apply
 from ovp.apps.organizations.models import Organization
 
-from ovp.apps.channels.content_flow import BaseContentFlow
 from ovp.apps.channels.content_flow import NoContentFlow
 from ovp.apps.channels.content_flow import CFM
 
-class BoehringerContentFlow(BaseContentFlow):
+from channels.content_flow import CategoryContentFlow
+
+class BoehringerContentFlow(CategoryContentFlow):
   source = "default"
   destination = "boehringer"
 
-  def __init__(self):
-    try:
-      self.category_id = Category.objects.get(slug="export-to-boehringer").pk
-    except:
-      self.category_id = None
+  category_slug = "export-to-boehringer"
 
-  def get_filter_searchqueryset_q_obj(self, model_class):
+  def build_filter_searchqueryset_q_obj(self, model_class):
     if not self.category_id:
       raise NoContentFlow
 
@@ -30,7 +25,7 @@ class BoehringerContentFlow(BaseContentFlow):
 
     raise NoContentFlow
 
-  def get_filter_queryset_q_obj(self, model_class):
+  def get_membership_q_obj(self, model_class):
     if not self.category_id:
       raise NoContentFlow
 
@@ -38,9 +33,13 @@ class BoehringerContentFlow(BaseContentFlow):
       return Q(categories=self.category_id)
     elif model_class == Organization:
       return Q(project__categories=self.category_id)
-    elif model_class == Apply:
-      return Q(project__categories=self.category_id)
 
     raise NoContentFlow
 
+  def build_filter_queryset_q_obj(self, model_class):
+    if not self.category_id:
+      raise NoContentFlow
+
+    return super().build_filter_queryset_q_obj(model_class)
+
 CFM.add_flow(BoehringerContentFlow())
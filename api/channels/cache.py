@@ -0,0 +1,57 @@
+import threading
+import time
+
+from django.conf import settings
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from ovp.apps.projects.models import Category
+
+
+class CategoryIdCache():
+  """
+  Process-wide cache of category ids by slug
+
+  Ids are resolved on first use instead of at import time. Entries are
+  dropped whenever a Category changes in this process and expire after
+  CATEGORY_ID_CACHE_TTL seconds so other processes pick changes up too.
+  Missing categories are cached for CATEGORY_ID_CACHE_MISS_TTL seconds
+  only, a category created later is seen without a restart.
+
+  version is increased on every invalidation, so anything derived from
+  category ids can tell when it must be rebuilt.
+  """
+  def __init__(self):
+    self._ids = {}
+    self._lock = threading.Lock()
+    self.version = 0
+
+  def get(self, slug):
+    now = time.monotonic()
+    entry = self._ids.get(slug)
+    if entry is not None and entry[1] > now:
+      return entry[0]
+
+    pk = Category.objects.filter(slug=slug).values_list("pk", flat=True).first()
+    if pk is not None:
+      ttl = getattr(settings, "CATEGORY_ID_CACHE_TTL", 300)
+    else:
+      ttl = getattr(settings, "CATEGORY_ID_CACHE_MISS_TTL", 30)
+
+    with self._lock:
+      if entry is not None and entry[0] != pk:
+        self.version += 1
+      self._ids[slug] = (pk, now + ttl)
+    return pk
+
+  def invalidate(self):
+    with self._lock:
+      self._ids = {}
+      self.version += 1
+
+category_ids = CategoryIdCache()
+
+
+def invalidate_category_ids(sender, *args, **kwargs):
+  category_ids.invalidate()
+post_save.connect(invalidate_category_ids, sender=Category, dispatch_uid="channels_cache_category_post_save")
+post_delete.connect(invalidate_category_ids, sender=Category, dispatch_uid="channels_cache_category_post_delete")
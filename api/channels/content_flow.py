@@ -0,0 +1,487 @@
+import threading
+import time
+from collections import Counter
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import m2m_changed
+from django.db.models.signals import post_delete
+from django.db.models.signals import post_save
+from django.db.models.signals import pre_save
+from haystack.query import SQ
+from ovp.apps.channels.content_flow import BaseContentFlow
+from ovp.apps.channels.content_flow import CFM
+from ovp.apps.channels.content_flow import NoContentFlow
+from ovp.apps.core.models import Cause
+from ovp.apps.core.models import Skill
+from ovp.apps.organizations.models import Organization
+from ovp.apps.projects.models import Apply
+from ovp.apps.projects.models import Category
+from ovp.apps.projects.models import Project
+
+from channels.cache import category_ids
+from channels.default.models import ContentFlowMembership
+from channels.default.models import ContentFlowRule
+from channels.tracking import get_original_value
+from channels.tracking import track_fields
+
+MATERIALIZED_MODELS = (Project, Organization)
+MEMBERSHIPS_MIGRATION = ("default", "0009_contentflowmembership")
+
+materialized_flows = []
+
+_filter_cache_stats = defaultdict(Counter)
+_filter_cache_stats_lock = threading.Lock()
+
+
+def get_filter_cache_stats():
+  """
+  Return content flow filter cache hits and misses per destination channel
+  """
+  with _filter_cache_stats_lock:
+    return {destination: dict(counter) for destination, counter in _filter_cache_stats.items()}
+
+
+def reset_filter_cache_stats():
+  with _filter_cache_stats_lock:
+    _filter_cache_stats.clear()
+
+
+class MemoizedContentFlow(BaseContentFlow):
+  """
+  Content flow which builds its Q and SQ objects once per model class
+
+  Subclasses implement build_filter_queryset_q_obj and
+  build_filter_searchqueryset_q_obj. Results, NoContentFlow included, are
+  kept until get_filter_cache_key returns something else, so flows
+  depending on data must include it in the key. Cached objects are shared
+  between requests and must not be mutated.
+  """
+  def get_filter_cache_key(self):
+    return None
+
+  def build_filter_queryset_q_obj(self, model_class):
+    raise NoContentFlow
+
+  def build_filter_searchqueryset_q_obj(self, model_class):
+    raise NoContentFlow
+
+  def get_filter_queryset_q_obj(self, model_class):
+    return self._get_memoized("queryset", model_class, self.build_filter_queryset_q_obj)
+
+  def get_filter_searchqueryset_q_obj(self, model_class):
+    return self._get_memoized("searchqueryset", model_class, self.build_filter_searchqueryset_q_obj)
+
+  def _get_memoized(self, kind, model_class, build):
+    cache = self.__dict__.setdefault("_filter_cache", {})
+    key = self.get_filter_cache_key()
+    entry = cache.get((kind, model_class))
+
+    if entry is not None and entry[0] == key:
+      result = "hits"
+    else:
+      try:
+        entry = (key, build(model_class), False)
+      except NoContentFlow:
+        entry = (key, None, True)
+      cache[(kind, model_class)] = entry
+      result = "misses"
+
+    with _filter_cache_stats_lock:
+      _filter_cache_stats[self.destination][result] += 1
+
+    if entry[2]:
+      raise NoContentFlow
+    return entry[1]
+
+
+class CategoryContentFlow(MemoizedContentFlow):
+  """
+  Content flow driven by a category, resolved lazily by slug
+
+  Subclasses describe which objects flow with get_membership_q_obj. The
+  result is materialized in ContentFlowMembership, so filtering querysets
+  is a semi-join on an indexed table instead of joins through categories.
+  """
+  category_slug = None
+
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    materialized_flows.append(self)
+
+  @property
+  def category_id(self):
+    return category_ids.get(self.category_slug)
+
+  def get_filter_cache_key(self):
+    return self.category_id
+
+  def get_membership_q_obj(self, model_class):
+    raise NoContentFlow
+
+  def get_membership_queryset(self, model_class):
+    return ContentFlowMembership.objects.filter(
+      destination=self.destination,
+      source=self.source,
+      model=model_class._meta.label_lower
+    ).values("object_id")
+
+  def build_filter_queryset_q_obj(self, model_class):
+    if model_class == Apply:
+      return Q(project__in=self.get_membership_queryset(Project))
+    elif model_class in MATERIALIZED_MODELS:
+      return Q(pk__in=self.get_membership_queryset(model_class))
+
+    raise NoContentFlow
+
+
+class RuleContentFlow(MemoizedContentFlow):
+  """
+  Content flow between two channels built from ContentFlowRule rows
+  """
+  def __init__(self, source, destination):
+    self.source = source
+    self.destination = destination
+
+  def get_filter_cache_key(self):
+    return content_flow_rules.version
+
+  def get_organization_ids(self):
+    rules = content_flow_rules.get(self.source, self.destination)
+    return sorted(rule.object_id for rule in rules if rule.kind == ContentFlowRule.ORGANIZATION)
+
+  def flows_all(self):
+    rules = content_flow_rules.get(self.source, self.destination)
+    return any(rule.kind == ContentFlowRule.ALL for rule in rules)
+
+  def build_filter_searchqueryset_q_obj(self, model_class):
+    if self.flows_all():
+      if model_class in [Project, Organization, Cause, Skill]:
+        return SQ()
+      raise NoContentFlow
+
+    organization_ids = self.get_organization_ids()
+    if not organization_ids:
+      raise NoContentFlow
+
+    if model_class == Project:
+      return SQ(organization__in=organization_ids)
+    elif model_class == Organization:
+      return SQ(org_id__in=organization_ids)
+
+    raise NoContentFlow
+
+  def build_filter_queryset_q_obj(self, model_class):
+    if self.flows_all():
+      if model_class in [Project, Organization, Apply, Cause, Skill]:
+        return Q()
+      raise NoContentFlow
+
+    organization_ids = self.get_organization_ids()
+    if not organization_ids:
+      raise NoContentFlow
+
+    if model_class == Project:
+      return Q(organization__in=organization_ids)
+    elif model_class == Organization:
+      return Q(pk__in=organization_ids)
+    elif model_class == Apply:
+      return Q(project__organization_id__in=organization_ids)
+
+    raise NoContentFlow
+
+
+class ContentFlowRules():
+  """
+  Process-wide cache of content flow rules
+
+  Rules are read again after CONTENT_FLOW_RULES_TTL seconds, or right away
+  when a rule changes in this process, so flows can be configured without
+  a deploy. A RuleContentFlow is added to CFM for every channel pair found
+  and version is increased whenever the rules differ from the last load.
+  """
+  def __init__(self):
+    self._rules = None
+    self._expires = 0
+    self._lock = threading.Lock()
+    self._version = 0
+    self.flows = {}
+
+  @property
+  def version(self):
+    self.ensure_loaded()
+    return self._version
+
+  def get(self, source, destination):
+    self.ensure_loaded()
+    return self._rules.get((source, destination), ())
+
+  def ensure_loaded(self):
+    if self._rules is None or self._expires <= time.monotonic():
+      self.load()
+
+  def load(self):
+    rules = defaultdict(list)
+    for rule in ContentFlowRule.objects.order_by("pk"):
+      rules[(rule.source, rule.destination)].append(rule)
+    rules = {pair: tuple(pair_rules) for pair, pair_rules in rules.items()}
+
+    def signature(rules):
+      return {(rule.source, rule.destination, rule.kind, rule.object_id) for pair_rules in rules.values() for rule in pair_rules}
+
+    with self._lock:
+      if self._rules is None or signature(self._rules) != signature(rules):
+        self._version += 1
+      self._rules = rules
+      self._expires = time.monotonic() + getattr(settings, "CONTENT_FLOW_RULES_TTL", 60)
+
+      for source, destination in rules:
+        if (source, destination) not in self.flows:
+          flow = RuleContentFlow(source, destination)
+          self.flows[(source, destination)] = flow
+          CFM.add_flow(flow)
+
+  def invalidate(self):
+    self._expires = 0
+
+content_flow_rules = ContentFlowRules()
+
+
+def register_content_flow_rules():
+  """
+  Add a flow to CFM for every channel pair with rules, for processes
+  serving no request, e.g. celery workers when their process starts
+  """
+  content_flow_rules.ensure_loaded()
+
+
+def build_memberships_after_migrate(sender, plan=None, **kwargs):
+  """
+  Build memberships of existing objects once the migration creating their
+  table was applied, with the flows and models of the migrated state
+  """
+  if any(not backwards and (migration.app_label, migration.name) == MEMBERSHIPS_MIGRATION for migration, backwards in plan or []):
+    rebuild_memberships()
+
+
+def get_flow_members(flow, model_class, pks=None):
+  """
+  Return pks of objects which flow through a content flow, optionally
+  restricted to pks
+  """
+  try:
+    q_obj = flow.get_membership_q_obj(model_class)
+  except NoContentFlow:
+    return []
+
+  qs = model_class.objects.filter(channel__slug=flow.source).filter(q_obj)
+  if pks is not None:
+    qs = qs.filter(pk__in=pks)
+  return qs.order_by().values_list("pk", flat=True).distinct()
+
+
+def refresh_memberships(model_class, pks):
+  """
+  Recompute content flow memberships of some objects
+  """
+  pks = set(pk for pk in pks if pk is not None)
+  if not pks:
+    return
+
+  label = model_class._meta.label_lower
+  expected = set()
+  for flow in materialized_flows:
+    expected.update((flow.source, flow.destination, pk) for pk in get_flow_members(flow, model_class, pks))
+
+  with transaction.atomic():
+    existing = {
+      (source, destination, object_id): pk
+      for pk, source, destination, object_id in ContentFlowMembership.objects \
+        .filter(model=label, object_id__in=pks) \
+        .values_list("pk", "source", "destination", "object_id")
+    }
+
+    stale = [pk for key, pk in existing.items() if key not in expected]
+    if stale:
+      ContentFlowMembership.objects.filter(pk__in=stale).delete()
+
+    missing = [
+      ContentFlowMembership(source=source, destination=destination, model=label, object_id=object_id)
+      for source, destination, object_id in expected if (source, destination, object_id) not in existing
+    ]
+    if missing:
+      ContentFlowMembership.objects.bulk_create(missing, ignore_conflicts=True)
+
+
+def rebuild_memberships(flows=None, batch_size=1000):
+  """
+  Rebuild content flow memberships from scratch and return the number of
+  memberships created
+  """
+  count = 0
+  for flow in flows or materialized_flows:
+    for model_class in MATERIALIZED_MODELS:
+      label = model_class._meta.label_lower
+      with transaction.atomic():
+        ContentFlowMembership.objects.filter(source=flow.source, destination=flow.destination, model=label).delete()
+
+        batch = []
+        for pk in get_flow_members(flow, model_class).iterator():
+          batch.append(ContentFlowMembership(source=flow.source, destination=flow.destination, model=label, object_id=pk))
+          if len(batch) >= batch_size:
+            ContentFlowMembership.objects.bulk_create(batch)
+            count += len(batch)
+            batch = []
+
+        ContentFlowMembership.objects.bulk_create(batch)
+        count += len(batch)
+
+  return count
+
+
+def refresh_projects(pks):
+  pks = set(pks)
+  organization_pks = set(Project.objects.filter(pk__in=pks).values_list("organization_id", flat=True))
+  refresh_memberships(Project, pks)
+  refresh_memberships(Organization, organization_pks)
+
+
+def refresh_organizations(pks):
+  pks = set(pks)
+  project_pks = set(Project.objects.filter(organization_id__in=pks).values_list("pk", flat=True))
+  refresh_memberships(Organization, pks)
+  refresh_memberships(Project, project_pks)
+
+
+#####################
+# Signal handlers
+#####################
+ORGANIZATIONS_TO_REFRESH_ATTR = "_content_flow_organizations_to_refresh"
+
+track_fields(Project, "organization_id")
+
+
+def project_pre_save(sender, *args, **kwargs):
+  instance = kwargs["instance"]
+  if kwargs["raw"]:
+    return
+
+  original_organization_id = get_original_value(instance, "organization_id")
+  if instance.pk is None or original_organization_id != instance.organization_id:
+    instance.__dict__[ORGANIZATIONS_TO_REFRESH_ATTR] = {original_organization_id, instance.organization_id}
+pre_save.connect(project_pre_save, sender=Project, dispatch_uid="channels_content_flow_project_pre_save")
+
+
+def project_post_save(sender, *args, **kwargs):
+  instance = kwargs["instance"]
+  organization_pks = instance.__dict__.pop(ORGANIZATIONS_TO_REFRESH_ATTR, None)
+  if kwargs["raw"] or organization_pks is None:
+    return
+
+  refresh_memberships(Project, [instance.pk])
+  refresh_memberships(Organization, organization_pks)
+post_save.connect(project_post_save, sender=Project, dispatch_uid="channels_content_flow_project_post_save")
+
+
+def organization_post_save(sender, *args, **kwargs):
+  if kwargs["created"] and not kwargs["raw"]:
+    refresh_memberships(Organization, [kwargs["instance"].pk])
+post_save.connect(organization_post_save, sender=Organization, dispatch_uid="channels_content_flow_organization_post_save")
+
+
+def project_post_delete(sender, *args, **kwargs):
+  instance = kwargs["instance"]
+  ContentFlowMembership.objects.filter(model=Project._meta.label_lower, object_id=instance.pk).delete()
+  refresh_memberships(Organization, [instance.organization_id])
+post_delete.connect(project_post_delete, sender=Project, dispatch_uid="channels_content_flow_project_post_delete")
+
+
+def organization_post_delete(sender, *args, **kwargs):
+  ContentFlowMembership.objects.filter(model=Organization._meta.label_lower, object_id=kwargs["instance"].pk).delete()
+post_delete.connect(organization_post_delete, sender=Organization, dispatch_uid="channels_content_flow_organization_post_delete")
+
+
+def schedule_rebuild(category_slugs):
+  """
+  Rebuild memberships of the flows using some categories in a celery task,
+  once the transaction commits
+  """
+  flow_slugs = set(flow.category_slug for flow in materialized_flows)
+  category_slugs = sorted(slug for slug in category_slugs if slug in flow_slugs)
+  if category_slugs:
+    from channels.default import tasks
+    transaction.on_commit(lambda: tasks.rebuild_content_flow_memberships.delay(category_slugs))
+
+
+def categories_changed(refresh):
+  def handler(sender, instance, action, reverse, pk_set, **kwargs):
+    if action not in ("post_add", "post_remove", "post_clear"):
+      return
+
+    if not reverse:
+      refresh([instance.pk])
+    elif pk_set is not None:
+      refresh(pk_set)
+    else:
+      # A category was cleared from every object, we can't tell which ones
+      schedule_rebuild([instance.slug])
+  return handler
+
+project_categories_changed = categories_changed(refresh_projects)
+m2m_changed.connect(project_categories_changed, sender=Project.categories.through, dispatch_uid="channels_content_flow_project_categories")
+
+organization_categories_changed = categories_changed(refresh_organizations)
+m2m_changed.connect(organization_categories_changed, sender=Organization.categories.through, dispatch_uid="channels_content_flow_organization_categories")
+
+
+CATEGORY_SLUGS_ATTR = "_content_flow_category_slugs"
+
+track_fields(Category, "slug")
+
+
+def category_pre_save(sender, *args, **kwargs):
+  instance = kwargs["instance"]
+  instance.__dict__[CATEGORY_SLUGS_ATTR] = {get_original_value(instance, "slug"), instance.slug}
+pre_save.connect(category_pre_save, sender=Category, dispatch_uid="channels_content_flow_category_pre_save")
+
+
+def category_changed(sender, *args, **kwargs):
+  """
+  Flows resolve categories by slug and deleting a category doesn't send
+  m2m_changed, so memberships of flows using the category are rebuilt
+  when it is deleted or its slug changes
+  """
+  instance = kwargs["instance"]
+  if kwargs.get("raw"):
+    return
+
+  slugs = instance.__dict__.pop(CATEGORY_SLUGS_ATTR, {instance.slug})
+  if "created" in kwargs and (kwargs["created"] or len(slugs) == 1):
+    # New categories have no objects yet
+    return
+  schedule_rebuild(slugs)
+post_save.connect(category_changed, sender=Category, dispatch_uid="channels_content_flow_category_post_save")
+post_delete.connect(category_changed, sender=Category, dispatch_uid="channels_content_flow_category_post_delete")
+
+
+def content_flow_rule_changed(sender, *args, **kwargs):
+  """
+  Read rules again, and add flows for new channel pairs, as soon as the
+  change is committed
+  """
+  content_flow_rules.invalidate()
+  transaction.on_commit(content_flow_rules.load)
+post_save.connect(content_flow_rule_changed, sender=ContentFlowRule, dispatch_uid="channels_content_flow_rule_post_save")
+post_delete.connect(content_flow_rule_changed, sender=ContentFlowRule, dispatch_uid="channels_content_flow_rule_post_delete")
+
+
+def load_content_flow_rules(sender, *args, **kwargs):
+  """
+  Rules for channel pairs added by other processes need their flow added
+  to CFM before the request filters anything
+  """
+  content_flow_rules.ensure_loaded()
+request_started.connect(load_content_flow_rules, dispatch_uid="channels_content_flow_load_rules")
@@ -1,4 +1,5 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 class DefaultConfig(AppConfig):
   name = 'channels.default'
@@ -6,3 +7,5 @@ class DefaultConfig(AppConfig):
   def ready(self):
     from . import signals
     from . import content_flow
+    from channels.content_flow import build_memberships_after_migrate
+    post_migrate.connect(build_memberships_after_migrate, sender=self, dispatch_uid="channels_content_flow_build_memberships")
@@ -9,21 +9,22 @@ from ovp.apps.projects.models import Project
 from ovp.apps.projects.models import Apply
 from ovp.apps.organizations.models import Organization
 
-from ovp.apps.channels.content_flow import BaseContentFlow
 from ovp.apps.channels.content_flow import NoContentFlow
 from ovp.apps.channels.content_flow import CFM
 
-class BaseChannelContentFlow(BaseContentFlow):
+from channels.content_flow import MemoizedContentFlow
+
+class BaseChannelContentFlow(MemoizedContentFlow):
   source = "default"
   destination = "base"
 
-  def get_filter_searchqueryset_q_obj(self, model_class):
+  def build_filter_searchqueryset_q_obj(self, model_class):
     if model_class in [Project, Organization]:
       return SQ()
 
     raise NoContentFlow
 
-  def get_filter_queryset_q_obj(self, model_class):
+  def build_filter_queryset_q_obj(self, model_class):
     if model_class in [Cause, Skill, Project, Organization, Apply]:
       return Q()
 
@@ -0,0 +1,347 @@
+import datetime
+import json
+import os
+import random
+import shutil
+import tempfile
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from haystack import connections
+from haystack.constants import DJANGO_CT
+from haystack.constants import DJANGO_ID
+
+from channels.search.analyzers import FILTERS
+from channels.search.analyzers import PROFILES
+from channels.search.analyzers import get_index_settings
+
+# Analyzer haystack uses for each text field type
+TEXT_FIELD_ANALYZERS = {
+    'string': 'snowball',
+    'edge_ngram': 'edgengram_analyzer',
+    'ngram': 'ngram_analyzer',
+}
+WHOOSH_LANGUAGES = {
+    '_portuguese_': 'pt',
+    'portuguese': 'pt',
+    'light_portuguese': 'pt',
+    '_spanish_': 'es',
+    'spanish': 'es',
+    'light_spanish': 'es',
+}
+
+SYLLABLES = [
+    'a', 'al', 'an', 'ar', 'ba', 'ca', 'ção', 'ci', 'co', 'da', 'de', 'do', 'é', 'en', 'es', 'fa', 'ga', 'ia',
+    'in', 'la', 'le', 'li', 'lo', 'ma', 'me', 'mi', 'na', 'ne', 'no', 'nu', 'pa', 'pe', 'po', 'ra', 're', 'ri',
+    'ro', 'sa', 'se', 'so', 'ta', 'te', 'ti', 'to', 'tu', 'va', 've', 'vi', 'vo', 'ño',
+]
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def get_directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, dirs, files in os.walk(path) for name in files)
+
+
+def get_project_index():
+    from ovp.apps.projects.models import Project
+    return connections['default'].get_unified_index().get_index(Project)
+
+
+def get_whoosh_filter(name):
+    """ Whoosh equivalent of an Elasticsearch token filter of the profiles """
+    from whoosh import analysis
+
+    if name == 'lowercase':
+        return analysis.LowercaseFilter()
+    if name == 'asciifolding':
+        return analysis.CharsetFilter(analysis.accent_map)
+
+    definition = FILTERS.get(name, {})
+    kind = definition.get('type')
+    if kind == 'nGram':
+        return analysis.NgramFilter(definition['min_gram'], definition['max_gram'])
+    if kind == 'edgeNGram':
+        return analysis.NgramFilter(definition['min_gram'], definition['max_gram'], at='start')
+    if kind == 'shingle':
+        # Elasticsearch keeps single words next to the shingles
+        return analysis.TeeFilter(analysis.PassFilter(), *[
+            analysis.ShingleFilter(size=size, sep=' ')
+            for size in range(definition['min_shingle_size'], definition['max_shingle_size'] + 1)
+        ])
+    if kind == 'stop' and definition['stopwords'] in WHOOSH_LANGUAGES:
+        return analysis.StopFilter(minsize=1, lang=WHOOSH_LANGUAGES[definition['stopwords']])
+    if kind == 'stemmer' and definition['language'] in WHOOSH_LANGUAGES:
+        return analysis.StemFilter(lang=WHOOSH_LANGUAGES[definition['language']])
+    raise CommandError('Filter {} has no Whoosh equivalent'.format(name))
+
+
+def get_whoosh_analyzers(profile):
+    """ Whoosh analyzers built from the definitions of a profile, by name """
+    from whoosh import analysis
+
+    analyzers = {}
+    for name, definition in PROFILES[profile].items():
+        if definition.get('tokenizer') != 'standard':
+            raise CommandError('Tokenizer {} has no Whoosh equivalent'.format(definition.get('tokenizer')))
+        analyzer = analysis.RegexTokenizer()
+        for filter_name in definition.get('filter', []):
+            analyzer = analyzer | get_whoosh_filter(filter_name)
+        analyzers[name] = analyzer
+    return analyzers
+
+
+class Corpus():
+    """ Synthetic projects with the fields of ProjectIndex, the same for a given seed """
+    def __init__(self, fields, documents, queries, seed):
+        rng = random.Random(seed)
+        vocabulary = list(set(
+            ''.join(rng.choice(SYLLABLES) for i in range(rng.randint(2, 4)))
+            for j in range(5000)
+        ))
+        vocabulary.sort()
+        weights = [1 / (rank + 1) for rank in range(len(vocabulary))]
+
+        def words(count):
+            return ' '.join(rng.choices(vocabulary, weights=weights, k=count))
+
+        def value(field):
+            if field.field_type in TEXT_FIELD_ANALYZERS:
+                if field.is_multivalued:
+                    return [words(rng.randint(1, 3)) for i in range(rng.randint(1, 4))]
+                return words(rng.randint(40, 120)) if field.document else words(rng.randint(2, 6))
+            if field.field_type in ('integer', 'long'):
+                return rng.randint(0, 1000)
+            if field.field_type == 'float':
+                return rng.random() * 1000
+            if field.field_type == 'boolean':
+                return rng.random() < 0.5
+            if field.field_type in ('date', 'datetime'):
+                return datetime.datetime(2020, 1, 1) + datetime.timedelta(minutes=rng.randint(0, 525600))
+            if field.field_type == 'location':
+                return '{},{}'.format(rng.uniform(-34, 5), rng.uniform(-74, -35))
+            return words(1)
+
+        self.fields = fields
+        self.documents = []
+        for i in range(documents):
+            document = {DJANGO_CT: 'projects.project', DJANGO_ID: str(i)}
+            for field in fields.values():
+                document[field.index_fieldname] = value(field)
+            self.documents.append(document)
+
+        self.queries = []
+        for i in range(queries):
+            kind = i % 3
+            if kind == 0:
+                self.queries.append(rng.choice(vocabulary))
+            elif kind == 1:
+                self.queries.append(rng.choice(vocabulary)[:4])
+            else:
+                self.queries.append(words(2))
+
+    def get_text_fields(self):
+        return [field.index_fieldname for field in self.fields.values() if field.field_type in TEXT_FIELD_ANALYZERS]
+
+
+class ElasticsearchBenchmark():
+    def __init__(self, url, prefix):
+        from ovp.apps.search.backends import ConfigurableElasticSearchEngine
+        self.backend = ConfigurableElasticSearchEngine.backend('default', URL=url, INDEX_NAME=prefix)
+        self.conn = self.backend.conn
+        self.prefix = prefix
+
+    def run(self, profile, corpus, keep):
+        from elasticsearch import helpers
+
+        index = '{}-{}'.format(self.prefix, profile)
+        if self.conn.indices.exists(index=index):
+            self.conn.indices.delete(index=index)
+
+        # The mapping haystack creates for ProjectIndex
+        body = get_index_settings(profile)
+        body['mappings'] = {'properties': self.backend.build_schema(corpus.fields)[1]}
+        self.conn.indices.create(index=index, body=body)
+
+        started = time.perf_counter()
+        helpers.bulk(self.conn, ({'_index': index, '_source': document} for document in corpus.documents), chunk_size=500)
+        self.conn.indices.refresh(index=index)
+        indexing_time = time.perf_counter() - started
+
+        self.conn.indices.forcemerge(index=index, max_num_segments=1)
+        size = self.conn.indices.stats(index=index)['indices'][index]['total']['store']['size_in_bytes']
+
+        latencies = []
+        for query in corpus.queries:
+            started = time.perf_counter()
+            self.conn.search(index=index, size=20, body={
+                'query': {'multi_match': {'query': query, 'fields': corpus.get_text_fields()}}
+            })
+            latencies.append(time.perf_counter() - started)
+
+        if not keep:
+            self.conn.indices.delete(index=index)
+
+        return indexing_time, size, latencies
+
+
+class WhooshBenchmark():
+    def __init__(self, path):
+        self.path = path
+
+    def get_schema(self, profile, fields):
+        from whoosh import fields as whoosh_fields
+
+        analyzers = get_whoosh_analyzers(profile)
+        schema = whoosh_fields.Schema(**{DJANGO_CT: whoosh_fields.ID(stored=True), DJANGO_ID: whoosh_fields.ID(stored=True)})
+        for field in fields.values():
+            if field.field_type in TEXT_FIELD_ANALYZERS:
+                field_class = whoosh_fields.TEXT(analyzer=analyzers[TEXT_FIELD_ANALYZERS[field.field_type]], stored=field.stored)
+            elif field.field_type in ('integer', 'long'):
+                field_class = whoosh_fields.NUMERIC(numtype=int, stored=field.stored)
+            elif field.field_type == 'float':
+                field_class = whoosh_fields.NUMERIC(numtype=float, stored=field.stored)
+            elif field.field_type == 'boolean':
+                field_class = whoosh_fields.BOOLEAN(stored=field.stored)
+            elif field.field_type in ('date', 'datetime'):
+                field_class = whoosh_fields.DATETIME(stored=field.stored)
+            else:
+                field_class = whoosh_fields.ID(stored=field.stored)
+            schema.add(field.index_fieldname, field_class)
+        return schema
+
+    def prepare(self, document):
+        return {name: ' '.join(value) if isinstance(value, list) else value for name, value in document.items()}
+
+    def run(self, profile, corpus, keep):
+        from whoosh import index as whoosh_index
+        from whoosh import qparser
+
+        schema = self.get_schema(profile, corpus.fields)
+
+        path = os.path.join(self.path, profile)
+        shutil.rmtree(path, ignore_errors=True)
+        os.makedirs(path)
+        index = whoosh_index.create_in(path, schema)
+
+        started = time.perf_counter()
+        writer = index.writer()
+        for document in corpus.documents:
+            writer.add_document(**self.prepare(document))
+        writer.commit(optimize=True)
+        indexing_time = time.perf_counter() - started
+        size = get_directory_size(path)
+
+        latencies = []
+        parser = qparser.MultifieldParser(corpus.get_text_fields(), schema, group=qparser.OrGroup)
+        with index.searcher() as searcher:
+            for query in corpus.queries:
+                started = time.perf_counter()
+                list(searcher.search(parser.parse(query), limit=20))
+                latencies.append(time.perf_counter() - started)
+
+        if not keep:
+            shutil.rmtree(path)
+
+        return indexing_time, size, latencies
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare search analyzer profiles on synthetic projects with the fields of ProjectIndex: index size, '
+        'indexing throughput and query latency. Whoosh runs the profiles translated to Whoosh analyzers, which '
+        'tokenize words with a regular expression and stem with Snowball instead of the light stemmers, so its '
+        'numbers only compare profiles with each other.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--engine',
+            help='Search engine to benchmark',
+            choices=['elasticsearch', 'whoosh'],
+            default='elasticsearch',
+        )
+        parser.add_argument(
+            '--url',
+            help='Elasticsearch URL, defaults to the default haystack connection',
+        )
+        parser.add_argument(
+            '--profiles',
+            help='Comma separated analyzer profiles, all by default',
+            default=','.join(sorted(PROFILES)),
+        )
+        parser.add_argument(
+            '--documents',
+            help='Number of synthetic projects indexed',
+            type=int,
+            default=10000,
+        )
+        parser.add_argument(
+            '--queries',
+            help='Number of queries timed per profile',
+            type=int,
+            default=500,
+        )
+        parser.add_argument(
+            '--seed',
+            help='Seed of the synthetic corpus',
+            type=int,
+            default=42,
+        )
+        parser.add_argument(
+            '--keep',
+            help='Keep benchmark indexes once done',
+            action='store_true',
+        )
+        parser.add_argument(
+            '--json',
+            help='Print results as JSON',
+            action='store_true',
+        )
+
+    def handle(self, *args, **options):
+        profiles = [profile.strip() for profile in options['profiles'].split(',') if profile.strip()]
+        unknown = [profile for profile in profiles if profile not in PROFILES]
+        if unknown:
+            raise CommandError('Unknown profiles: {}'.format(', '.join(unknown)))
+
+        if options['engine'] == 'elasticsearch':
+            url = options['url'] or settings.HAYSTACK_CONNECTIONS['default'].get('URL')
+            if not url:
+                raise CommandError('No Elasticsearch URL, use --url')
+            benchmark = ElasticsearchBenchmark(url, 'analyzer-benchmark')
+        else:
+            benchmark = WhooshBenchmark(tempfile.mkdtemp(prefix='analyzer-benchmark-'))
+
+        corpus = Corpus(get_project_index().fields, options['documents'], options['queries'], options['seed'])
+
+        results = []
+        for profile in profiles:
+            indexing_time, size, latencies = benchmark.run(profile, corpus, options['keep'])
+            results.append({
+                'profile': profile,
+                'documents': len(corpus.documents),
+                'index_size_bytes': size,
+                'documents_per_second': len(corpus.documents) / indexing_time if indexing_time else None,
+                'p50_ms': percentile(latencies, 0.5) * 1000,
+                'p99_ms': percentile(latencies, 0.99) * 1000,
+            })
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        self.stdout.write('{:<12} {:>12} {:>12} {:>10} {:>10}'.format('profile', 'size (MB)', 'docs/s', 'p50 (ms)', 'p99 (ms)'))
+        for result in results:
+            self.stdout.write('{:<12} {:>12.2f} {:>12.0f} {:>10.2f} {:>10.2f}'.format(
+                result['profile'],
+                result['index_size_bytes'] / 1024 / 1024,
+                result['documents_per_second'] or 0,
+                result['p50_ms'],
+                result['p99_ms'],
+            ))
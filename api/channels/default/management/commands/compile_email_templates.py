@@ -0,0 +1,54 @@
+import os
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.template import engines
+from django.template.utils import get_app_template_dirs
+
+from channels.email_templates import EmailTemplateCompiler
+
+
+class Command(BaseCommand):
+    help = 'Compile channel email templates with their CSS inlined into EMAIL_COMPILED_TEMPLATES_DIR'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--channel',
+            help='Only compile templates of this channel',
+            type=str,
+        )
+
+    def _template_names(self, channel=None):
+        dirs = list(engines['django'].dirs) + list(get_app_template_dirs('templates'))
+        names = set()
+        for directory in dirs:
+            for root, _, files in os.walk(directory):
+                for filename in files:
+                    name = os.path.relpath(os.path.join(root, filename), directory).replace(os.sep, '/')
+                    if channel and not name.startswith('{}/'.format(channel)):
+                        continue
+                    names.add(name)
+        return sorted(names)
+
+    def handle(self, *args, **options):
+        directory = getattr(settings, 'EMAIL_COMPILED_TEMPLATES_DIR', None)
+        if not directory:
+            raise CommandError('EMAIL_COMPILED_TEMPLATES_DIR is not set.')
+
+        engine = engines['django'].engine
+        compiler = EmailTemplateCompiler(engine.template_loaders)
+
+        compiled = skipped = 0
+        for name in self._template_names(options['channel']):
+            if not compiler.is_compilable(name):
+                continue
+
+            if compiler.write(name, directory):
+                compiled += 1
+                self.stdout.write('Compiled {}'.format(name))
+            else:
+                skipped += 1
+                self.stdout.write('Skipped {}, it will be inlined at render time'.format(name))
+
+        self.stdout.write('{} templates compiled, {} skipped.'.format(compiled, skipped))
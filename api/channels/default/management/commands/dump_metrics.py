@@ -0,0 +1,60 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from channels.metrics import LABELS
+from channels.metrics import registry
+from channels.metrics import render_prometheus
+from channels.metrics import summarize
+
+
+class Command(BaseCommand):
+    help = 'Print request metrics of every process, slowest endpoints first'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--format',
+            help='Output format',
+            choices=['table', 'json', 'prometheus'],
+            default='table',
+        )
+        parser.add_argument(
+            '--channel',
+            help='Only show requests to this channel',
+        )
+        parser.add_argument(
+            '--top',
+            help='Number of rows shown in the table',
+            type=int,
+            default=20,
+        )
+        parser.add_argument(
+            '--reset',
+            help='Drop metrics of every process once printed, running processes drop theirs before their next flush',
+            action='store_true',
+        )
+
+    def handle(self, *args, **options):
+        metrics = registry.collect()
+        if options['channel']:
+            metrics = {key: entry for key, entry in metrics.items() if key.split('|', 1)[0] == options['channel']}
+
+        if options['format'] == 'prometheus':
+            self.stdout.write(render_prometheus(metrics), ending='')
+        elif options['format'] == 'json':
+            self.stdout.write(json.dumps(summarize(metrics), indent=2))
+        else:
+            self.write_table(summarize(metrics)[:options['top']])
+
+        if options['reset']:
+            registry.clear()
+
+    def write_table(self, rows):
+        columns = list(LABELS) + ['count', 'total_s', 'mean_ms', 'p95_ms', 'queries', 'db_ms']
+        cells = [columns] + [
+            [row[column] if isinstance(row[column], (int, str)) else '{:.2f}'.format(row[column]) for column in columns]
+            for row in rows
+        ]
+        widths = [max(len(str(line[i])) for line in cells) for i in range(len(columns))]
+        for line in cells:
+            self.stdout.write('  '.join(str(value).ljust(width) for value, width in zip(line, widths)))
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from channels.content_flow import materialized_flows
+from channels.content_flow import rebuild_memberships
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the table of objects visible in other channels through content flows'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--destination',
+            help='Only rebuild flows into this channel',
+        )
+        parser.add_argument(
+            '--batch-size',
+            help='Number of memberships inserted per query',
+            type=int,
+            default=1000,
+        )
+
+    def handle(self, *args, **options):
+        flows = materialized_flows
+        if options['destination']:
+            flows = [flow for flow in flows if flow.destination == options['destination']]
+
+        if not flows:
+            self.stdout.write('No content flows to rebuild.')
+            return
+
+        count = rebuild_memberships(flows, batch_size=options['batch_size'])
+        self.stdout.write('Rebuilt {} content flow memberships.'.format(count))
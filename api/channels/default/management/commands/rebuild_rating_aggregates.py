@@ -0,0 +1,20 @@
+from django.core.management.base import BaseCommand
+from ovp.apps.ratings.models import RatingAnswer
+from channels.default.models import RatingAggregate
+from channels.default.models import rebuild_rating_aggregates
+
+
+class Command(BaseCommand):
+    help = 'Rebuild rating aggregates used to compute volunteer and organization scores'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            help='Number of aggregates inserted per query',
+            type=int,
+            default=1000,
+        )
+
+    def handle(self, *args, **options):
+        count = rebuild_rating_aggregates(RatingAnswer, RatingAggregate, options['batch_size'])
+        self.stdout.write('Rebuilt {} rating aggregates.'.format(count))
@@ -0,0 +1,197 @@
+from multiprocessing import Pool
+
+from django.apps import apps
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.db import connections as db_connections
+from django.utils import timezone
+from haystack import connections
+
+from channels.default.models import SearchIndexQueue
+from channels.search.signals import index_queued_objects
+
+
+def _init_worker():
+    # Database connections inherited from the parent can't be shared
+    db_connections.close_all()
+
+
+def _get_backend(using, index_name):
+    engine = connections[using]
+    backend = engine.backend(using, **engine.options)
+    backend.index_name = index_name
+    backend.setup_complete = True
+    return backend
+
+
+def _index_chunk(args):
+    using, index_name, label, pks = args
+    model_class = apps.get_model(label)
+    index = connections[using].get_unified_index().get_index(model_class)
+    objects = list(index.index_queryset(using=using).filter(pk__in=pks))
+    if objects:
+        _get_backend(using, index_name).update(index, objects, commit=False)
+    return len(objects)
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the search index into a new versioned index and point the index alias to it once complete'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--using',
+            help='Search connection to rebuild',
+            default='default',
+        )
+        parser.add_argument(
+            '--workers',
+            help='Number of indexing processes',
+            type=int,
+            default=4,
+        )
+        parser.add_argument(
+            '--batch-size',
+            help='Number of objects sent per bulk request',
+            type=int,
+            default=500,
+        )
+        parser.add_argument(
+            '--keep',
+            help='Number of previous indexes kept for rollback',
+            type=int,
+            default=1,
+        )
+        parser.add_argument(
+            '--replace-index',
+            help='Allow deleting a concrete index named like the alias, the first time aliases are used',
+            action='store_true',
+        )
+        parser.add_argument(
+            '--rollback',
+            help='Point the alias back to the previous index instead of rebuilding',
+            action='store_true',
+        )
+
+    def handle(self, *args, **options):
+        using = options['using']
+        self.conn, self.alias = self.get_connection(using)
+
+        if options['rollback']:
+            self.rollback()
+            return
+
+        self.rebuild(using, options)
+
+    def get_connection(self, using):
+        """ Elasticsearch client and alias of a search connection """
+        backend = connections[using].get_backend()
+        if not hasattr(backend, 'conn') or not hasattr(backend.conn, 'indices'):
+            raise CommandError('Connection {} is not an Elasticsearch connection, use rebuild_index instead'.format(using))
+        return backend.conn, backend.index_name
+
+    def get_backend(self, using, index_name):
+        return _get_backend(using, index_name)
+
+    def get_versions(self):
+        """ Versioned indexes of the alias, oldest first """
+        return sorted(self.conn.indices.get('{}_*'.format(self.alias)).keys())
+
+    def get_current(self):
+        if not self.conn.indices.exists_alias(name=self.alias):
+            return None
+        return list(self.conn.indices.get_alias(name=self.alias).keys())[0]
+
+    def swap(self, index_name):
+        actions = [{'add': {'index': index_name, 'alias': self.alias}}]
+        current = self.get_current()
+        if current:
+            actions.insert(0, {'remove': {'index': current, 'alias': self.alias}})
+        self.conn.indices.update_aliases(body={'actions': actions})
+        self.stdout.write('{} now points to {}'.format(self.alias, index_name))
+
+    def rollback(self):
+        current = self.get_current()
+        previous = [name for name in self.get_versions() if current is None or name < current]
+        if not previous:
+            raise CommandError('No previous index to roll back to')
+        self.swap(previous[-1])
+
+    def index_chunks(self, tasks, workers):
+        """ Index chunks in worker processes, yielding the count of each """
+        # Connections open when forking would be shared with the workers
+        db_connections.close_all()
+        with Pool(workers, initializer=_init_worker) as pool:
+            for count in pool.imap_unordered(_index_chunk, tasks):
+                yield count
+
+    def rebuild(self, using, options):
+        if self.conn.indices.exists(index=self.alias) and not self.conn.indices.exists_alias(name=self.alias):
+            if not options['replace_index']:
+                raise CommandError('{} is an index, not an alias. Run with --replace-index to replace it, search is unavailable until the alias is created'.format(self.alias))
+
+        # Objects changed while building stay queued and are indexed into the
+        # new index before the swap, instead of into the old one
+        with SearchIndexQueue.hold_flushes():
+            index_name = '{}_{}'.format(self.alias, timezone.now().strftime('%Y%m%d%H%M%S%f'))
+            self.stdout.write('Building {}'.format(index_name))
+
+            # Creates the index with the mapping of the unified index
+            backend = self.get_backend(using, index_name)
+            backend.setup_complete = False
+            backend.setup()
+
+            # Refreshes and replicas slow bulk loading down, they are restored once built
+            index_settings = self.conn.indices.get_settings(index=index_name)[index_name]['settings']['index']
+            restored_settings = {
+                'refresh_interval': index_settings.get('refresh_interval', '1s'),
+                'number_of_replicas': index_settings.get('number_of_replicas', 1),
+            }
+            self.conn.indices.put_settings(index=index_name, body={'index': {'refresh_interval': '-1', 'number_of_replicas': 0}})
+
+            unified_index = connections[using].get_unified_index()
+            expected = 0
+            tasks = []
+            for model_class in unified_index.get_indexed_models():
+                index = unified_index.get_index(model_class)
+                pks = list(index.index_queryset(using=using).order_by('pk').values_list('pk', flat=True))
+                expected += len(pks)
+                label = model_class._meta.label_lower
+                for i in range(0, len(pks), options['batch_size']):
+                    tasks.append((using, index_name, label, pks[i:i + options['batch_size']]))
+
+            indexed = 0
+            for count in self.index_chunks(tasks, options['workers']):
+                indexed += count
+                self.stdout.write('{}/{} documents indexed'.format(indexed, expected))
+
+            expected -= self.catch_up(using, index_name)
+
+            self.conn.indices.put_settings(index=index_name, body={'index': restored_settings})
+            self.conn.indices.refresh(index=index_name)
+
+            count = self.conn.count(index=index_name)['count']
+            if count < expected:
+                raise CommandError('{} has {} documents, {} expected. The alias was not changed'.format(index_name, count, expected))
+
+            if self.conn.indices.exists(index=self.alias) and not self.conn.indices.exists_alias(name=self.alias):
+                self.conn.indices.delete(index=self.alias)
+            self.swap(index_name)
+
+        for old in self.get_versions()[:-(options['keep'] + 1)]:
+            self.conn.indices.delete(index=old)
+            self.stdout.write('Deleted {}'.format(old))
+
+    def catch_up(self, using, index_name):
+        """
+        Index objects queued while building into the new index and return
+        the number of queued deletions
+
+        Rows are left queued, they are flushed through the alias once flushes
+        are no longer held.
+        """
+        rows = list(SearchIndexQueue.objects.order_by('pk'))
+        if rows:
+            backend = self.get_backend(using, index_name)
+            index_queued_objects(rows, backends=[(backend, connections[using].get_unified_index())])
+            self.stdout.write('{} objects changed during the rebuild indexed again'.format(len(rows)))
+        return len([row for row in rows if row.action == SearchIndexQueue.DELETE])
@@ -0,0 +1,128 @@
+import os
+import shutil
+
+from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.utils import timezone
+from haystack import connections
+from haystack.backends.whoosh_backend import WhooshSearchBackend
+
+from channels.default.models import SearchIndexQueue
+from channels.search.signals import index_queued_objects
+
+
+class Command(BaseCommand):
+    help = (
+        'Rebuild the Whoosh index into a new versioned directory and point the index path, a symlink, to it '
+        'once complete. Search keeps working meanwhile'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--using',
+            help='Search connection to rebuild',
+            default='default',
+        )
+        parser.add_argument(
+            '--procs',
+            help='Number of processes writing index segments',
+            type=int,
+            default=os.cpu_count() or 1,
+        )
+        parser.add_argument(
+            '--batch-size',
+            help='Number of objects indexed per commit',
+            type=int,
+            default=1000,
+        )
+
+    def handle(self, *args, **options):
+        using = options['using']
+        engine = self.get_engine(using)
+        backend = engine.get_backend()
+        if not isinstance(backend, WhooshSearchBackend) or not backend.use_file_storage:
+            raise CommandError('Connection {} is not a file based Whoosh connection'.format(using))
+
+        path = backend.path.rstrip(os.sep)
+        if os.path.exists(path) and not os.path.isdir(path):
+            raise CommandError('{} is not a directory'.format(path))
+
+        # Objects changed while building stay queued and are indexed into the
+        # new index before the swap, instead of into the old one
+        with SearchIndexQueue.hold_flushes():
+            build_path = '{}.{}'.format(path, timezone.now().strftime('%Y%m%d%H%M%S%f'))
+            self.stdout.write('Building {}'.format(build_path))
+            try:
+                self.build(engine, using, build_path, options)
+                previous = self.swap(path, build_path)
+            except BaseException:
+                shutil.rmtree(build_path, ignore_errors=True)
+                raise
+
+        # Searches reading the previous index keep their open files
+        if previous:
+            shutil.rmtree(previous, ignore_errors=True)
+
+        if hasattr(backend, 'invalidate_search_cache'):
+            backend.invalidate_search_cache()
+        self.stdout.write('{} now points to {}'.format(path, build_path))
+
+    def get_engine(self, using):
+        return connections[using]
+
+    def build(self, engine, using, build_path, options):
+        builder = engine.backend(using, **dict(
+            engine.options,
+            PATH=build_path,
+            PROCS=options['procs'],
+            COMMIT_BATCH_SIZE=options['batch_size'],
+        ))
+        builder.setup()
+
+        unified_index = engine.get_unified_index()
+        for model_class in unified_index.get_indexed_models():
+            index = unified_index.get_index(model_class)
+            queryset = index.index_queryset(using=using).order_by('pk')
+            total = queryset.count()
+            for start in range(0, total, options['batch_size']):
+                builder.update(index, list(queryset[start:start + options['batch_size']]))
+                self.stdout.write('{}/{} {} indexed'.format(min(start + options['batch_size'], total), total, model_class._meta.verbose_name_plural))
+
+        self.catch_up(builder, unified_index)
+
+        # Each process and commit wrote its own segments, merge them for searching
+        builder.index.refresh().optimize()
+
+    def catch_up(self, builder, unified_index):
+        """
+        Index objects queued while building into the new index
+
+        Rows are left queued, they are flushed into the new index once flushes
+        are no longer held.
+        """
+        rows = list(SearchIndexQueue.objects.order_by('pk'))
+        if rows:
+            index_queued_objects(rows, backends=[(builder, unified_index)])
+            self.stdout.write('{} objects changed during the rebuild indexed again'.format(len(rows)))
+
+    def swap(self, path, build_path):
+        """
+        Atomically point the path symlink to build_path and return the
+        directory it pointed to
+        """
+        previous = None
+        if os.path.islink(path):
+            previous = os.path.realpath(path)
+        elif os.path.exists(path):
+            # An index built before versioned directories is moved aside once,
+            # search is unavailable until the symlink replaces it
+            previous = '{}.unversioned'.format(path)
+            shutil.rmtree(previous, ignore_errors=True)
+            os.rename(path, previous)
+
+        link = '{}.link'.format(path)
+        if os.path.lexists(link):
+            os.remove(link)
+        os.symlink(os.path.basename(build_path), link)
+        os.replace(link, path)
+        return previous
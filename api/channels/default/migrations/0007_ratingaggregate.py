@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from channels.default.models import rebuild_rating_aggregates
+
+
+def backfill_aggregates(apps, schema_editor):
+    # Scores are updated incrementally from these, they must include every
+    # answer given before aggregates existed
+    rebuild_rating_aggregates(apps.get_model('ratings', 'RatingAnswer'), apps.get_model('default', 'RatingAggregate'))
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('default', '0006_enable_email_verification_email'),
+        ('ratings', '__latest__'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RatingAggregate',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('rated_object_type', models.CharField(choices=[('user', 'User'), ('project', 'Project')], max_length=10)),
+                ('rated_object_id', models.PositiveIntegerField()),
+                ('parameter_slug', models.SlugField(max_length=100)),
+                ('total', models.FloatField(default=0)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='ratingaggregate',
+            unique_together=set([('rated_object_type', 'rated_object_id', 'parameter_slug')]),
+        ),
+        migrations.RunPython(backfill_aggregates, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('default', '0007_ratingaggregate'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledNotification',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('ask-project-interaction-confirmation-to-volunteer', 'Ask project interaction confirmation to volunteer'), ('project-reminder-to-volunteer', 'Project reminder to volunteer'), ('ask-about-project-experience-to-volunteer', 'Ask about project experience to volunteer'), ('ask-about-project-experience-to-organization', 'Ask about project experience to organization')], max_length=100)),
+                ('object_id', models.PositiveIntegerField()),
+                ('eta', models.DateTimeField(db_index=True)),
+                ('dispatched_date', models.DateTimeField(blank=True, null=True)),
+                ('created_date', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='schedulednotification',
+            unique_together=set([('kind', 'object_id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='schedulednotification',
+            index_together=set([('dispatched_date', 'eta')]),
+        ),
+    ]
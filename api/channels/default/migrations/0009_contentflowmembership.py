@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Memberships of existing objects are built after migrating, see
+    channels.content_flow.build_memberships_after_migrate
+    """
+
+    dependencies = [
+        ('default', '0008_schedulednotification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentFlowMembership',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.SlugField(max_length=100)),
+                ('destination', models.SlugField(max_length=100)),
+                ('model', models.CharField(max_length=100)),
+                ('object_id', models.PositiveIntegerField()),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='contentflowmembership',
+            unique_together=set([('destination', 'source', 'model', 'object_id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='contentflowmembership',
+            index_together=set([('model', 'object_id')]),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('default', '0009_contentflowmembership'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ContentFlowRule',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.SlugField(max_length=100)),
+                ('destination', models.SlugField(max_length=100)),
+                ('kind', models.CharField(choices=[('all', 'All content'), ('organization', 'Content of an organization')], max_length=30)),
+                ('object_id', models.PositiveIntegerField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='contentflowrule',
+            unique_together=set([('source', 'destination', 'kind', 'object_id')]),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+RULES = [
+    ('rrp', 'default', 'organization', 1780),
+    ('rrp', 'default', 'organization', 2120),
+    ('default', 'rrp', 'organization', 45),
+    ('default', 'roche', 'all', None),
+]
+
+def create_rules(apps, schema_editor):
+    ContentFlowRule = apps.get_model('default', 'ContentFlowRule')
+    for source, destination, kind, object_id in RULES:
+        ContentFlowRule.objects.get_or_create(source=source, destination=destination, kind=kind, object_id=object_id)
+
+def delete_rules(apps, schema_editor):
+    ContentFlowRule = apps.get_model('default', 'ContentFlowRule')
+    for source, destination, kind, object_id in RULES:
+        ContentFlowRule.objects.filter(source=source, destination=destination, kind=kind, object_id=object_id).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('default', '0010_contentflowrule'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_rules, delete_rules)
+    ]
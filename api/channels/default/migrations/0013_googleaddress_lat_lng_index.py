@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Index address coordinates for the bounding box of distance searches.
+    GoogleAddress belongs to ovp, so the index is created here.
+    """
+
+    dependencies = [
+        ('core', '0021_auto_20171005_1902'),
+        ('default', '0012_searchindexqueue'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS core_googleaddress_lat_lng ON core_googleaddress (lat, lng)',
+            'DROP INDEX IF EXISTS core_googleaddress_lat_lng',
+        ),
+    ]
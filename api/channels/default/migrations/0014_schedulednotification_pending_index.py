@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Replace the (dispatched_date, eta) index with a partial index on the
+    notifications not dispatched yet, dispatched ones are pruned periodically.
+    """
+
+    dependencies = [
+        ('default', '0013_googleaddress_lat_lng_index'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='schedulednotification',
+            index_together=set([]),
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX IF NOT EXISTS default_schedulednotification_pending ON default_schedulednotification (eta) WHERE dispatched_date IS NULL',
+            'DROP INDEX IF EXISTS default_schedulednotification_pending',
+        ),
+    ]
@@ -0,0 +1,246 @@
+from contextlib import contextmanager
+
+from django.db import connection
+from django.db import models
+from django.db.models import Count
+from django.db.models import F
+from django.db.models import Sum
+from django.db import IntegrityError
+from django.db import transaction
+
+
+class RatingAggregate(models.Model):
+  """
+  Running sum and count of quantitative rating answers per rated object and
+  parameter slug, used to update user and organization scores incrementally
+  """
+  USER = "user"
+  PROJECT = "project"
+  RATED_OBJECT_TYPES = (
+    (USER, "User"),
+    (PROJECT, "Project"),
+  )
+
+  rated_object_type = models.CharField(max_length=10, choices=RATED_OBJECT_TYPES)
+  rated_object_id = models.PositiveIntegerField()
+  parameter_slug = models.SlugField(max_length=100)
+  total = models.FloatField(default=0)
+  count = models.PositiveIntegerField(default=0)
+
+  class Meta:
+    unique_together = (("rated_object_type", "rated_object_id", "parameter_slug"),)
+
+  @property
+  def score(self):
+    if self.count > 0:
+      return self.total / self.count
+    return None
+
+  @classmethod
+  def add_value(cls, rated_object_type, rated_object_id, parameter_slug, value, count=1):
+    """
+    Add value to the total and count to the count, negative to take an
+    answer back, and return the updated aggregate or None
+    """
+    lookup = {
+      "rated_object_type": rated_object_type,
+      "rated_object_id": rated_object_id,
+      "parameter_slug": parameter_slug,
+    }
+
+    updated = cls.objects.filter(**lookup).update(total=F("total") + value, count=F("count") + count)
+    if not updated and count > 0:
+      try:
+        with transaction.atomic():
+          return cls.objects.create(total=value, count=count, **lookup)
+      except IntegrityError:
+        cls.objects.filter(**lookup).update(total=F("total") + value, count=F("count") + count)
+
+    return cls.objects.filter(**lookup).first()
+
+
+def rebuild_rating_aggregates(rating_answer_model, rating_aggregate_model, batch_size=1000):
+  """
+  Replace rating aggregates with sums and counts of existing answers and
+  return how many were created
+
+  Models are arguments so migrations can pass their historical models.
+  """
+  rows = rating_answer_model.objects \
+    .filter(channel__slug="default", value_quantitative__isnull=False) \
+    .values("rating__request__rated_object_user", "rating__request__rated_object_project", "parameter__slug") \
+    .annotate(total=Sum("value_quantitative"), count=Count("pk")) \
+    .order_by()
+
+  aggregates = []
+  for row in rows:
+    if row["rating__request__rated_object_user"]:
+      rated_object_type = RatingAggregate.USER
+      rated_object_id = row["rating__request__rated_object_user"]
+    elif row["rating__request__rated_object_project"]:
+      rated_object_type = RatingAggregate.PROJECT
+      rated_object_id = row["rating__request__rated_object_project"]
+    else:
+      continue
+
+    aggregates.append(rating_aggregate_model(
+      rated_object_type=rated_object_type,
+      rated_object_id=rated_object_id,
+      parameter_slug=row["parameter__slug"],
+      total=row["total"],
+      count=row["count"],
+    ))
+
+  with transaction.atomic():
+    rating_aggregate_model.objects.all().delete()
+    rating_aggregate_model.objects.bulk_create(aggregates, batch_size=batch_size)
+  return len(aggregates)
+
+
+class ScheduledNotification(models.Model):
+  """
+  Notification waiting for its eta, sent by the dispatch_scheduled_notifications
+  periodic task so long-eta messages are not held by the broker
+
+  Dispatched rows keep notifications from being scheduled again until
+  prune_scheduled_notifications deletes them.
+  """
+  ASK_PROJECT_INTERACTION_CONFIRMATION_TO_VOLUNTEER = "ask-project-interaction-confirmation-to-volunteer"
+  PROJECT_REMINDER_TO_VOLUNTEER = "project-reminder-to-volunteer"
+  ASK_ABOUT_PROJECT_EXPERIENCE_TO_VOLUNTEER = "ask-about-project-experience-to-volunteer"
+  ASK_ABOUT_PROJECT_EXPERIENCE_TO_ORGANIZATION = "ask-about-project-experience-to-organization"
+  KINDS = (
+    (ASK_PROJECT_INTERACTION_CONFIRMATION_TO_VOLUNTEER, "Ask project interaction confirmation to volunteer"),
+    (PROJECT_REMINDER_TO_VOLUNTEER, "Project reminder to volunteer"),
+    (ASK_ABOUT_PROJECT_EXPERIENCE_TO_VOLUNTEER, "Ask about project experience to volunteer"),
+    (ASK_ABOUT_PROJECT_EXPERIENCE_TO_ORGANIZATION, "Ask about project experience to organization"),
+  )
+
+  kind = models.CharField(max_length=100, choices=KINDS)
+  object_id = models.PositiveIntegerField()
+  eta = models.DateTimeField(db_index=True)
+  dispatched_date = models.DateTimeField(null=True, blank=True)
+  created_date = models.DateTimeField(auto_now_add=True)
+
+  class Meta:
+    unique_together = (("kind", "object_id"),)
+    # Due rows are found through a partial index on those not dispatched
+    # yet, see migration 0014
+
+  @classmethod
+  def schedule(cls, kind, object_id, eta):
+    """
+    Schedule a notification once per kind and object
+
+    A notification that was not dispatched yet is moved to the new eta.
+    """
+    try:
+      with transaction.atomic():
+        return cls.objects.create(kind=kind, object_id=object_id, eta=eta)
+    except IntegrityError:
+      cls.objects.filter(kind=kind, object_id=object_id, dispatched_date__isnull=True).exclude(eta=eta).update(eta=eta)
+      return cls.objects.get(kind=kind, object_id=object_id)
+
+
+class ContentFlowMembership(models.Model):
+  """
+  Object of a source channel visible in a destination channel through a
+  content flow, maintained by channels.content_flow
+  """
+  source = models.SlugField(max_length=100)
+  destination = models.SlugField(max_length=100)
+  model = models.CharField(max_length=100)
+  object_id = models.PositiveIntegerField()
+
+  class Meta:
+    unique_together = (("destination", "source", "model", "object_id"),)
+    index_together = (("model", "object_id"),)
+
+
+class ContentFlowRule(models.Model):
+  """
+  Rule letting content of a source channel be listed in a destination
+  channel, read by channels.content_flow.RuleContentFlow
+  """
+  ALL = "all"
+  ORGANIZATION = "organization"
+  KINDS = (
+    (ALL, "All content"),
+    (ORGANIZATION, "Content of an organization"),
+  )
+
+  source = models.SlugField(max_length=100)
+  destination = models.SlugField(max_length=100)
+  kind = models.CharField(max_length=30, choices=KINDS)
+  object_id = models.PositiveIntegerField(null=True, blank=True)
+
+  class Meta:
+    unique_together = (("source", "destination", "kind", "object_id"),)
+
+
+class SearchIndexQueue(models.Model):
+  """
+  Object waiting to be updated in or removed from the search index by the
+  flush_search_index_queue periodic task
+  """
+  UPDATE = "update"
+  DELETE = "delete"
+  ACTIONS = (
+    (UPDATE, "Update"),
+    (DELETE, "Delete"),
+  )
+
+  model = models.CharField(max_length=100)
+  object_id = models.PositiveIntegerField()
+  action = models.CharField(max_length=10, choices=ACTIONS)
+  created_date = models.DateTimeField(auto_now_add=True)
+
+  # Postgres advisory lock held shared by flushes and exclusively by
+  # hold_flushes
+  FLUSH_LOCK = 7301
+
+  class Meta:
+    unique_together = (("model", "object_id"),)
+
+  @classmethod
+  @contextmanager
+  def hold_flushes(cls):
+    """
+    Keep queued objects from being flushed until the block exits, once
+    flushes in progress are done
+
+    The lock is held by a connection of its own, closing the connections of
+    this process, e.g. before forking, doesn't release it.
+    """
+    lock_connection = connection.copy()
+    try:
+      with lock_connection.cursor() as cursor:
+        cursor.execute("SELECT pg_advisory_lock(%s)", [cls.FLUSH_LOCK])
+      yield
+    finally:
+      lock_connection.close()
+
+  @classmethod
+  def can_flush(cls):
+    """
+    Return False while flushes are held, otherwise keep them from being held
+    until the current transaction ends
+    """
+    with connection.cursor() as cursor:
+      cursor.execute("SELECT pg_try_advisory_xact_lock_shared(%s)", [cls.FLUSH_LOCK])
+      return cursor.fetchone()[0]
+
+  @classmethod
+  def enqueue(cls, model_class, object_id, action):
+    """
+    Queue an object once, the last action queued wins
+    """
+    label = model_class._meta.label_lower
+    if cls.objects.filter(model=label, object_id=object_id).update(action=action):
+      return
+
+    try:
+      with transaction.atomic():
+        cls.objects.create(model=label, object_id=object_id, action=action)
+    except IntegrityError:
+      cls.objects.filter(model=label, object_id=object_id).update(action=action)
@@ -0,0 +1,21 @@
+from ovp.apps.search import search_indexes
+
+from channels.search.geo import GeoPointField
+from channels.search.geo import get_location
+
+# These replace ovp's indexes, which are listed in HAYSTACK_EXCLUDED_INDEXES.
+# ovp's classes are reached through their module so haystack doesn't
+# collect them a second time from this one.
+
+class ProjectIndex(search_indexes.ProjectIndex):
+  location = GeoPointField(null=True)
+
+  def prepare_location(self, obj):
+    return get_location(obj.address)
+
+
+class OrganizationIndex(search_indexes.OrganizationIndex):
+  location = GeoPointField(null=True)
+
+  def prepare_location(self, obj):
+    return get_location(obj.address)
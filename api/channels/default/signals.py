@@ -1,4 +1,7 @@
 from datetime import timedelta
+from django.conf import settings
+from django.db.models import Avg
+from django.db.models.signals import post_delete
 from django.db.models.signals import post_save
 from django.db.models.signals import pre_save
 from ovp.apps.users.models import User
@@ -6,13 +9,18 @@ from ovp.apps.organizations.models import Organization
 from ovp.apps.projects.models import Job
 from ovp.apps.projects.models import Apply
 from ovp.apps.projects.models import Project
-from ovp.apps.ratings.models import Rating
 from ovp.apps.ratings.models import RatingRequest
 from ovp.apps.ratings.models import RatingParameter
 from ovp.apps.ratings.models import RatingAnswer
-from channels.default import tasks
+from channels.default.models import RatingAggregate
+from channels.default.models import ScheduledNotification
+from channels.tracking import track_fields
+from channels.tracking import get_original_value
 from django.utils import timezone
 
+track_fields(Project, "published", "closed")
+track_fields(RatingAnswer, "value_quantitative")
+
 def schedule_ask_project_interaction_to_volunteer(sender, *args, **kwargs):
   """
   Schedule task for 7 days after apply asking if user has received contact from organization
@@ -21,10 +29,7 @@ def schedule_ask_project_interaction_to_volunteer(sender, *args, **kwargs):
 
   if instance.channel.slug == "default" and kwargs["created"] and not kwargs["raw"]:
     eta = timezone.now() + timedelta(days=7)
-    tasks.send_ask_project_interaction_confirmation_to_volunteer.apply_async(
-      eta=eta,
-      kwargs={"apply_pk": instance.pk},
-    )
+    ScheduledNotification.schedule(ScheduledNotification.ASK_PROJECT_INTERACTION_CONFIRMATION_TO_VOLUNTEER, instance.pk, eta)
 post_save.connect(schedule_ask_project_interaction_to_volunteer, sender=Apply)
 
 def schedule_project_reminder_to_volunteer(sender, *args, **kwargs):
@@ -36,10 +41,8 @@ def schedule_project_reminder_to_volunteer(sender, *args, **kwargs):
 
   if instance.channel.slug == "default" and kwargs["created"] and not kwargs["raw"]:
     if hasattr(project, "job"):
-      tasks.send_project_reminder_to_volunteer.apply_async(
-        eta=project.job.start_date - timedelta(days=3),
-        kwargs={"apply_pk": instance.pk},
-      )
+      eta = project.job.start_date - timedelta(days=3)
+      ScheduledNotification.schedule(ScheduledNotification.PROJECT_REMINDER_TO_VOLUNTEER, instance.pk, eta)
 post_save.connect(schedule_project_reminder_to_volunteer, sender=Apply)
 
 def calculate_experience_email_eta(project):
@@ -61,7 +64,7 @@ def schedule_ask_about_project_experience_to_volunteer(sender, *args, **kwargs):
   if instance.channel.slug == "default" and kwargs["created"] and not kwargs["raw"]:
     eta = calculate_experience_email_eta(project)
     if eta:
-      tasks.send_ask_about_project_experience_to_volunteer.apply_async(eta=eta, kwargs={"apply_pk": instance.pk})
+      ScheduledNotification.schedule(ScheduledNotification.ASK_ABOUT_PROJECT_EXPERIENCE_TO_VOLUNTEER, instance.pk, eta)
 post_save.connect(schedule_ask_about_project_experience_to_volunteer, sender=Apply)
 
 def schedule_ask_about_project_experience_to_organization(sender, *args, **kwargs):
@@ -71,12 +74,58 @@ def schedule_ask_about_project_experience_to_organization(sender, *args, **kwarg
   instance = kwargs["instance"]
 
   if instance.channel.slug == "default" and not kwargs["raw"]:
-    if instance.published == True and (instance.pk == None or Project.objects.get(pk=instance.pk).published == False):
+    if instance.published == True and instance.pk and get_original_value(instance, "published") == False:
       eta = calculate_experience_email_eta(instance)
       if eta:
-        tasks.send_ask_about_project_experience_to_organization.apply_async(eta=eta, kwargs={"project_pk": instance.pk})
+        ScheduledNotification.schedule(ScheduledNotification.ASK_ABOUT_PROJECT_EXPERIENCE_TO_ORGANIZATION, instance.pk, eta)
 pre_save.connect(schedule_ask_about_project_experience_to_organization, sender=Project)
 
+VOLUNTEER_RATING_PARAMETERS = ["volunteer-score", "user-has-shown"]
+PROJECT_RATING_PARAMETERS = ["project-how-was-it", "project-score"]
+
+def get_rating_parameters(slugs):
+  """
+  Resolve rating parameters by slug with a single query, preserving order
+  """
+  parameters = {p.slug: p for p in RatingParameter.objects.filter(slug__in=slugs)}
+  for slug in slugs:
+    if slug not in parameters:
+      raise RatingParameter.DoesNotExist("RatingParameter matching slug \"{}\" does not exist.".format(slug))
+  return [parameters[slug] for slug in slugs]
+
+def bulk_create_rating_requests(project):
+  """
+  Create volunteer and project rating requests for every apply on a project
+
+  The number of queries is constant in the number of applies: parameters are
+  resolved once, requests are bulk inserted and so are the m2m through rows.
+  """
+  volunteer_parameters = get_rating_parameters(VOLUNTEER_RATING_PARAMETERS)
+  project_parameters = get_rating_parameters(PROJECT_RATING_PARAMETERS)
+
+  requests = []
+  parameters = []
+  for apply in project.apply_set.select_related("user"):
+    requests.append(RatingRequest(requested_user=project.owner, rated_object=apply.user, initiator_object=project, channel=project.channel))
+    parameters.append(volunteer_parameters)
+
+    requests.append(RatingRequest(requested_user=apply.user, rated_object=project, initiator_object=project, channel=project.channel))
+    parameters.append(project_parameters)
+
+  if not requests:
+    return []
+
+  requests = RatingRequest.objects.bulk_create(requests)
+
+  Through = RatingRequest.rating_parameters.through
+  Through.objects.bulk_create([
+    Through(ratingrequest_id=req.pk, ratingparameter_id=parameter.pk)
+    for req, request_parameters in zip(requests, parameters)
+    for parameter in request_parameters
+  ])
+
+  return requests
+
 def create_rating_request(sender, *args, **kwargs):
   """
   Create rating request when project is closed
@@ -88,55 +137,91 @@ def create_rating_request(sender, *args, **kwargs):
       if (instance.closed == True and
          instance.pk and
          instance.job and
-         Project.objects.get(pk=instance.pk).closed == False):
-        for apply in instance.apply_set.all():
-          req = RatingRequest.objects.create(requested_user=instance.owner, rated_object=apply.user, initiator_object=instance, object_channel=instance.channel.slug)
-          req.rating_parameters.add(RatingParameter.objects.get(slug="volunteer-score"))
-          req.rating_parameters.add(RatingParameter.objects.get(slug="user-has-shown"))
-
-          req = RatingRequest.objects.create(requested_user=apply.user, rated_object=instance, initiator_object=instance,  object_channel=instance.channel.slug)
-          req.rating_parameters.add(RatingParameter.objects.get(slug="project-how-was-it"))
-          req.rating_parameters.add(RatingParameter.objects.get(slug="project-score"))
+         get_original_value(instance, "closed") == False):
+        bulk_create_rating_requests(instance)
     except Job.DoesNotExist:
       pass
 pre_save.connect(create_rating_request, sender=Project)
 
+def get_database_score(rated_object_type, rated_object, slug):
+  """
+  Average quantitative answers for a rated object and parameter with a single query
+  """
+  lookup = "rating__request__rated_object_{}".format(rated_object_type)
+  answers = RatingAnswer.objects.filter(parameter__slug=slug, **{lookup: rated_object})
+  return answers.aggregate(score=Avg("value_quantitative"))["score"]
+
+def get_score(rated_object_type, rated_object, slug, value, count):
+  """
+  Return the score for a rated object after answers changed by value and
+  count
+
+  The strategy is selected by settings.RATINGS_SCORE_MODE: "incremental"
+  updates the running aggregate, "database" averages answers on the database.
+  """
+  if getattr(settings, "RATINGS_SCORE_MODE", "incremental") == "database":
+    return get_database_score(rated_object_type, rated_object, slug)
+
+  aggregate = RatingAggregate.add_value(rated_object_type, rated_object.pk, slug, value, count)
+  return aggregate.score if aggregate else None
+
+def update_rated_object_score(answer, value, count):
+  """
+  Update the volunteer or organization score an answer counts towards
+
+  The cost of computing a score does not depend on how many ratings the
+  rated object already has, see get_score.
+  """
+  obj = answer.rating.request.rated_object
+  slug = answer.parameter.slug
+
+  if isinstance(obj, User):
+    score = get_score(RatingAggregate.USER, obj, slug, value, count)
+
+    if slug == "volunteer-score" and score:
+      obj.rating = score
+      obj.save()
+
+  elif isinstance(obj, Project):
+    score = get_score(RatingAggregate.PROJECT, obj, slug, value, count)
+
+    if slug == "project-score" and score:
+      organization = obj.organization
+      organization.rating = score
+      organization.save()
+
+def store_previous_answer_value(sender, *args, **kwargs):
+  """
+  Keep the value an edited answer had, update_scores takes it back
+  """
+  instance = kwargs["instance"]
+
+  if instance.pk and not kwargs["raw"]:
+    instance._previous_value_quantitative = get_original_value(instance, "value_quantitative")
+pre_save.connect(store_previous_answer_value, sender=RatingAnswer)
+
 def update_scores(sender, *args, **kwargs):
   """
-  Create rating request when project is closed
+  Update volunteer or organization score when a rating answer is created
+  or its value edited
   """
   instance = kwargs["instance"]
+  previous = None if kwargs["created"] else instance.__dict__.pop("_previous_value_quantitative", None)
+  value = instance.value_quantitative
+
+  if instance.channel.slug == "default" and not kwargs["raw"]:
+    if value == previous or (value is None and previous is None):
+      return
 
-  def get_score(ratings, slug):
-    s = 0
-    c = 0
-    for rating in ratings:
-      for answer in rating.answers.all():
-        if answer.parameter.slug == slug:
-          s += answer.value_quantitative
-          c += 1
-
-    if c > 0:
-      return s/c
-    return None
-
-  if instance.channel.slug == "default" and not kwargs["raw"] and kwargs["created"]:
-    obj = instance.rating.request.rated_object
-
-    if isinstance(obj, User):
-      ratings = Rating.objects.filter(request__rated_object_user=obj)
-      score = get_score(ratings, "volunteer-score")
-
-      if score:
-        obj.rating = score
-        obj.save()
-
-    elif isinstance(obj, Project):
-      ratings = Rating.objects.filter(request__rated_object_project=obj)
-      score = get_score(ratings, "project-score")
-
-      if score:
-        organization = obj.organization
-        organization.rating = score
-        organization.save()
+    update_rated_object_score(instance, (value or 0) - (previous or 0), (value is not None) - (previous is not None))
 post_save.connect(update_scores, sender=RatingAnswer)
+
+def remove_deleted_answer_score(sender, *args, **kwargs):
+  """
+  Take deleted answers out of volunteer and organization scores
+  """
+  instance = kwargs["instance"]
+
+  if instance.channel.slug == "default" and instance.value_quantitative is not None:
+    update_rated_object_score(instance, -instance.value_quantitative, -1)
+post_delete.connect(remove_deleted_answer_score, sender=RatingAnswer)
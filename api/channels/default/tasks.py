@@ -1,11 +1,27 @@
 from __future__ import absolute_import
 
+import logging
+from datetime import timedelta
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
 from ovp.apps.projects.models import Apply
 from ovp.apps.projects.models import Project
 
+from channels.content_flow import materialized_flows
+from channels.content_flow import rebuild_memberships
 from channels.default.emails import AtadosScheduledEmail
+from channels.default.models import ScheduledNotification
+from channels.default.models import SearchIndexQueue
+from channels.email_backends import shared_connection
+from channels.search.signals import index_queued_objects
 from celery import task
 
+logger = logging.getLogger(__name__)
+
 @task(name='channels.default.tasks.send_ask_project_interaction_confirmation_to_volunteer')
 def send_ask_project_interaction_confirmation_to_volunteer(apply_pk):
   try:
@@ -39,4 +55,138 @@ def send_ask_about_project_experience_to_organization(project_pk):
     else:
       AtadosScheduledEmail(project.owner).sendAskAboutProjectJobExperienceToOrganization({"project": project})
   except Project.DoesNotExist:
-    pass
\ No newline at end of file
+    pass
+
+def _send_scheduled_email(kind, obj):
+  if kind == ScheduledNotification.ASK_PROJECT_INTERACTION_CONFIRMATION_TO_VOLUNTEER:
+    return AtadosScheduledEmail(obj.user, async_mail=False).sendAskProjectInteractionConfirmationToVolunteer({"apply": obj})
+  elif kind == ScheduledNotification.PROJECT_REMINDER_TO_VOLUNTEER:
+    return AtadosScheduledEmail(obj.user, async_mail=False).sendProjectReminderToVolunteer({"apply": obj})
+  elif kind == ScheduledNotification.ASK_ABOUT_PROJECT_EXPERIENCE_TO_VOLUNTEER:
+    return AtadosScheduledEmail(obj.user, async_mail=False).sendAskAboutProjectExperienceToVolunteer({"apply": obj})
+  elif kind == ScheduledNotification.ASK_ABOUT_PROJECT_EXPERIENCE_TO_ORGANIZATION:
+    if hasattr(obj, 'work'):
+      return AtadosScheduledEmail(obj.owner, async_mail=False).sendAskAboutProjectWorkExperienceToOrganization({"project": obj})
+    return AtadosScheduledEmail(obj.owner, async_mail=False).sendAskAboutProjectJobExperienceToOrganization({"project": obj})
+
+  raise ValueError("Unknown scheduled email kind: {}".format(kind))
+
+@task(name='channels.default.tasks.send_scheduled_emails')
+def send_scheduled_emails(kind, object_pks):
+  """
+  Send one kind of scheduled email for many applies or projects at once
+
+  Objects are loaded with a single query and emails are sent synchronously
+  over a single connection. Returns the result for each recipient.
+  """
+  if kind == ScheduledNotification.ASK_ABOUT_PROJECT_EXPERIENCE_TO_ORGANIZATION:
+    queryset = Project.objects.select_related("owner", "organization", "work")
+  else:
+    queryset = Apply.objects.select_related("user", "project__organization", "project__job")
+  objects = queryset.in_bulk(object_pks)
+
+  results = []
+  with shared_connection():
+    for pk in object_pks:
+      obj = objects.get(pk)
+      if obj is None:
+        results.append({"pk": pk, "email": None, "sent": False, "error": "does not exist"})
+        continue
+
+      email = obj.owner.email if isinstance(obj, Project) else obj.user.email
+      try:
+        sent = _send_scheduled_email(kind, obj)
+        results.append({"pk": pk, "email": email, "sent": bool(sent), "error": None})
+      except Exception as e:
+        logger.exception("Failed sending %s scheduled email for %s", kind, pk)
+        results.append({"pk": pk, "email": email, "sent": False, "error": str(e)})
+
+  return results
+
+@task(name='channels.default.tasks.dispatch_scheduled_notifications')
+def dispatch_scheduled_notifications(batch_size=None, now=None):
+  """
+  Enqueue scheduled notifications that are due, batch_size rows at a time
+
+  Rows are locked with SKIP LOCKED and marked as dispatched before being
+  enqueued, so concurrent dispatchers never send the same notification twice.
+  Each batch is sent as one send_scheduled_emails task per kind.
+  """
+  batch_size = batch_size or getattr(settings, "SCHEDULED_NOTIFICATIONS_BATCH_SIZE", 500)
+  now = now or timezone.now()
+  dispatched = 0
+
+  while True:
+    with transaction.atomic():
+      notifications = list(
+        ScheduledNotification.objects
+          .select_for_update(skip_locked=True)
+          .filter(dispatched_date__isnull=True, eta__lte=now)
+          .order_by("eta")[:batch_size]
+      )
+      if not notifications:
+        break
+
+      ScheduledNotification.objects.filter(pk__in=[n.pk for n in notifications]).update(dispatched_date=timezone.now())
+
+    object_pks = OrderedDict()
+    for notification in notifications:
+      object_pks.setdefault(notification.kind, []).append(notification.object_id)
+
+    for kind, pks in object_pks.items():
+      send_scheduled_emails.delay(kind, pks)
+
+    dispatched += len(notifications)
+
+  return dispatched
+
+@task(name='channels.default.tasks.prune_scheduled_notifications')
+def prune_scheduled_notifications(days=None, now=None):
+  """
+  Delete notifications dispatched more than days ago and return how many
+  were deleted
+  """
+  days = days if days is not None else getattr(settings, "SCHEDULED_NOTIFICATIONS_RETENTION_DAYS", 30)
+  now = now or timezone.now()
+  return ScheduledNotification.objects.filter(dispatched_date__lt=now - timedelta(days=days)).delete()[0]
+
+@task(name='channels.default.tasks.flush_search_index_queue')
+def flush_search_index_queue(batch_size=None):
+  """
+  Index objects queued by QueuedSignalProcessor, batch_size rows at a time
+
+  An object saved many times since the last flush is indexed once. Rows
+  are locked with SKIP LOCKED and only deleted once indexed, so a failed
+  flush is retried by the next one. Nothing is flushed while flushes are
+  held by SearchIndexQueue.hold_flushes.
+  """
+  batch_size = batch_size or getattr(settings, "SEARCH_INDEX_QUEUE_BATCH_SIZE", 500)
+  flushed = 0
+
+  while True:
+    with transaction.atomic():
+      if not SearchIndexQueue.can_flush():
+        # rebuild_search_index indexes queued objects into the new index
+        break
+
+      rows = list(SearchIndexQueue.objects.select_for_update(skip_locked=True).order_by("pk")[:batch_size])
+      if not rows:
+        break
+
+      index_queued_objects(rows)
+      SearchIndexQueue.objects.filter(pk__in=[row.pk for row in rows]).delete()
+
+    flushed += len(rows)
+
+  return flushed
+
+@task(name='channels.default.tasks.rebuild_content_flow_memberships')
+def rebuild_content_flow_memberships(category_slugs):
+  """
+  Rebuild memberships of the content flows driven by some categories and
+  return the number of memberships created
+  """
+  flows = [flow for flow in materialized_flows if flow.category_slug in category_slugs]
+  if not flows:
+    return 0
+  return rebuild_memberships(flows)
@@ -0,0 +1,45 @@
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from ovp.apps.projects.models import Category
+from channels.cache import CategoryIdCache
+from channels.cache import category_ids
+
+class CategoryIdCacheTestCase(TestCase):
+  def setUp(self):
+    self.category = Category.objects.create(name="Cached category", slug="cached-category", object_channel="default")
+    self.cache = CategoryIdCache()
+
+  def test_hit(self):
+    self.assertEqual(self.cache.get(self.category.slug), self.category.pk)
+    with self.assertNumQueries(0):
+      self.assertEqual(self.cache.get(self.category.slug), self.category.pk)
+
+  @override_settings(CATEGORY_ID_CACHE_MISS_TTL=300)
+  def test_miss_is_cached(self):
+    self.assertIsNone(self.cache.get("missing-category"))
+    with self.assertNumQueries(0):
+      self.assertIsNone(self.cache.get("missing-category"))
+
+  @override_settings(CATEGORY_ID_CACHE_MISS_TTL=0)
+  def test_miss_expires(self):
+    self.assertIsNone(self.cache.get("created-category"))
+    category = Category.objects.create(name="Created category", slug="created-category", object_channel="default")
+
+    version = self.cache.version
+    self.assertEqual(self.cache.get(category.slug), category.pk)
+    self.assertEqual(self.cache.version, version + 1)
+
+  @override_settings(CATEGORY_ID_CACHE_TTL=0)
+  def test_hit_expires(self):
+    self.assertEqual(self.cache.get(self.category.slug), self.category.pk)
+    with self.assertNumQueries(1):
+      self.cache.get(self.category.slug)
+
+  def test_category_change_invalidates(self):
+    category_ids.get(self.category.slug)
+    version = category_ids.version
+
+    self.category.delete()
+    self.assertEqual(category_ids.version, version + 1)
+    self.assertIsNone(category_ids.get(self.category.slug))
@@ -0,0 +1,106 @@
+import time
+
+from django.db.models import Q
+from django.test import TestCase
+
+from ovp.apps.organizations.models import Organization
+from ovp.apps.projects.models import Apply
+from ovp.apps.projects.models import Project
+
+from ovp.apps.channels.content_flow import CFM
+from ovp.apps.channels.content_flow import NoContentFlow
+
+from channels.content_flow import content_flow_rules
+from channels.default.models import ContentFlowRule
+from server.celery_tasks import load_content_flow_rules
+
+def copy_containers(value):
+  """ Copy lists, sets, tuples and dicts, sharing the objects they hold """
+  if isinstance(value, dict):
+    return {key: copy_containers(item) for key, item in value.items()}
+  if isinstance(value, (list, set, tuple)):
+    return type(value)(copy_containers(item) for item in value)
+  return value
+
+class RegisteredFlowsTestCase(TestCase):
+  """ Flows registered by a test are taken out of CFM once it is done """
+  def setUp(self):
+    self.registered = copy_containers(vars(CFM))
+    self.rule_flows = dict(content_flow_rules.flows)
+    content_flow_rules.invalidate()
+
+  def tearDown(self):
+    vars(CFM).clear()
+    vars(CFM).update(self.registered)
+    content_flow_rules.flows = self.rule_flows
+    content_flow_rules.invalidate()
+
+class RuleContentFlows(RegisteredFlowsTestCase):
+  def test_rules_are_seeded(self):
+    content_flow_rules.ensure_loaded()
+    flow = content_flow_rules.flows[("rrp", "default")]
+    self.assertEqual(flow.get_filter_queryset_q_obj(Organization), Q(pk__in=[1780, 2120]))
+    self.assertEqual(flow.get_filter_queryset_q_obj(Apply), Q(project__organization_id__in=[1780, 2120]))
+
+    flow = content_flow_rules.flows[("default", "roche")]
+    self.assertEqual(flow.get_filter_queryset_q_obj(Project), Q())
+
+  def test_flows_are_registered_in_celery_workers(self):
+    ContentFlowRule.objects.create(source="default", destination="registered", kind=ContentFlowRule.ALL)
+    load_content_flow_rules()
+    self.assertEqual(content_flow_rules.flows[("default", "registered")].get_filter_queryset_q_obj(Project), Q())
+
+  def test_rules_are_reloaded_on_change(self):
+    content_flow_rules.ensure_loaded()
+    flow = content_flow_rules.flows[("default", "rrp")]
+    self.assertEqual(flow.get_filter_queryset_q_obj(Project), Q(organization__in=[45]))
+
+    ContentFlowRule.objects.create(source="default", destination="rrp", kind=ContentFlowRule.ORGANIZATION, object_id=46)
+    self.assertEqual(flow.get_filter_queryset_q_obj(Project), Q(organization__in=[45, 46]))
+
+    ContentFlowRule.objects.filter(destination="rrp").delete()
+    with self.assertRaises(NoContentFlow):
+      flow.get_filter_queryset_q_obj(Project)
+
+
+class RuleContentFlowBenchmark(RegisteredFlowsTestCase):
+  repeats = 5
+  rounds = 20
+
+  def add_channels(self, channels):
+    ContentFlowRule.objects.bulk_create([
+      ContentFlowRule(source="benchmark-{}".format(i), destination="benchmark-{}".format(i + 1), kind=ContentFlowRule.ORGANIZATION, object_id=i)
+      for i in range(channels)
+    ], ignore_conflicts=True)
+    content_flow_rules.invalidate()
+    content_flow_rules.ensure_loaded()
+    return sorted(set(destination for source, destination in content_flow_rules.flows))
+
+  def filter_destinations(self, destinations):
+    for destination in destinations:
+      for model_class in [Project, Organization, Apply]:
+        CFM.filter_queryset(destination, model_class.objects.all())
+
+  def time_per_destination(self, destinations):
+    """ Best of repeats of the mean time to filter a destination """
+    self.filter_destinations(destinations)
+    best = None
+    for i in range(self.repeats):
+      started = time.perf_counter()
+      for j in range(self.rounds):
+        self.filter_destinations(destinations)
+      elapsed = (time.perf_counter() - started) / (self.rounds * len(destinations))
+      best = elapsed if best is None else min(best, elapsed)
+    return best
+
+  def test_overhead_is_flat_as_channels_are_added(self):
+    few = self.add_channels(5)
+    with self.assertNumQueries(0):
+      few_time = self.time_per_destination(few)
+
+    many = self.add_channels(50)
+    with self.assertNumQueries(0):
+      many_time = self.time_per_destination(many)
+
+    self.assertGreater(len(many), len(few))
+    self.assertLess(many_time, few_time * 2)
@@ -0,0 +1,121 @@
+import smtplib
+
+from django.core import mail
+from django.core.mail.backends.base import BaseEmailBackend
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from channels.email_backends import ConnectionPool
+from channels.email_backends import connection_pool
+from server.celery_tasks import close_email_connection_pool
+from server.celery_tasks import enable_email_connection_pool
+
+class FakeSMTP():
+  """ Records what reaches the server, fails at the stage named in fail_at """
+  instances = []
+  delivered = []
+  fail_at = set()
+
+  def __init__(self):
+    self.dropped = False
+    self.noops = 0
+    self.closed = False
+    FakeSMTP.instances.append(self)
+
+  def _check(self, stage):
+    if self.dropped:
+      raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+    if stage in FakeSMTP.fail_at:
+      FakeSMTP.fail_at.discard(stage)
+      self.dropped = True
+      raise smtplib.SMTPServerDisconnected("Connection unexpectedly closed")
+
+  def noop(self):
+    self.noops += 1
+    self._check("noop")
+    return (250, b"OK")
+
+  def sendmail(self, from_email, recipients, message):
+    self._check("mail")
+    self.data(message)
+
+  def data(self, message):
+    FakeSMTP.delivered.append(message)
+    # The server accepted the message, then the reply was lost
+    self._check("data")
+
+class FakeSMTPBackend(BaseEmailBackend):
+  def open(self):
+    self.connection = FakeSMTP()
+
+  def close(self):
+    self.connection.closed = True
+
+  def send_messages(self, email_messages):
+    for message in email_messages:
+      self.connection.sendmail(message.from_email, message.recipients(), message.message().as_bytes())
+    return len(email_messages)
+
+@override_settings(EMAIL_DELIVERY_BACKEND="channels.default.tests.test_email_backends.FakeSMTPBackend", EMAIL_POOL_KEEPALIVE=30)
+class ConnectionPoolTestCase(TestCase):
+  def setUp(self):
+    FakeSMTP.instances = []
+    FakeSMTP.delivered = []
+    FakeSMTP.fail_at = set()
+    self.pool = ConnectionPool()
+    self.pool.enable()
+
+  def tearDown(self):
+    self.pool.disable()
+
+  def message(self, subject="subject"):
+    return mail.EmailMessage(subject, "body", "from@test.com", ["to@test.com"])
+
+  def test_connection_is_reused(self):
+    self.assertEqual(self.pool.send_messages([self.message(), self.message()]), 2)
+    self.assertEqual(self.pool.send_messages([self.message()]), 1)
+    self.assertEqual(len(FakeSMTP.instances), 1)
+    self.assertEqual(len(FakeSMTP.delivered), 3)
+
+  @override_settings(EMAIL_POOL_KEEPALIVE=0)
+  def test_idle_connection_is_checked_with_noop(self):
+    self.pool.send_messages([self.message()])
+    self.pool.send_messages([self.message()])
+    self.assertEqual(FakeSMTP.instances[0].noops, 1)
+    self.assertEqual(len(FakeSMTP.instances), 1)
+
+  @override_settings(EMAIL_POOL_KEEPALIVE=0)
+  def test_dropped_connection_is_reopened(self):
+    self.pool.send_messages([self.message()])
+    FakeSMTP.instances[0].dropped = True
+    self.assertEqual(self.pool.send_messages([self.message()]), 1)
+    self.assertEqual(len(FakeSMTP.instances), 2)
+    self.assertEqual(len(FakeSMTP.delivered), 2)
+
+  def test_failure_before_data_is_retried(self):
+    self.pool.send_messages([self.message()])
+    FakeSMTP.fail_at = {"mail"}
+    self.assertEqual(self.pool.send_messages([self.message()]), 1)
+    self.assertEqual(len(FakeSMTP.instances), 2)
+    self.assertEqual(len(FakeSMTP.delivered), 2)
+
+  def test_failure_after_data_is_not_sent_twice(self):
+    FakeSMTP.fail_at = {"data"}
+    with self.assertRaises(smtplib.SMTPServerDisconnected):
+      self.pool.send_messages([self.message("first"), self.message("second")])
+    self.assertEqual(len(FakeSMTP.delivered), 1)
+
+    # The next send uses a new connection
+    self.assertEqual(self.pool.send_messages([self.message("second")]), 1)
+    self.assertEqual(len(FakeSMTP.instances), 2)
+    self.assertEqual(len(FakeSMTP.delivered), 2)
+
+  def test_worker_process_hooks(self):
+    enable_email_connection_pool()
+    try:
+      self.assertTrue(connection_pool.enabled)
+      connection_pool.send_messages([self.message()])
+      close_email_connection_pool()
+      self.assertTrue(FakeSMTP.instances[0].closed)
+    finally:
+      connection_pool.disable()
@@ -0,0 +1,79 @@
+from django.template import Engine
+from django.template import engines
+from django.test import TestCase
+
+from channels.email_templates import EmailTemplateCompiler
+from channels.email_templates import NotCompilable
+from channels.email_templates import check_text_only
+
+
+class EmailTemplateCompilation(TestCase):
+  def setUp(self):
+    self.compiler = EmailTemplateCompiler(engines["django"].engine.template_loaders)
+
+  def test_only_channel_email_bodies_are_compilable(self):
+    self.assertTrue(self.compiler.is_compilable("default/email/atados-projectReminder-toVolunteer-body.html"))
+    self.assertFalse(self.compiler.is_compilable("default/email/base-body.html"))
+    self.assertFalse(self.compiler.is_compilable("default/email/atados-projectReminder-toVolunteer-body.txt"))
+    self.assertFalse(self.compiler.is_compilable("admin/base.html"))
+
+  def test_compiled_template_is_flattened_and_inlined(self):
+    """Assert compiled templates keep template tags and have no inheritance or runtime inlining left"""
+    source = self.compiler.get("default/email/atados-projectReminder-toVolunteer-body.html")
+
+    self.assertNotIn("extends", source)
+    self.assertNotIn("inlinecss \"", source)
+    self.assertNotIn("endinlinecss", source)
+    self.assertIn("{{ apply.project.name }}", source)
+    self.assertIn("style=\"", source)
+
+  def test_compiled_template_is_cached(self):
+    first = self.compiler.get("default/email/atados-projectReminder-toVolunteer-body.html")
+    second = self.compiler.get("default/email/atados-projectReminder-toVolunteer-body.html")
+    self.assertIs(first, second)
+
+  def test_compiled_template_follows_the_base_of_the_sending_channel(self):
+    """Assert default bodies sent by gdd, which set extend.html to the gdd base, render the gdd base"""
+    source = self.compiler.get("default/email/atados-projectReminder-toVolunteer-body.html")
+    template = engines["django"].from_string(source)
+
+    gdd = template.render({"extend": {"html": "gdd/email/base-body.html"}})
+    default = template.render({"extend": {"html": "default/email/base-body.html"}})
+    self.assertIn("good-deeds-day.org/static/logo.png", gdd)
+    self.assertNotIn("good-deeds-day.org/static/logo.png", default)
+
+
+class EmailTemplateFlattening(TestCase):
+  def setUp(self):
+    engine = Engine(loaders=[("django.template.loaders.locmem.Loader", {
+      "base.html": "<body>{% block content %}<div>{% block title %}Title{% endblock %}</div>{% endblock %}{% block footer %}Footer{% endblock %}</body>",
+      "nested.html": "{% extends \"base.html\" %}{% load i18n %}{% block title %}{% trans \"Hello\" %}{% endblock %}",
+      "outer.html": "{% extends \"base.html\" %}{% block content %}<p>{% block title %}Outer{% endblock %}</p>{% endblock %}",
+      "inner.html": "{% extends \"outer.html\" %}{% block title %}Inner{% endblock %}{% block footer %}{% endblock %}",
+      "super.html": "{% extends \"base.html\" %}{% block title %}{{ block.super }}!{% endblock %}",
+    })])
+    self.compiler = EmailTemplateCompiler(engine.template_loaders)
+
+  def test_nested_block_is_overridden_inside_its_parent(self):
+    self.assertEqual(self.compiler._flatten("nested.html", None, []), "{% load i18n %}<body><div>{% trans \"Hello\" %}</div>Footer</body>")
+
+  def test_nested_blocks_are_overridden_across_levels(self):
+    self.assertEqual(self.compiler._flatten("inner.html", None, []), "<body><p>Inner</p></body>")
+
+  def test_block_super_is_not_compiled(self):
+    with self.assertRaises(NotCompilable):
+      self.compiler._flatten("super.html", None, [])
+
+
+class EmailTemplateMarkup(TestCase):
+  def test_text_is_compilable(self):
+    check_text_only("{% load i18n %}<p>{% blocktrans %}Hi {{ name }}{% endblocktrans %} {{ date|date:\"d/m\" }}</p>")
+
+  def test_markup_from_context_is_not_compilable(self):
+    for html in ["<p>{{ content|safe }}</p>", "{% autoescape off %}{{ content }}{% endautoescape %}", "{% include \"part.html\" %}"]:
+      with self.assertRaises(NotCompilable):
+        check_text_only(html)
+
+  def test_markup_from_translations_is_not_compilable(self):
+    with self.assertRaises(NotCompilable):
+      check_text_only("{% blocktrans %}The vacancy <b>{{ name }}</b> was received{% endblocktrans %}")
@@ -0,0 +1,136 @@
+from django.test import TestCase
+from elasticsearch.exceptions import NotFoundError
+from haystack.query import SearchQuerySet
+
+from ovp.apps.channels.models import Channel
+from ovp.apps.core.models import GoogleAddress
+from ovp.apps.organizations.models import Organization
+from ovp.apps.users.models import User
+from channels.search.geo import bounding_box
+from channels.search.geo import filter_nearby
+from channels.search import geo
+from channels.search.geo import has_location
+from channels.search.geo import haversine
+from channels.search.geo import search_nearby
+from rest_framework.reverse import reverse
+from rest_framework.test import APIClient
+
+SAO_PAULO = (-23.5505, -46.6333)
+GUARULHOS = (-23.4538, -46.5333)
+RIO = (-22.9068, -43.1729)
+
+class GeoHelpersTestCase(TestCase):
+  def test_haversine(self):
+    self.assertAlmostEqual(haversine(*SAO_PAULO, *RIO), 361, delta=2)
+    self.assertEqual(haversine(*RIO, *RIO), 0)
+
+  def test_bounding_box_contains_radius(self):
+    min_lat, max_lat, min_lng, max_lng = bounding_box(*SAO_PAULO, 20)
+    self.assertTrue(min_lat < GUARULHOS[0] < max_lat and min_lng < GUARULHOS[1] < max_lng)
+    self.assertFalse(min_lng < RIO[1] < max_lng)
+
+  def test_bounding_box_across_antimeridian(self):
+    self.assertEqual(bounding_box(0, 179.9, 50)[2:], (-180.0, 180.0))
+
+class FakeIndices():
+  def __init__(self, mappings):
+    self.mappings = mappings
+    self.calls = 0
+
+  def get_mapping(self, index):
+    self.calls += 1
+    if self.mappings is None:
+      raise NotFoundError(404, "index_not_found_exception")
+    return self.mappings
+
+class FakeConnection():
+  def __init__(self, mappings, hits=()):
+    self.indices = FakeIndices(mappings)
+    self.hits = list(hits)
+    self.bodies = []
+
+  def search(self, index, body):
+    self.bodies.append(body)
+    page = self.hits[body["from"]:body["from"] + body["size"]]
+    return {"hits": {"hits": [{"_source": {"django_id": str(pk)}, "sort": [distance]} for pk, distance in page]}}
+
+class FakeBackend():
+  index_name = "atadosovp"
+
+  def __init__(self, mappings, hits=()):
+    self.conn = FakeConnection(mappings, hits)
+
+class HasLocationTestCase(TestCase):
+  def test_index_with_location(self):
+    backend = FakeBackend({"atadosovp_1": {"mappings": {"properties": {"location": {"type": "geo_point"}}}}})
+    self.assertTrue(has_location(backend))
+    self.assertTrue(has_location(backend))
+    self.assertEqual(backend.conn.indices.calls, 1)
+
+  def test_index_built_before_location(self):
+    backend = FakeBackend({"atadosovp_1": {"mappings": {"properties": {"text": {"type": "text"}}}}})
+    self.assertFalse(has_location(backend))
+    self.assertFalse(has_location(backend))
+    self.assertEqual(backend.conn.indices.calls, 1)
+
+    found, checked = backend._location_checked
+    backend._location_checked = (found, checked - geo.LOCATION_CHECK_TTL)
+    self.assertFalse(has_location(backend))
+    self.assertEqual(backend.conn.indices.calls, 2)
+
+  def test_missing_index(self):
+    self.assertFalse(has_location(FakeBackend(None)))
+
+class FilterNearbyTestCase(TestCase):
+  def setUp(self):
+    channel = Channel.objects.get(slug="default")
+    self.addresses = GoogleAddress.objects.bulk_create([
+      GoogleAddress(typed_address=name, lat=lat, lng=lng, channel=channel)
+      for name, (lat, lng) in [("rio", RIO), ("guarulhos", GUARULHOS), ("sp", SAO_PAULO)]
+    ])
+
+  def test_filter_nearby_sorts_by_distance(self):
+    addresses = list(filter_nearby(GoogleAddress.objects.all(), *SAO_PAULO, 50, address_field=None))
+    self.assertEqual([address.typed_address for address in addresses], ["sp", "guarulhos"])
+    self.assertAlmostEqual(addresses[1].distance, haversine(*SAO_PAULO, *GUARULHOS), places=3)
+
+  def test_nearby_organizations(self):
+    user = User.objects.create_user(name="a", email="testmail-geo@test.com", password="test_returned", object_channel="default")
+    for address in self.addresses:
+      Organization.objects.create(name=address.typed_address, owner=user, address=address, published=True, object_channel="default")
+
+    client = APIClient()
+    response = client.get(reverse("search-nearby-organizations"), {"lat": RIO[0], "lng": RIO[1], "radius": 500})
+    self.assertEqual(response.status_code, 200)
+    self.assertEqual([organization["name"] for organization in response.data], ["rio", "guarulhos", "sp"])
+
+    response = client.get(reverse("search-nearby-organizations"), {"lat": RIO[0]})
+    self.assertEqual(response.status_code, 400)
+
+class SearchNearbyTestCase(TestCase):
+  def setUp(self):
+    user = User.objects.create_user(name="a", email="testmail-geo@test.com", password="test_returned", object_channel="default")
+    self.organizations = [
+      Organization.objects.create(name=str(i), owner=user, published=True, object_channel="default")
+      for i in range(3)
+    ]
+    self.searchqueryset = SearchQuerySet().models(Organization).filter(published=True, deleted=False)
+
+  def test_filters_in_elasticsearch(self):
+    backend = FakeBackend({}, [(organization.pk, i) for i, organization in enumerate(self.organizations)])
+    organizations = search_nearby(backend, self.searchqueryset, Organization.objects.all(), *SAO_PAULO, 10, 2)
+
+    self.assertEqual(organizations, self.organizations[:2])
+    self.assertEqual(organizations[1].distance, 1)
+    filters = backend.conn.bodies[0]["query"]["bool"]["filter"]
+    self.assertIn({"query_string": {"query": self.searchqueryset.query.build_query()}}, filters)
+
+  def test_pages_are_capped(self):
+    # Hits missing from the queryset, such as stale ones, are skipped
+    stale = [(pk, 0) for pk in range(10 ** 6, 10 ** 6 + 50)]
+    backend = FakeBackend({}, stale + [(self.organizations[0].pk, 1)])
+    organizations = search_nearby(backend, self.searchqueryset, Organization.objects.all(), *SAO_PAULO, 10, 5)
+
+    self.assertEqual(organizations, [])
+    self.assertEqual(len(backend.conn.bodies), geo.MAX_PAGES)
+    self.assertTrue(all(body["from"] + body["size"] <= geo.MAX_RESULT_WINDOW for body in backend.conn.bodies))
@@ -0,0 +1,115 @@
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+from unittest import skipUnless
+
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from channels.metrics import MetricsRegistry
+from channels.metrics import estimate_quantile
+from channels.metrics import get_start_token
+from channels.metrics import registry
+from channels.metrics import render_prometheus
+from channels.metrics import summarize
+from rest_framework.test import APIClient
+
+class MetricsTestCase(TestCase):
+  def setUp(self):
+    self.metrics_dir = tempfile.mkdtemp()
+    self.settings_override = override_settings(METRICS_DIR=self.metrics_dir, METRICS_TOKEN="secret")
+    self.settings_override.enable()
+    registry.reset()
+
+  def tearDown(self):
+    self.settings_override.disable()
+    shutil.rmtree(self.metrics_dir)
+
+  def test_requests_are_recorded(self):
+    client = APIClient()
+    client.get("/metrics/", HTTP_AUTHORIZATION="Bearer secret")
+    response = client.get("/metrics/", HTTP_AUTHORIZATION="Bearer secret")
+    self.assertEqual(response.status_code, 200)
+    self.assertIn('http_request_duration_seconds_count{channel="default",view="metrics",method="GET",status="200"} 1', response.content.decode())
+
+  def test_token_is_required(self):
+    response = APIClient().get("/metrics/")
+    self.assertEqual(response.status_code, 403)
+
+  def test_processes_are_merged(self):
+    other = MetricsRegistry()
+    other.observe("default", "view", "GET", 200, 0.2, 3, 0.01)
+    other.flush()
+    # Written as if by another running process
+    shutil.move(other.get_path(), other.get_path(pid=os.getppid()))
+
+    registry.observe("default", "view", "GET", 200, 0.4, 5, 0.02)
+    row = summarize(registry.collect())[0]
+    self.assertEqual(row["count"], 2)
+    self.assertEqual(row["queries"], 4)
+    self.assertAlmostEqual(row["mean_ms"], 300)
+
+  def write_other(self, path):
+    other = MetricsRegistry()
+    other.observe("default", "view", "GET", 200, 0.2, 3, 0.01)
+    other.flush()
+    shutil.move(other.get_path(), path)
+
+  def test_exited_processes_are_kept_in_totals(self):
+    process = subprocess.Popen([sys.executable, "-c", ""])
+    process.wait()
+    path = os.path.join(self.metrics_dir, "metrics-{}-0.json".format(process.pid))
+    self.write_other(path)
+
+    self.assertEqual(summarize(registry.collect())[0]["count"], 1)
+    self.assertFalse(os.path.exists(path))
+    self.assertEqual(summarize(registry.collect())[0]["count"], 1)
+
+  @skipUnless(get_start_token(os.getpid()), "Process start times are not available")
+  def test_reused_pid_is_an_exited_process(self):
+    path = os.path.join(self.metrics_dir, "metrics-{}-1.json".format(os.getppid()))
+    self.write_other(path)
+
+    self.assertEqual(summarize(registry.collect())[0]["count"], 1)
+    self.assertFalse(os.path.exists(path))
+
+  def test_pending_metrics_are_flushed(self):
+    registry.observe("default", "view", "GET", 200, 0.2, 3, 0.01)
+    registry.flush_pending()
+    self.assertTrue(os.path.exists(registry.get_path()))
+
+    os.remove(registry.get_path())
+    registry.flush_pending()
+    self.assertFalse(os.path.exists(registry.get_path()))
+
+  def test_clear_resets_other_processes(self):
+    other = MetricsRegistry()
+    other.observe("default", "view", "GET", 200, 0.2, 3, 0.01)
+    registry.observe("default", "view", "GET", 200, 0.2, 3, 0.01)
+    registry.flush()
+
+    registry.clear()
+    # Flushes before another process sees the reset are left out
+    self.write_other(other.get_path(pid=os.getppid()))
+    os.utime(other.get_path(pid=os.getppid()), (0, 0))
+    self.assertEqual(registry.collect(), {})
+
+    other.flush()
+    self.assertEqual(other.snapshot(), {})
+    other.observe("default", "view", "GET", 200, 0.2, 3, 0.01)
+    other.flush()
+    shutil.move(other.get_path(), other.get_path(pid=os.getppid()))
+    self.assertEqual(summarize(registry.collect())[0]["count"], 1)
+
+  def test_prometheus_histograms_are_cumulative(self):
+    registry.observe("default", "view", "GET", 200, 0.02, 0, 0)
+    registry.observe("default", "view", "GET", 200, 20, 0, 0)
+    output = render_prometheus(registry.collect())
+    self.assertIn('http_request_duration_seconds_bucket{channel="default",view="view",method="GET",status="200",le="0.025"} 1', output)
+    self.assertIn('http_request_duration_seconds_bucket{channel="default",view="view",method="GET",status="200",le="+Inf"} 2', output)
+
+  def test_estimate_quantile(self):
+    self.assertEqual(estimate_quantile((1, 2), [0, 4, 0], 0.5), 1.5)
+    self.assertIsNone(estimate_quantile((1, 2), [0, 0, 0], 0.5))
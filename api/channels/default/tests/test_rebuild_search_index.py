@@ -0,0 +1,168 @@
+from fnmatch import fnmatch
+from io import StringIO
+
+from django.apps import apps
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+from django.test.utils import override_settings
+from haystack import connections
+from haystack.utils import get_identifier
+
+from ovp.apps.organizations.models import Organization
+from ovp.apps.users.models import User
+from ovp.apps.projects.models import Project
+
+from channels.default.management.commands.rebuild_search_index import Command
+from channels.default.tasks import flush_search_index_queue
+
+class FakeIndices():
+  """ The part of the Elasticsearch indices API used by rebuild_search_index """
+  def __init__(self, es):
+    self.es = es
+
+  def exists(self, index):
+    return index in self.es.documents
+
+  def exists_alias(self, name):
+    return any(name in aliases for aliases in self.es.aliases.values())
+
+  def get(self, index):
+    return {name: {} for name in self.es.documents if fnmatch(name, index)}
+
+  def get_alias(self, name):
+    return {index: {} for index, aliases in self.es.aliases.items() if name in aliases}
+
+  def update_aliases(self, body):
+    for action in body["actions"]:
+      for kind, params in action.items():
+        aliases = self.es.aliases.setdefault(params["index"], set())
+        if kind == "add":
+          aliases.add(params["alias"])
+        else:
+          aliases.discard(params["alias"])
+
+  def delete(self, index):
+    del self.es.documents[index]
+    self.es.aliases.pop(index, None)
+
+  def get_settings(self, index):
+    return {index: {"settings": {"index": {}}}}
+
+  def put_settings(self, index, body):
+    pass
+
+  def refresh(self, index):
+    pass
+
+class FakeElasticsearch():
+  def __init__(self):
+    self.documents = {}
+    self.aliases = {}
+    self.indices = FakeIndices(self)
+
+  def count(self, index):
+    return {"count": len(self.documents[index])}
+
+class FakeBackend():
+  def __init__(self, es, index_name):
+    self.es = es
+    self.index_name = index_name
+
+  def setup(self):
+    self.es.documents.setdefault(self.index_name, set())
+
+  def update(self, index, objects, commit=True):
+    self.es.documents[self.index_name].update(get_identifier(obj) for obj in objects)
+
+  def remove(self, obj_id, commit=True):
+    self.es.documents[self.index_name].discard(obj_id)
+
+class FakeCommand(Command):
+  """ rebuild_search_index indexing into a FakeElasticsearch, in process """
+  during_build = None
+
+  def __init__(self, es, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.es = es
+
+  def get_connection(self, using):
+    return self.es, "atadosovp"
+
+  def get_backend(self, using, index_name):
+    return FakeBackend(self.es, index_name)
+
+  def index_chunks(self, tasks, workers):
+    for using, index_name, label, pks in tasks:
+      model_class = apps.get_model(label)
+      index = connections[using].get_unified_index().get_index(model_class)
+      objects = list(index.index_queryset(using=using).filter(pk__in=pks))
+      self.get_backend(using, index_name).update(index, objects)
+      yield len(objects)
+
+    if self.during_build:
+      self.during_build()
+
+@override_settings(SEARCH_INDEX_SYNC=False)
+class RebuildSearchIndexTestCase(TestCase):
+  def setUp(self):
+    self.es = FakeElasticsearch()
+    self.user = User.objects.create_user(name="a", email="testmail-projects@test.com", password="test_returned", object_channel="default")
+    self.organization = Organization.objects.create(name="test org", owner=self.user, object_channel="default")
+    self.projects = [
+      Project.objects.create(name="test project", slug="test-slug", details="abc", description="abc", owner=self.user, organization=self.organization, published=True, object_channel="default")
+      for i in range(2)
+    ]
+
+  def rebuild(self, *args, during_build=None):
+    command = FakeCommand(self.es)
+    command.during_build = during_build
+    call_command(command, *args, stdout=StringIO())
+
+  def get_current(self):
+    return [index for index, aliases in self.es.aliases.items() if "atadosovp" in aliases]
+
+  def test_alias_points_to_the_new_index(self):
+    self.rebuild()
+    current = self.get_current()
+    self.assertEqual(len(current), 1)
+    self.assertTrue(current[0].startswith("atadosovp_"))
+    self.assertIn(get_identifier(self.projects[0]), self.es.documents[current[0]])
+
+  def test_keep(self):
+    for i in range(3):
+      self.rebuild("--keep", "1")
+    self.assertEqual(len(self.es.documents), 2)
+    self.assertEqual(self.get_current(), [sorted(self.es.documents)[-1]])
+
+    self.rebuild("--keep", "0")
+    self.assertEqual(list(self.es.documents), self.get_current())
+
+  def test_rollback(self):
+    self.rebuild()
+    self.rebuild()
+    first, second = sorted(self.es.documents)
+
+    self.rebuild("--rollback")
+    self.assertEqual(self.get_current(), [first])
+
+  def test_rollback_without_previous_index(self):
+    self.rebuild()
+    with self.assertRaises(CommandError):
+      self.rebuild("--rollback")
+
+  def test_changes_during_the_build_are_indexed(self):
+    def during_build():
+      deleted = get_identifier(self.projects[0])
+      self.projects[0].delete()
+      self.created = Project.objects.create(name="new project", slug="new-slug", details="abc", description="abc", owner=self.user, organization=self.organization, published=True, object_channel="default")
+
+      # Flushes would write to the old index
+      self.assertEqual(flush_search_index_queue(), 0)
+      self.deleted = deleted
+
+    self.rebuild(during_build=during_build)
+    documents = self.es.documents[self.get_current()[0]]
+    self.assertNotIn(self.deleted, documents)
+    self.assertIn(get_identifier(self.created), documents)
+    self.assertIn(get_identifier(self.projects[1]), documents)
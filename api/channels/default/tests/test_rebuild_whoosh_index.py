@@ -0,0 +1,111 @@
+import glob
+import os
+import shutil
+import tempfile
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+from django.test.utils import override_settings
+from haystack import connections
+from haystack.utils import get_identifier
+from whoosh import index as whoosh_index
+
+from ovp.apps.organizations.models import Organization
+from ovp.apps.users.models import User
+from ovp.apps.projects.models import Project
+
+from channels.default.management.commands.rebuild_whoosh_index import Command
+from channels.default.models import SearchIndexQueue
+from channels.default.tasks import flush_search_index_queue
+from channels.search.backends import CachedWhooshEngine
+
+class FakeCommand(Command):
+  """ rebuild_whoosh_index building into a temporary directory """
+  during_build = None
+
+  def __init__(self, path, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.path = path
+
+  def get_engine(self, using):
+    engine = CachedWhooshEngine(using=using)
+    engine.options = dict(engine.options, PATH=self.path)
+    engine._index = connections[using].get_unified_index()
+    return engine
+
+  def catch_up(self, builder, unified_index):
+    if self.during_build:
+      self.during_build()
+    super().catch_up(builder, unified_index)
+
+@override_settings(SEARCH_INDEX_SYNC=False)
+class RebuildWhooshIndexTestCase(TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.path = os.path.join(self.directory, "index")
+    self.user = User.objects.create_user(name="a", email="testmail-projects@test.com", password="test_returned", object_channel="default")
+    self.organization = Organization.objects.create(name="test org", owner=self.user, object_channel="default")
+    self.projects = [
+      Project.objects.create(name="test project", slug="test-slug", details="abc", description="abc", owner=self.user, organization=self.organization, published=True, object_channel="default")
+      for i in range(2)
+    ]
+
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+
+  def rebuild(self, during_build=None):
+    command = FakeCommand(self.path)
+    command.during_build = during_build
+    call_command(command, "--procs", "1", stdout=StringIO())
+
+  def get_documents(self):
+    with whoosh_index.open_dir(self.path).searcher() as searcher:
+      return set(fields["id"] for fields in searcher.all_stored_fields())
+
+  def test_path_points_to_the_latest_build(self):
+    self.rebuild()
+    first = os.path.realpath(self.path)
+    self.rebuild()
+
+    self.assertTrue(os.path.islink(self.path))
+    self.assertNotEqual(os.path.realpath(self.path), first)
+    self.assertEqual(glob.glob("{}.*".format(self.path)), [os.path.realpath(self.path)])
+    self.assertIn(get_identifier(self.projects[0]), self.get_documents())
+
+  def test_unversioned_index_is_replaced(self):
+    os.makedirs(self.path)
+    self.rebuild()
+
+    self.assertTrue(os.path.islink(self.path))
+    self.assertEqual(glob.glob("{}.*".format(self.path)), [os.path.realpath(self.path)])
+
+  def test_changes_during_the_build_are_indexed(self):
+    def during_build():
+      self.deleted = get_identifier(self.projects[0])
+      self.projects[0].delete()
+      self.created = Project.objects.create(name="new project", slug="new-slug", details="abc", description="abc", owner=self.user, organization=self.organization, published=True, object_channel="default")
+
+      # Flushes would write to the old index
+      self.assertEqual(flush_search_index_queue(), 0)
+
+    self.rebuild(during_build=during_build)
+    documents = self.get_documents()
+    self.assertNotIn(self.deleted, documents)
+    self.assertIn(get_identifier(self.created), documents)
+    self.assertIn(get_identifier(self.projects[1]), documents)
+
+    # Left queued for the next flush
+    self.assertTrue(SearchIndexQueue.objects.filter(model="projects.project", object_id=self.created.pk).exists())
+
+  def test_failed_build_keeps_the_current_index(self):
+    self.rebuild()
+    current = os.path.realpath(self.path)
+
+    def during_build():
+      raise RuntimeError
+    with self.assertRaises(RuntimeError):
+      self.rebuild(during_build=during_build)
+
+    self.assertEqual(os.path.realpath(self.path), current)
+    self.assertEqual(glob.glob("{}.*".format(self.path)), [current])
@@ -0,0 +1,41 @@
+from django.test import TestCase
+
+from channels.default.management.commands.benchmark_search_analyzers import Corpus
+from channels.default.management.commands.benchmark_search_analyzers import get_project_index
+from channels.default.management.commands.benchmark_search_analyzers import get_whoosh_analyzers
+from channels.search.analyzers import PROFILES
+from channels.search.analyzers import get_index_settings
+
+class SearchAnalyzersTestCase(TestCase):
+  def test_profiles_keep_haystack_analyzer_names(self):
+    for profile in PROFILES:
+      analyzers = get_index_settings(profile)["settings"]["analysis"]["analyzer"]
+      self.assertEqual(set(analyzers), {"ngram_analyzer", "edgengram_analyzer", "snowball"})
+
+  def test_settings_are_copies(self):
+    get_index_settings("ngram")["settings"]["analysis"]["analyzer"]["snowball"]["filter"].append("shingle")
+    self.assertNotIn("shingle", get_index_settings("ngram")["settings"]["analysis"]["analyzer"]["snowball"]["filter"])
+
+  def test_unknown_profile(self):
+    with self.assertRaises(ValueError):
+      get_index_settings("klingon")
+
+class BenchmarkSearchAnalyzersTestCase(TestCase):
+  def tokens(self, profile, analyzer, text):
+    return [token.text for token in get_whoosh_analyzers(profile)[analyzer](text)]
+
+  def test_whoosh_analyzers_follow_the_profiles(self):
+    self.assertEqual(self.tokens("ngram", "snowball", "Ação Social"), ["acao", "social"])
+    self.assertEqual(self.tokens("edgengram", "ngram_analyzer", "Água"), ["ag", "agu", "agua"])
+    stemmed = self.tokens("portuguese", "snowball", "as crianças")
+    self.assertEqual(len(stemmed), 1)
+    self.assertTrue("criancas".startswith(stemmed[0]) and stemmed[0] != "criancas")
+    self.assertIn("ajudar criancas", self.tokens("shingle", "snowball", "ajudar crianças"))
+    self.assertIn("ajudar", self.tokens("shingle", "snowball", "ajudar crianças"))
+
+  def test_corpus_has_the_project_index_fields(self):
+    fields = get_project_index().fields
+    corpus = Corpus(fields, 2, 3, 42)
+    for field in fields.values():
+      self.assertIn(field.index_fieldname, corpus.documents[0])
+    self.assertIn("text", corpus.get_text_fields())
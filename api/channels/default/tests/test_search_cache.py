@@ -0,0 +1,43 @@
+from django.conf import settings
+from django.core.cache import caches
+from django.test import TestCase
+from django.test.utils import override_settings
+from haystack import connections
+
+from ovp.apps.projects.models import Project
+
+from channels.search.backends import get_search_cache_stats
+from channels.search.backends import reset_search_cache_stats
+
+@override_settings(SEARCH_CACHE_TTL=30)
+class SearchCacheTestCase(TestCase):
+  def setUp(self):
+    self.backend = connections["default"].get_backend()
+    caches[settings.SEARCH_CACHE_ALIAS].clear()
+    reset_search_cache_stats()
+
+  def test_results_are_cached(self):
+    results = self.backend.search("volunteer", start_offset=0, end_offset=20)
+    self.assertEqual(self.backend.search("volunteer  ", start_offset=0, end_offset=20), results)
+    self.assertEqual(get_search_cache_stats()["-"], {"hits": 1, "misses": 1, "ratio": 0.5})
+
+  def test_pages_are_cached_separately(self):
+    self.backend.search("volunteer", start_offset=0, end_offset=20)
+    self.backend.search("volunteer", start_offset=20, end_offset=40)
+    self.assertEqual(get_search_cache_stats()["-"]["misses"], 2)
+
+  def test_index_writes_invalidate_results(self):
+    self.backend.search("volunteer")
+    self.backend.remove("projects.project.0")
+    self.backend.search("volunteer")
+    self.assertEqual(get_search_cache_stats()["-"]["misses"], 2)
+
+  def test_writes_only_invalidate_searches_in_their_model(self):
+    self.backend.search("volunteer", models=[Project])
+    self.backend.remove("organizations.organization.0")
+    self.backend.search("volunteer", models=[Project])
+    self.assertEqual(get_search_cache_stats()["-"], {"hits": 1, "misses": 1, "ratio": 0.5})
+
+  def test_generations_are_kept_in_the_shared_cache(self):
+    self.backend.remove("projects.project.0")
+    self.assertEqual(caches[settings.SEARCH_CACHE_ALIAS].get(self.backend.get_generation_key("projects.project")), 1)
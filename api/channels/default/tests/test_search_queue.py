@@ -0,0 +1,44 @@
+from django.conf import settings
+from django.test import TestCase
+from django.test.utils import override_settings
+
+from ovp.apps.organizations.models import Organization
+from ovp.apps.users.models import User
+from ovp.apps.projects.models import Project
+
+from channels.default.models import SearchIndexQueue
+from channels.default.tasks import flush_search_index_queue
+from server.celery_tasks import app
+
+@override_settings(SEARCH_INDEX_SYNC=False)
+class SearchIndexQueueTestCase(TestCase):
+  def setUp(self):
+    self.user = User.objects.create_user(name="a", email="testmail-projects@test.com", password="test_returned", object_channel="default")
+    self.organization = Organization.objects.create(name="test org", owner=self.user, object_channel="default")
+    self.project = Project.objects.create(name="test project", slug="test-slug", details="abc", description="abc", owner=self.user, organization=self.organization, published=True, object_channel="default")
+
+  def test_saves_are_coalesced(self):
+    self.project.name = "changed"
+    self.project.save()
+    self.project.save()
+
+    self.assertEqual(SearchIndexQueue.objects.filter(model="projects.project", object_id=self.project.pk).count(), 1)
+    self.assertEqual(SearchIndexQueue.objects.get(model="projects.project", object_id=self.project.pk).action, SearchIndexQueue.UPDATE)
+
+  def test_delete_replaces_update(self):
+    pk = self.project.pk
+    self.project.delete()
+    self.assertEqual(SearchIndexQueue.objects.get(model="projects.project", object_id=pk).action, SearchIndexQueue.DELETE)
+
+  def test_flush_empties_queue(self):
+    queued = SearchIndexQueue.objects.count()
+    self.assertTrue(queued > 0)
+    self.assertEqual(flush_search_index_queue(batch_size=1), queued)
+    self.assertEqual(SearchIndexQueue.objects.count(), 0)
+
+  def test_beat_flushes_queue(self):
+    entry = next(entry for entry in settings.CELERY_BEAT_SCHEDULE.values() if entry["task"] == flush_search_index_queue.name)
+    self.assertEqual(entry["schedule"], settings.SEARCH_INDEX_QUEUE_INTERVAL)
+
+    app.tasks[entry["task"]].apply()
+    self.assertEqual(SearchIndexQueue.objects.count(), 0)
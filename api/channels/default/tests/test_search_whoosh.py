@@ -0,0 +1,37 @@
+import shutil
+import tempfile
+
+from django.test import TestCase
+
+from channels.search.backends import PersistentWhooshSearchBackend
+
+class CountingBackend(PersistentWhooshSearchBackend):
+  def __init__(self, *args, **kwargs):
+    super().__init__(*args, **kwargs)
+    self.writes = []
+
+  def write(self, index, documents):
+    self.writes.append(len(documents))
+    super().write(index, documents)
+
+class FakeIndex():
+  def full_prepare(self, pk):
+    return {"id": "projects.project.{}".format(pk), "django_ct": "projects.project", "django_id": str(pk)}
+
+class PersistentWhooshTestCase(TestCase):
+  def setUp(self):
+    self.path = tempfile.mkdtemp()
+    self.backend = CountingBackend("default", PATH=self.path, COMMIT_BATCH_SIZE=2)
+
+  def tearDown(self):
+    shutil.rmtree(self.path)
+
+  def test_updates_are_committed_in_batches(self):
+    self.backend.update(FakeIndex(), range(5))
+    self.assertEqual(self.backend.writes, [2, 2, 1])
+    self.assertEqual(self.backend.index.refresh().doc_count(), 5)
+
+  def test_updates_replace_documents(self):
+    self.backend.update(FakeIndex(), range(3))
+    self.backend.update(FakeIndex(), range(3))
+    self.assertEqual(self.backend.index.refresh().doc_count(), 3)
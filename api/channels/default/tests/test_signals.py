@@ -1,4 +1,8 @@
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.test.utils import override_settings
 from django.utils import timezone
 
 from ovp.apps.organizations.models import Organization
@@ -6,7 +10,13 @@ from ovp.apps.users.models import User
 from ovp.apps.projects.models import Project
 from ovp.apps.projects.models import Apply
 from ovp.apps.projects.models import Job
+from ovp.apps.ratings.models import RatingAnswer
 from ovp.apps.ratings.models import RatingRequest
+from channels.default.models import RatingAggregate
+from channels.default.models import rebuild_rating_aggregates
+from channels.default.signals import get_database_score
+from channels.tracking import get_original_value
+from channels.tracking import has_changed
 from rest_framework.reverse import reverse
 from rest_framework.test import APIClient
 
@@ -92,4 +102,142 @@ class RatingRequestSignals(TestCase):
     self.assertEqual(response.status_code, 200)
 
     user = User.objects.get(pk=self.user.pk)
-    self.assertEqual(user.rating, 0.5)
\ No newline at end of file
+    self.assertEqual(user.rating, 0.5)
+
+    aggregate = RatingAggregate.objects.get(rated_object_type=RatingAggregate.USER, rated_object_id=self.user.pk, parameter_slug="volunteer-score")
+    self.assertEqual((aggregate.total, aggregate.count), (1, 2))
+
+    RatingAggregate.objects.all().delete()
+    call_command("rebuild_rating_aggregates")
+    aggregate = RatingAggregate.objects.get(rated_object_type=RatingAggregate.USER, rated_object_id=self.user.pk, parameter_slug="volunteer-score")
+    self.assertEqual((aggregate.total, aggregate.count), (1, 2))
+
+class RatingRequestBulkCreationBenchmark(TestCase):
+  def setUp(self):
+    self.user = User.objects.create_user(name="a", email="testmail-projects@test.com", password="test_returned", object_channel="default")
+    self.organization = Organization.objects.create(name="test org", owner=self.user, object_channel="default")
+
+  def _close_project_with_applies(self, applies):
+    project = Project.objects.create(name="test project", slug="test-slug", details="abc", description="abc", owner=self.user, organization=self.organization, published=False, object_channel="default")
+    Job.objects.create(project=project, start_date=timezone.now(), end_date=timezone.now(), object_channel="default")
+    for i in range(applies):
+      volunteer = User.objects.create_user(name="v", email="volunteer-{}-{}@test.com".format(applies, i), password="test_returned", object_channel="default")
+      Apply.objects.create(user=volunteer, project=project, object_channel="default")
+
+    project = Project.objects.get(pk=project.pk)
+    project.closed = True
+    count = RatingRequest.objects.count()
+    with CaptureQueriesContext(connection) as queries:
+      project.save()
+
+    self.assertEqual(RatingRequest.objects.count() - count, applies * 2)
+    return len(queries)
+
+  def test_query_count_is_constant_in_number_of_applies(self):
+    """Assert closing a project issues the same number of queries regardless of how many applies it has"""
+    few = self._close_project_with_applies(2)
+    many = self._close_project_with_applies(40)
+    self.assertEqual(few, many)
+
+  def test_rating_parameters_are_attached(self):
+    self._close_project_with_applies(3)
+    for request in RatingRequest.objects.filter(rated_object_user__isnull=False):
+      self.assertEqual(set(request.rating_parameters.values_list("slug", flat=True)), {"volunteer-score", "user-has-shown"})
+    for request in RatingRequest.objects.filter(rated_object_project__isnull=False):
+      self.assertEqual(set(request.rating_parameters.values_list("slug", flat=True)), {"project-how-was-it", "project-score"})
+
+class ScoreModes(TestCase):
+  def setUp(self):
+    self.user = User.objects.create_user(name="a", email="testmail-projects@test.com", password="test_returned", object_channel="default")
+    self.organization = Organization.objects.create(name="test org", owner=self.user, object_channel="default")
+    self.client = APIClient()
+    self.client.force_authenticate(user=self.user)
+
+  def _rate_volunteer(self, values):
+    project = Project.objects.create(name="test project", slug="test-slug", details="abc", description="abc", owner=self.user, organization=self.organization, published=False, object_channel="default")
+    Job.objects.create(project=project, start_date=timezone.now(), end_date=timezone.now(), object_channel="default")
+    for _ in values:
+      Apply.objects.create(user=self.user, project=project, object_channel="default")
+    project.closed = True
+    project.save()
+
+    requests = RatingRequest.objects.filter(rated_object_user=self.user).order_by("-pk")[:len(values)]
+    for request, value in zip(requests, values):
+      data = {"answers": [{"parameter_slug": "volunteer-score", "value_quantitative": value}]}
+      response = self.client.post(reverse("rating-request-rate", [str(request.uuid)]), data, format="json")
+      self.assertEqual(response.status_code, 200)
+
+    return User.objects.get(pk=self.user.pk).rating
+
+  def test_database_mode_matches_incremental_mode(self):
+    """Assert both score modes compute the same volunteer score"""
+    with override_settings(RATINGS_SCORE_MODE="incremental"):
+      incremental = self._rate_volunteer([1, 0, 1])
+    database = get_database_score(RatingAggregate.USER, self.user, "volunteer-score")
+    self.assertAlmostEqual(incremental, 2/3)
+    self.assertAlmostEqual(database, incremental)
+
+  def test_rebuilt_aggregates_include_previous_answers(self):
+    """Assert scores after a rebuild count answers given before it"""
+    with override_settings(RATINGS_SCORE_MODE="database"):
+      self._rate_volunteer([1, 0])
+    self.assertEqual(RatingAggregate.objects.count(), 0)
+
+    rebuild_rating_aggregates(RatingAnswer, RatingAggregate)
+    with override_settings(RATINGS_SCORE_MODE="incremental"):
+      self.assertEqual(self._rate_volunteer([1]), 2/3)
+
+  def test_edited_and_deleted_answers_update_scores(self):
+    """Assert editing or deleting an answer takes its previous value out of the aggregate"""
+    self._rate_volunteer([1, 0])
+    answer = RatingAnswer.objects.get(parameter__slug="volunteer-score", value_quantitative=0)
+    answer.value_quantitative = 1
+    answer.save()
+
+    aggregate = RatingAggregate.objects.get(rated_object_type=RatingAggregate.USER, rated_object_id=self.user.pk, parameter_slug="volunteer-score")
+    self.assertEqual((aggregate.total, aggregate.count), (2, 2))
+    self.assertEqual(User.objects.get(pk=self.user.pk).rating, 1)
+
+    answer.delete()
+    aggregate.refresh_from_db()
+    self.assertEqual((aggregate.total, aggregate.count), (1, 1))
+
+  def test_database_score_query_count_is_fixed(self):
+    """Assert database score costs one query regardless of how many ratings a user has"""
+    self._rate_volunteer([1, 0])
+    with self.assertNumQueries(1):
+      self.assertEqual(get_database_score(RatingAggregate.USER, self.user, "volunteer-score"), 0.5)
+
+    self._rate_volunteer([1, 1, 1, 1, 0, 0])
+    with self.assertNumQueries(1):
+      self.assertEqual(get_database_score(RatingAggregate.USER, self.user, "volunteer-score"), 0.5)
+
+class ProjectFieldTracking(TestCase):
+  def setUp(self):
+    self.user = User.objects.create_user(name="a", email="testmail-projects@test.com", password="test_returned", object_channel="default")
+    self.organization = Organization.objects.create(name="test org", owner=self.user, object_channel="default")
+    self.project = Project.objects.create(name="test project", slug="test-slug", details="abc", description="abc", owner=self.user, organization=self.organization, published=False, object_channel="default")
+
+  def test_original_values_are_read_without_queries(self):
+    project = Project.objects.get(pk=self.project.pk)
+    project.published = True
+
+    with self.assertNumQueries(0):
+      self.assertEqual(get_original_value(project, "published"), False)
+      self.assertTrue(has_changed(project, "published"))
+      self.assertFalse(has_changed(project, "closed"))
+
+  def test_original_values_are_refreshed_on_save(self):
+    project = Project.objects.get(pk=self.project.pk)
+    project.published = True
+    project.save()
+
+    with self.assertNumQueries(0):
+      self.assertEqual(get_original_value(project, "published"), True)
+      self.assertFalse(has_changed(project, "published"))
+
+  def test_deferred_fields_fall_back_to_database(self):
+    project = Project.objects.only("pk").get(pk=self.project.pk)
+
+    with self.assertNumQueries(1):
+      self.assertEqual(get_original_value(project, "published"), False)
@@ -1,5 +1,6 @@
 from datetime import timedelta
 
+from django.conf import settings
 from django.test import TestCase
 from django.test.utils import override_settings
 from django.utils import timezone
@@ -13,6 +14,8 @@ from ovp.apps.projects.models import Apply
 from ovp.apps.projects.models import Job
 from ovp.apps.projects.models import Work
 
+from channels.default import tasks
+from channels.default.models import ScheduledNotification
 from server.celery_tasks import app
 
 @override_settings(DEFAULT_SEND_EMAIL="sync",
@@ -27,43 +30,58 @@ class TestEmailTriggers(TestCase):
     self.project.save()
 
     app.control.purge()
+    self.dispatch()
+
+  def dispatch(self):
+    """Dispatch every scheduled notification as if their eta had passed"""
+    return tasks.dispatch_scheduled_notifications(now=timezone.now() + timedelta(days=365))
+
+  def get_message(self, subject):
+    for message in mail.outbox:
+      if message.subject == subject:
+        return message
+    self.fail("No email with subject \"{}\" was sent".format(subject))
 
   def test_applying_schedules_interaction_confirmation_email(self):
     """Assert cellery task to ask about interaction is created when user applies to project"""
     mail.outbox = []
     Apply.objects.create(user=self.user, project=self.project, object_channel="default")
+    self.dispatch()
 
     self.assertTrue(len(mail.outbox) == 2)
-    self.assertTrue(mail.outbox[0].subject == get_email_subject("default", "atados-askProjectInteractionConfirmation-toVolunteer", "Ask project confirmation"))
-    self.assertTrue("vaga test project" in mail.outbox[0].body)
+    message = self.get_message(get_email_subject("default", "atados-askProjectInteractionConfirmation-toVolunteer", "Ask project confirmation"))
+    self.assertTrue("vaga test project" in message.body)
 
   def test_applying_schedules_reminder_email(self):
     """Assert cellery task to remind volunteer is created when user applies to project"""
     mail.outbox = []
     Job.objects.create(project=self.project, start_date=timezone.now(), end_date=timezone.now(), object_channel="default")
     Apply.objects.create(user=self.user, project=self.project, object_channel="default")
+    self.dispatch()
 
     self.assertTrue(len(mail.outbox) == 4)
-    self.assertTrue(mail.outbox[1].subject == "Uma ação está chegando... estamos ansiosos para te ver.")
-    self.assertTrue("test project" in mail.outbox[1].body)
+    message = self.get_message("Uma ação está chegando... estamos ansiosos para te ver.")
+    self.assertTrue("test project" in message.body)
 
   def test_applying_schedules_ask_about_project_experience_to_volunteer(self):
     """Assert cellery task to ask volunteer about project experience is created when user applies to project"""
     mail.outbox = []
     work = Work.objects.create(project=self.project, object_channel="default")
     Apply.objects.create(user=self.user, project=self.project, object_channel="default")
+    self.dispatch()
 
     self.assertTrue(len(mail.outbox) == 3)
-    self.assertTrue(mail.outbox[1].subject == "Conta pra gente como foi sua experiência?")
-    self.assertTrue(">test project<" in mail.outbox[1].alternatives[0][0])
+    message = self.get_message("Conta pra gente como foi sua experiência?")
+    self.assertTrue(">test project<" in message.alternatives[0][0])
 
     mail.outbox = []
     work.delete()
     job = Job.objects.create(project=self.project, start_date=timezone.now(), end_date=timezone.now(), object_channel="default")
     Apply.objects.create(user=self.user, project=self.project, object_channel="default")
+    self.dispatch()
 
-    self.assertTrue(mail.outbox[2].subject == "Conta pra gente como foi sua experiência?")
-    self.assertTrue(">test project<" in mail.outbox[2].alternatives[0][0])
+    message = self.get_message("Conta pra gente como foi sua experiência?")
+    self.assertTrue(">test project<" in message.alternatives[0][0])
 
   def test_publishing_project_schedules_ask_about_experience_to_organization(self):
     """Assert cellery task to ask organization about project experience is created when user project is published"""
@@ -73,7 +91,77 @@ class TestEmailTriggers(TestCase):
     work = Work.objects.create(project=project, object_channel="default")
     project.published = True
     project.save()
+    self.dispatch()
 
     self.assertTrue(len(mail.outbox) == 3)
-    self.assertTrue(mail.outbox[2].subject == "Tá na hora de contar pra gente como foi")
-    self.assertTrue(">test project<" in mail.outbox[2].alternatives[0][0])
+    message = self.get_message("Tá na hora de contar pra gente como foi")
+    self.assertTrue(">test project<" in message.alternatives[0][0])
+
+  def test_notifications_are_not_sent_before_eta(self):
+    """Assert scheduled notifications stay in the database until they are due"""
+    mail.outbox = []
+    Apply.objects.create(user=self.user, project=self.project, object_channel="default")
+    count = len(mail.outbox)
+
+    self.assertEqual(tasks.dispatch_scheduled_notifications(), 0)
+    self.assertEqual(len(mail.outbox), count)
+    self.assertEqual(ScheduledNotification.objects.filter(dispatched_date__isnull=True).count(), 1)
+
+  def test_beat_dispatches_due_notifications(self):
+    """Assert the periodic task sends due notifications only, once"""
+    entry = next(entry for entry in settings.CELERY_BEAT_SCHEDULE.values() if entry["task"] == tasks.dispatch_scheduled_notifications.name)
+    task = app.tasks[entry["task"]]
+
+    mail.outbox = []
+    due = Apply.objects.create(user=self.user, project=self.project, object_channel="default")
+    later = Apply.objects.create(user=self.user, project=self.project, object_channel="default")
+    ScheduledNotification.objects.all().delete()
+    kind = ScheduledNotification.ASK_PROJECT_INTERACTION_CONFIRMATION_TO_VOLUNTEER
+    ScheduledNotification.objects.create(kind=kind, object_id=due.pk, eta=timezone.now() - timedelta(minutes=1))
+    ScheduledNotification.objects.create(kind=kind, object_id=later.pk, eta=timezone.now() + timedelta(days=1))
+
+    self.assertEqual(task.apply().get(), 1)
+    self.assertEqual(len(mail.outbox), 1)
+    self.assertEqual(mail.outbox[0].to, [self.user.email])
+    self.assertEqual(list(ScheduledNotification.objects.filter(dispatched_date__isnull=True).values_list("object_id", flat=True)), [later.pk])
+
+    self.assertEqual(task.apply().get(), 0)
+    self.assertEqual(len(mail.outbox), 1)
+
+  def test_notifications_are_deduplicated(self):
+    """Assert a notification is scheduled once per kind and object and dispatched once"""
+    apply = Apply.objects.create(user=self.user, project=self.project, object_channel="default")
+    eta = timezone.now() + timedelta(days=1)
+    ScheduledNotification.schedule(ScheduledNotification.ASK_PROJECT_INTERACTION_CONFIRMATION_TO_VOLUNTEER, apply.pk, eta)
+
+    notifications = ScheduledNotification.objects.filter(kind=ScheduledNotification.ASK_PROJECT_INTERACTION_CONFIRMATION_TO_VOLUNTEER, object_id=apply.pk)
+    self.assertEqual(notifications.count(), 1)
+    self.assertEqual(notifications.first().eta, eta)
+
+    self.assertEqual(self.dispatch(), 1)
+    self.assertEqual(self.dispatch(), 0)
+
+  def test_dispatched_notifications_are_pruned(self):
+    """Assert old dispatched notifications are deleted and pending ones kept"""
+    ScheduledNotification.objects.all().delete()
+    kind = ScheduledNotification.ASK_PROJECT_INTERACTION_CONFIRMATION_TO_VOLUNTEER
+    ScheduledNotification.objects.create(kind=kind, object_id=1, eta=timezone.now() - timedelta(days=40), dispatched_date=timezone.now() - timedelta(days=40))
+    ScheduledNotification.objects.create(kind=kind, object_id=2, eta=timezone.now() - timedelta(days=1), dispatched_date=timezone.now() - timedelta(days=1))
+    ScheduledNotification.objects.create(kind=kind, object_id=3, eta=timezone.now() - timedelta(days=40))
+
+    self.assertEqual(tasks.prune_scheduled_notifications(days=30), 1)
+    self.assertEqual(sorted(ScheduledNotification.objects.values_list("object_id", flat=True)), [2, 3])
+
+  def test_send_scheduled_emails_reports_per_recipient_results(self):
+    """Assert batch task sends one email per apply and reports missing applies"""
+    applies = [Apply.objects.create(user=self.user, project=self.project, object_channel="default") for _ in range(3)]
+    pks = [apply.pk for apply in applies] + [0]
+    mail.outbox = []
+
+    results = tasks.send_scheduled_emails(ScheduledNotification.ASK_PROJECT_INTERACTION_CONFIRMATION_TO_VOLUNTEER, pks)
+
+    self.assertEqual(len(mail.outbox), 3)
+    self.assertEqual([r["pk"] for r in results], pks)
+    self.assertEqual([r["error"] for r in results], [None, None, None, "does not exist"])
+    self.assertEqual(results[0]["email"], self.user.email)
+    self.assertFalse(results[3]["sent"])
@@ -0,0 +1,179 @@
+import os
+import smtplib
+import socket
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.mail import get_connection
+from django.core.mail.backends.base import BaseEmailBackend
+
+_local = threading.local()
+
+
+def get_delivery_backend():
+  return getattr(settings, "EMAIL_DELIVERY_BACKEND", "django.core.mail.backends.smtp.EmailBackend")
+
+
+class ConnectionPool():
+  """
+  A delivery connection kept open and reused by every email sent from the
+  current process
+
+  The connection is checked with a NOOP when it has been idle for longer
+  than EMAIL_POOL_KEEPALIVE seconds and reopened if the server dropped it.
+  Messages are sent one at a time. A message failing because the
+  connection was lost is retried once on a new connection, unless it had
+  reached DATA, as the server may have accepted it already. Connections are
+  never shared across forked processes.
+  """
+  RECONNECT_ERRORS = (smtplib.SMTPServerDisconnected, socket.error)
+
+  def __init__(self):
+    self.enabled = False
+    self._lock = threading.RLock()
+    self._connection = None
+    self._pid = None
+    self._last_used = None
+    self._data_started = False
+
+  def enable(self):
+    self.enabled = True
+
+  def disable(self):
+    self.enabled = False
+    self.close()
+
+  def _keepalive(self):
+    return getattr(settings, "EMAIL_POOL_KEEPALIVE", 30)
+
+  def _is_alive(self, connection):
+    smtp = getattr(connection, "connection", None)
+    if smtp is None:
+      return True
+
+    try:
+      return smtp.noop()[0] == 250
+    except self.RECONNECT_ERRORS + (smtplib.SMTPException,):
+      return False
+
+  def _discard(self):
+    if self._connection is not None and self._pid == os.getpid():
+      try:
+        self._connection.close()
+      except Exception:
+        pass
+    self._connection = None
+
+  def _get_connection(self):
+    if self._pid != os.getpid():
+      # Inherited from the parent process, the socket belongs to it
+      self._connection = None
+      self._pid = os.getpid()
+
+    if self._connection is not None and time.monotonic() - self._last_used > self._keepalive():
+      if not self._is_alive(self._connection):
+        self._discard()
+
+    if self._connection is None:
+      self._connection = get_connection(backend=get_delivery_backend(), fail_silently=False)
+      self._connection.open()
+      self._track_data(self._connection)
+      self._last_used = time.monotonic()
+
+    return self._connection
+
+  def _track_data(self, connection):
+    """
+    Record when the SMTP connection starts sending a message's DATA
+    """
+    smtp = getattr(connection, "connection", None)
+    if smtp is None or not hasattr(smtp, "data"):
+      return
+
+    data = smtp.data
+    def tracked_data(*args, **kwargs):
+      self._data_started = True
+      return data(*args, **kwargs)
+    smtp.data = tracked_data
+
+  def _send(self, message):
+    self._data_started = False
+    try:
+      return self._get_connection().send_messages([message])
+    except self.RECONNECT_ERRORS:
+      self._discard()
+      if self._data_started:
+        raise
+      return self._get_connection().send_messages([message])
+
+  def send_messages(self, email_messages):
+    with self._lock:
+      sent = 0
+      try:
+        for message in email_messages:
+          sent += self._send(message) or 0
+      finally:
+        self._last_used = time.monotonic()
+      return sent
+
+  def close(self):
+    with self._lock:
+      self._discard()
+
+connection_pool = ConnectionPool()
+
+
+@contextmanager
+def shared_connection():
+  """
+  Deliver every email sent inside the block through a single connection
+
+  The connection is only opened when the first email is delivered through
+  SharedConnectionEmailBackend and is closed when the block exits. Emails
+  must be sent synchronously, threads do not see the shared connection.
+  When the process-wide connection pool is enabled it is used instead.
+  """
+  if getattr(_local, "scope", None) is not None:
+    yield
+    return
+
+  _local.scope = {"connection": None}
+  try:
+    yield
+  finally:
+    connection = _local.scope["connection"]
+    _local.scope = None
+    if connection is not None:
+      connection.close()
+
+
+class SharedConnectionEmailBackend(BaseEmailBackend):
+  """
+  Deliver emails through settings.EMAIL_DELIVERY_BACKEND
+
+  Uses the process-wide connection pool when it is enabled (celery worker
+  processes), otherwise the connection of the enclosing shared_connection
+  block if there is one, otherwise a new connection per call.
+  """
+  def send_messages(self, email_messages):
+    if connection_pool.enabled:
+      try:
+        return connection_pool.send_messages(email_messages)
+      except Exception:
+        if not self.fail_silently:
+          raise
+        return 0
+
+    scope = getattr(_local, "scope", None)
+
+    if scope is None:
+      connection = get_connection(backend=get_delivery_backend(), fail_silently=self.fail_silently)
+      return connection.send_messages(email_messages)
+
+    if scope["connection"] is None:
+      scope["connection"] = get_connection(backend=get_delivery_backend(), fail_silently=self.fail_silently)
+      scope["connection"].open()
+
+    return scope["connection"].send_messages(email_messages)
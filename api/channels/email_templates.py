@@ -0,0 +1,364 @@
+import os
+import re
+from collections import namedtuple
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.template import TemplateDoesNotExist
+from django.template import TemplateSyntaxError
+from django.template.base import DebugLexer
+from django.template.base import TokenType
+from django.template.loaders.base import Loader as BaseLoader
+
+COMPILABLE_TEMPLATE_RE = re.compile(r"^(?P<channel>[^/]+)/email/(?!base-)[^/]+-body\.html$")
+BASE_TEMPLATE = "{}/email/base-body.html"
+EXTEND_VARIABLE = "extend.html"
+INLINECSS_RE = re.compile(r"{%\s*inlinecss\s+(?P<paths>[^%]+?)\s*%}(?P<html>.*?){%\s*endinlinecss\s*%}", re.S)
+PROTECTED_RE = re.compile(r"{%\s*blocktrans\b.*?{%\s*endblocktrans\s*%}|{%.*?%}|{{.*?}}|{#.*?#}", re.S)
+TOKEN = "djtpl{}x"
+TOKEN_RE = re.compile(r"djtpl(\d+)x")
+SIGNATURE_PREFIX = "{# compiled-email-template "
+SIGNATURE_SUFFIX = " #}\n"
+
+Block = namedtuple("Block", ["name", "start", "content_start", "content_end", "end", "children"])
+
+# Tags and filters that only output text, see check_text_only
+TEXT_TAGS = {
+  "if", "elif", "else", "endif", "for", "empty", "endfor", "with", "endwith", "load", "now", "templatetag",
+  "comment", "endcomment", "url", "static", "firstof", "cycle", "trans", "blocktrans", "plural", "endblocktrans",
+}
+TEXT_FILTERS = {
+  "add", "capfirst", "cut", "date", "default", "default_if_none", "escape", "first", "floatformat", "force_escape",
+  "last", "length", "lower", "pluralize", "slice", "stringformat", "striptags", "time", "timesince", "timeuntil",
+  "title", "truncatechars", "truncatewords", "upper", "urlencode", "yesno",
+}
+FILTER_RE = re.compile(r"\|\s*(\w+)")
+
+
+class NotCompilable(Exception):
+  pass
+
+
+def parse_template(source):
+  """
+  Return the extends target, {% load %} tags and {% block %} tree of a
+  template source, using Django's lexer so nested blocks are matched
+  """
+  extends = None
+  loads = []
+  stack = [[]]
+  openings = []
+
+  for token in DebugLexer(source).tokenize():
+    if token.token_type == TokenType.VAR and token.contents.strip().startswith("block.super"):
+      raise NotCompilable("{{ block.super }} is not supported")
+    if token.token_type != TokenType.BLOCK:
+      continue
+
+    bits = token.split_contents()
+    if bits[0] == "extends":
+      extends = bits[1]
+    elif bits[0] == "load":
+      loads.append("{{% {} %}}".format(token.contents))
+    elif bits[0] == "block":
+      openings.append((bits[1], token))
+      stack.append([])
+    elif bits[0] == "endblock":
+      if not openings:
+        raise TemplateSyntaxError("Unexpected {% endblock %}")
+      name, opening = openings.pop()
+      children = stack.pop()
+      stack[-1].append(Block(name, opening.position[0], opening.position[1], token.position[0], token.position[1], children))
+
+  if openings:
+    raise TemplateSyntaxError("Unclosed {{% block {} %}}".format(openings[-1][0]))
+  return extends, loads, stack[0]
+
+
+def check_text_only(html):
+  """
+  Raise NotCompilable unless the tags and variables of html only output
+  escaped text, as CSS inlined ahead of time can't style markup they output
+  """
+  in_trans = False
+  for token in DebugLexer(html).tokenize():
+    if token.token_type == TokenType.VAR:
+      for name in FILTER_RE.findall(token.contents):
+        if name not in TEXT_FILTERS:
+          raise NotCompilable("{{{{ {} }}}} may output markup".format(token.contents))
+    elif token.token_type == TokenType.BLOCK:
+      name = token.split_contents()[0]
+      if name not in TEXT_TAGS:
+        raise NotCompilable("{{% {} %}} may output markup".format(name))
+      if name == "trans" and "<" in token.contents:
+        raise NotCompilable("{{% {} %}} outputs markup".format(token.contents))
+      in_trans = name in ("blocktrans", "plural")
+    elif token.token_type == TokenType.TEXT and in_trans and "<" in token.contents:
+      raise NotCompilable("Translation outputs markup")
+
+
+def substitute_blocks(source, blocks, start, end, overrides):
+  """
+  Return source[start:end] without block tags, blocks being replaced by
+  their override when there is one
+  """
+  parts = []
+  position = start
+  for block in blocks:
+    parts.append(source[position:block.start])
+    if block.name in overrides:
+      parts.append(overrides[block.name])
+    else:
+      parts.append(substitute_blocks(source, block.children, block.content_start, block.content_end, overrides))
+    position = block.end
+  parts.append(source[position:end])
+  return "".join(parts)
+
+
+def get_block_contents(source, blocks, overrides, contents):
+  for block in blocks:
+    if block.name in overrides:
+      contents[block.name] = overrides[block.name]
+    else:
+      contents[block.name] = substitute_blocks(source, block.children, block.content_start, block.content_end, overrides)
+    get_block_contents(source, block.children, overrides, contents)
+  return contents
+
+
+class EmailTemplateCompiler():
+  """
+  Produce email HTML bodies with their CSS inlined ahead of time
+
+  A channel email template is flattened into its base template and the
+  {% inlinecss %} block is inlined once on the template source, with every
+  Django tag, variable and blocktrans protected by an opaque token. Only
+  context substitution is left for render time. Translations are resolved
+  at render time too, so a compiled template is shared by every locale.
+
+  Bodies extend the base BaseMail sets in extend.html, which is the base of
+  the channel sending the email, not of the channel the body belongs to:
+  channels fall back to default bodies. Such bodies are compiled into every
+  channel base and pick one on extend.html at render time.
+
+  Templates using {{ block.super }}, tags or filters that may output markup
+  (see check_text_only), or whose tokens do not come back in the same order
+  after inlining, are not compiled and keep being inlined at render time.
+  Context values marked safe are not styled either, none are passed to
+  channel emails.
+
+  compile_email_templates writes compiled templates when deploying. Outside
+  DEBUG they are read once per process and their sources are not checked
+  for changes again.
+  """
+  def __init__(self, loaders):
+    self.loaders = loaders
+    self._cache = {}
+
+  def is_compilable(self, template_name):
+    return bool(COMPILABLE_TEMPLATE_RE.match(template_name))
+
+  def _get_source(self, template_name):
+    for loader in self.loaders:
+      for origin in loader.get_template_sources(template_name):
+        try:
+          return origin.loader.get_contents(origin), origin.name
+        except TemplateDoesNotExist:
+          continue
+    raise TemplateDoesNotExist(template_name)
+
+  def get_bases(self, template_name):
+    """
+    Return the base templates extend.html may point to, the channel of the
+    template first
+    """
+    channels = [template_name.split("/", 1)[0], "default"]
+    channels += sorted(config.name.split(".", 1)[1] for config in apps.get_app_configs() if config.name.startswith("channels."))
+
+    bases = []
+    for channel in channels:
+      base = BASE_TEMPLATE.format(channel)
+      if base in bases:
+        continue
+      try:
+        self._get_source(base)
+      except TemplateDoesNotExist:
+        continue
+      bases.append(base)
+    return bases
+
+  def _flatten(self, template_name, base, files, overrides=None):
+    overrides = overrides or {}
+    source, path = self._get_source(template_name)
+    files.append(path)
+
+    extends, loads, blocks = parse_template(source)
+    if extends is None:
+      return substitute_blocks(source, blocks, 0, len(source), overrides)
+
+    if extends[0] in "\"'":
+      target = extends[1:-1]
+    elif extends == EXTEND_VARIABLE and base:
+      target = base
+    else:
+      raise NotCompilable("{} extends {}".format(template_name, extends))
+    if target == template_name:
+      raise NotCompilable("{} extends itself".format(template_name))
+
+    contents = get_block_contents(source, blocks, overrides, {})
+    contents.update(overrides)
+    return "".join(loads) + self._flatten(target, base, files, contents)
+
+  def _css_paths(self, paths):
+    return [p.strip("\"'") for p in paths.split()]
+
+  def _inline(self, html, css):
+    from django_inlinecss import conf
+
+    protected = []
+    def protect(match):
+      protected.append(match.group(0))
+      return TOKEN.format(len(protected) - 1)
+
+    tokenized = PROTECTED_RE.sub(protect, html)
+    inlined = conf.get_engine()(html=tokenized, css=css).render()
+
+    if [int(i) for i in TOKEN_RE.findall(inlined)] != list(range(len(protected))):
+      return None
+
+    return TOKEN_RE.sub(lambda m: protected[int(m.group(1))], inlined)
+
+  def signature(self, files):
+    return ",".join("{}:{}".format(f, int(os.path.getmtime(f))) if f and os.path.exists(f) else "{}:0".format(f) for f in files)
+
+  def _inline_source(self, source, files):
+    match = INLINECSS_RE.search(source)
+    if not match:
+      return None
+
+    from django_inlinecss import conf
+    paths = self._css_paths(match.group("paths"))
+    css = "".join(conf.get_css_loader()().load(path) for path in paths)
+    files.extend(finders.find(path) or path for path in paths)
+
+    check_text_only(match.group("html"))
+    inlined = self._inline(match.group("html"), css)
+    if inlined is None:
+      return None
+
+    return source[:match.start()] + inlined + source[match.end():]
+
+  def compile(self, template_name):
+    """
+    Return (source, signature) for a compiled template, source being None
+    when the template can not be compiled
+    """
+    files = []
+    source, path = self._get_source(template_name)
+    extends = parse_template(source)[0]
+    bases = self.get_bases(template_name) if extends == EXTEND_VARIABLE else [None]
+
+    branches = []
+    for base in bases:
+      try:
+        compiled = self._inline_source(self._flatten(template_name, base, files), files)
+      except NotCompilable:
+        compiled = None
+      if compiled is None:
+        return None, self.signature(files)
+      branches.append((base, compiled))
+
+    if len(branches) == 1:
+      return branches[0][1], self.signature(files)
+
+    # The template's own channel comes first and is the fallback
+    parts = []
+    for i, (base, compiled) in enumerate(branches[1:]):
+      parts.append("{{% {} {} == \"{}\" %}}".format("if" if i == 0 else "elif", EXTEND_VARIABLE, base))
+      parts.append(compiled)
+    parts += ["{% else %}", branches[0][1], "{% endif %}"]
+    return "".join(parts), self.signature(files)
+
+  def _current_signature(self, signature):
+    files = [entry.rsplit(":", 1)[0] for entry in signature.split(",")]
+    return self.signature(files)
+
+  def _read_compiled_file(self, template_name):
+    directory = getattr(settings, "EMAIL_COMPILED_TEMPLATES_DIR", None)
+    if not directory:
+      return None
+
+    path = os.path.join(directory, template_name)
+    if not os.path.exists(path):
+      return None
+
+    with open(path) as f:
+      header = f.readline()
+      if not header.startswith(SIGNATURE_PREFIX):
+        return None
+      return f.read(), header[len(SIGNATURE_PREFIX):-len(SIGNATURE_SUFFIX)]
+
+  def write(self, template_name, directory):
+    source, signature = self.compile(template_name)
+    if source is None:
+      return False
+
+    path = os.path.join(directory, template_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, "w") as f:
+      f.write(SIGNATURE_PREFIX + signature + SIGNATURE_SUFFIX + source)
+    return True
+
+  def get(self, template_name):
+    """
+    Return the compiled source of a template or None
+
+    Compiled sources are read from EMAIL_COMPILED_TEMPLATES_DIR, compiled on
+    first use otherwise, and cached. In DEBUG they are compiled again once
+    one of the files they were built from changes.
+    """
+    check = settings.DEBUG
+    cached = self._cache.get(template_name)
+    if cached and (not check or cached[1] == self._current_signature(cached[1])):
+      return cached[0]
+
+    compiled = self._read_compiled_file(template_name)
+    if compiled is None or (check and compiled[1] != self._current_signature(compiled[1])):
+      compiled = self.compile(template_name)
+
+    self._cache[template_name] = compiled
+    return compiled[0]
+
+
+class Loader(BaseLoader):
+  """
+  Template loader serving channel email HTML bodies with their CSS already
+  inlined, see EmailTemplateCompiler. Other templates are served by the
+  wrapped loaders unchanged.
+  """
+  def __init__(self, engine, loaders):
+    super(Loader, self).__init__(engine)
+    self.loaders = engine.get_template_loaders(loaders)
+    self.compiler = EmailTemplateCompiler(self.loaders)
+
+  def get_template_sources(self, template_name):
+    for loader in self.loaders:
+      for origin in loader.get_template_sources(template_name):
+        yield origin
+
+  def get_contents(self, origin):
+    if self.compiler.is_compilable(origin.template_name):
+      try:
+        source = self.compiler.get(origin.template_name)
+      except TemplateDoesNotExist:
+        source = None
+      if source is not None:
+        return source
+
+    return origin.loader.get_contents(origin)
+
+  def reset(self):
+    self.compiler._cache.clear()
+    for loader in self.loaders:
+      if hasattr(loader, "reset"):
+        loader.reset()
@@ -0,0 +1,156 @@
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import as_completed
+from urllib.parse import urlencode
+from urllib.request import urlopen
+
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+
+class GeocodingError(Exception):
+  pass
+
+
+def parse_google_result(result):
+  """
+  Reduce a Google geocoding result to what the importer stores
+  """
+  components = [
+    {
+      "long_name": component["long_name"],
+      "short_name": component["short_name"],
+      "types": component["types"],
+    }
+    for component in result.get("address_components", [])
+  ]
+  by_type = {t: component for component in components for t in component["types"]}
+
+  city_state = None
+  if "locality" in by_type and "administrative_area_level_1" in by_type:
+    city_state = "{}, {}".format(by_type["locality"]["long_name"], by_type["administrative_area_level_1"]["short_name"])
+
+  return {
+    "lat": result["geometry"]["location"]["lat"],
+    "lng": result["geometry"]["location"]["lng"],
+    "address_line": result.get("formatted_address"),
+    "city_state": city_state,
+    "components": components,
+  }
+
+
+class GoogleGeocoder():
+  """
+  Geocoder using the Google Maps geocoding API
+  """
+  url = "https://maps.googleapis.com/maps/api/geocode/json"
+
+  def __init__(self, api_key=None, timeout=10):
+    self.api_key = api_key or getattr(settings, "GOOGLE_MAPS_KEY", None)
+    self.timeout = timeout
+
+  def geocode(self, address):
+    query = urlencode({"address": address, "key": self.api_key})
+    with urlopen("{}?{}".format(self.url, query), timeout=self.timeout) as response:
+      data = json.loads(response.read().decode("utf-8"))
+
+    if data["status"] == "ZERO_RESULTS":
+      return None
+    if data["status"] != "OK":
+      raise GeocodingError(data.get("error_message") or data["status"])
+
+    return parse_google_result(data["results"][0])
+
+
+class StubGeocoder():
+  """
+  Geocoder answering every address with the same result, without network
+  access. Used by tests and to import files locally.
+  """
+  def __init__(self, *args, **kwargs):
+    self.calls = []
+    self._lock = threading.Lock()
+
+  def geocode(self, address):
+    with self._lock:
+      self.calls.append(address)
+
+    return {
+      "lat": 0.0,
+      "lng": 0.0,
+      "address_line": address,
+      "city_state": None,
+      "components": [
+        {"long_name": "Brazil", "short_name": "BR", "types": ["country", "political"]},
+      ],
+    }
+
+
+def get_geocoder(path=None):
+  return import_string(path or settings.GDD_IMPORT_GEOCODER)()
+
+
+class GeocodingCache():
+  """
+  Geocoding results by typed address, persisted to a JSON file so
+  addresses are only sent to the geocoder once across runs
+  """
+  def __init__(self, path):
+    self.path = path
+    self._lock = threading.Lock()
+    self._results = {}
+
+    if path and os.path.exists(path):
+      with open(path) as cache_file:
+        self._results = json.load(cache_file)
+
+  def __contains__(self, address):
+    return address in self._results
+
+  def get(self, address):
+    return self._results.get(address)
+
+  def set(self, address, result):
+    with self._lock:
+      self._results[address] = result
+
+  def save(self):
+    if not self.path:
+      return
+
+    with self._lock:
+      data = json.dumps(self._results)
+
+    tmp_path = "{}.tmp".format(self.path)
+    with open(tmp_path, "w") as cache_file:
+      cache_file.write(data)
+    os.replace(tmp_path, self.path)
+
+
+def geocode_addresses(addresses, geocoder, cache, workers=8, save_every=100):
+  """
+  Geocode addresses missing from the cache with a bounded thread pool
+
+  Each address is geocoded once, however many times it is listed. Returns
+  errors by address, failed addresses are not cached and are retried on
+  the next run.
+  """
+  missing = sorted(set(address for address in addresses if address not in cache))
+  errors = {}
+
+  with ThreadPoolExecutor(max_workers=workers) as executor:
+    futures = {executor.submit(geocoder.geocode, address): address for address in missing}
+    for i, future in enumerate(as_completed(futures), 1):
+      address = futures[future]
+      try:
+        cache.set(address, future.result())
+      except Exception as e:
+        errors[address] = str(e)
+
+      if i % save_every == 0:
+        cache.save()
+
+  cache.save()
+  return errors
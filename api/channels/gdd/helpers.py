@@ -0,0 +1,54 @@
+from channels.gdd.models import AddressCountry
+
+PROJECT_COUNTRY_ATTR = '_gdd_country_code'
+
+
+def get_address_components_country_code(address_id):
+  """
+  Return the short country code from the address components of an address
+  """
+  from ovp.apps.core.models import GoogleAddress
+  country = GoogleAddress(pk=address_id).address_components.filter(types__name='country').first()
+  if country:
+    return country.short_name
+  return None
+
+
+def update_address_country(address_id):
+  """
+  Store the country code of an address and return it
+  """
+  country_code = get_address_components_country_code(address_id) or ''
+  AddressCountry.objects.update_or_create(address_id=address_id, defaults={'country_code': country_code})
+  return country_code or None
+
+
+def get_country_code(address_id):
+  """
+  Return the country code of an address, or None
+
+  Reads the denormalized AddressCountry row, falling back to the address
+  components when the row is missing. An empty row means the address has
+  no country, it is only computed again when its components change.
+  """
+  country_code = AddressCountry.objects.filter(address_id=address_id).values_list('country_code', flat=True).first()
+  if country_code is None:
+    return update_address_country(address_id)
+  return country_code or None
+
+
+def get_project_country_code(project):
+  """
+  Return the country code of a project's address, memoized on the instance
+  so every handler of the same save shares a single lookup
+  """
+  if not project.address_id:
+    return None
+
+  cached = project.__dict__.get(PROJECT_COUNTRY_ATTR)
+  if cached is not None and cached[0] == project.address_id:
+    return cached[1]
+
+  country_code = get_country_code(project.address_id)
+  project.__dict__[PROJECT_COUNTRY_ATTR] = (project.address_id, country_code)
+  return country_code
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from ovp.apps.core.models import GoogleAddress
+from channels.gdd.models import AddressCountry
+
+
+class Command(BaseCommand):
+    help = 'Fill the denormalized country code of every GoogleAddress'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            help='Number of addresses processed per transaction',
+            type=int,
+            default=1000,
+        )
+
+        parser.add_argument(
+            '--missing-only',
+            help='Only fill addresses without a country code',
+            action='store_true',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        addresses = GoogleAddress.objects.order_by('pk')
+        if options['missing_only']:
+            addresses = addresses.exclude(gdd_country__country_code__gt='')
+
+        last_pk = 0
+        total = 0
+        while True:
+            pks = list(addresses.filter(pk__gt=last_pk).values_list('pk', flat=True)[:batch_size])
+            if not pks:
+                break
+
+            codes = dict(
+                GoogleAddress.address_components.through.objects
+                .filter(googleaddress_id__in=pks, addresscomponent__types__name='country')
+                .values_list('googleaddress_id', 'addresscomponent__short_name')
+            )
+
+            with transaction.atomic():
+                AddressCountry.objects.filter(address_id__in=pks).delete()
+                AddressCountry.objects.bulk_create([
+                    AddressCountry(address_id=pk, country_code=codes.get(pk) or '')
+                    for pk in pks
+                ])
+
+            last_pk = pks[-1]
+            total += len(pks)
+            self.stdout.write('{} addresses processed'.format(total))
@@ -1,14 +1,29 @@
 from django.core.management.base import BaseCommand
+from django.core.management.base import CommandError
+from django.conf import settings
+from django.db import transaction
 from collections import OrderedDict
+from haystack import connections
+from itertools import islice
+from ovp.apps.channels.models import Channel
 from ovp.apps.users.models import User
 from ovp.apps.users.models import UserProfile
 from ovp.apps.projects.models import Project
 from ovp.apps.projects.models import VolunteerRole
+from ovp.apps.core.models import AddressComponent
+from ovp.apps.core.models import AddressComponentType
 from ovp.apps.core.models import GoogleAddress
 from ovp.apps.organizations.models import Organization
 from ovp.apps.core.models import Cause
 from ovp.apps.projects.models import Job, JobDate
+from channels.gdd.geocoding import GeocodingCache
+from channels.gdd.geocoding import geocode_addresses
+from channels.gdd.geocoding import get_geocoder
+from channels.gdd.models import AddressCountry
+from channels.gdd.models import ImportCheckpoint
+from channels.gdd.models import ImportedRow
 from datetime import datetime
+from django.utils import timezone
 from dateutil.parser import parse
 from dateutil.relativedelta import relativedelta
 import pytz
@@ -17,8 +32,43 @@ import string
 import logging
 import csv
 import copy
+import hashlib
+import json
+import time
+
+CAUSE_MAPPING = {
+    'Environment': 'Environment',
+    'Elderly care': 'Elders',
+    'Education': 'Education',
+    'Special populations': 'Citizen Participation',
+    'Animals': 'Animal Protection',
+    'Other': None
+}
+
+ROLE_LANGUAGES = {
+    'en-us': {
+        'name': 'Volunteer',
+        'prerequisites': 'Have full day disponibility on Good Deeds Day',
+    },
+    'es-ar': {
+        'name': 'Voluntario',
+        'prerequisites': 'Tener disponibilidad de día completo en el día de buenas acciones',
+    },
+    'pt-br': {
+        'name': 'Voluntário',
+        'prerequisites': 'Tener disponibilidad de día completo en el día de buenas acciones',
+    }
+}
+
+REQUIRED_FIELDS = [
+    'Project: Project Name', 'Project Description', 'Number of Participants Final', 'Language', 'Type',
+    'Date of GDD project(s)', 'Organization: Organization Name', 'C Email', 'C First Name', 'C last Name',
+    'C_phone', 'O Street', 'District ', 'O city', 'O_country', 'Add-on',
+]
 
 class Command(BaseCommand):
+    help = 'Import GDD projects from a CSV file, in batches of rows'
+
     def __init__(self, *args, **kwargs):
         self.pwdict = {}
         super().__init__(*args, **kwargs)
@@ -32,7 +82,46 @@ class Command(BaseCommand):
 
         parser.add_argument(
             '--run',
-            help='Do an actual run instead of dry run',
+            help='Do an actual run instead of dry run. A dry run only validates the file',
+            action='store_true',
+        )
+
+        parser.add_argument(
+            '--report',
+            help='Write the dry run validation report as JSON to this file instead of stdout',
+            type=str,
+        )
+
+        parser.add_argument(
+            '--batch-size',
+            help='Number of rows read, looked up and inserted together in one transaction',
+            type=int,
+            default=200,
+        )
+
+        parser.add_argument(
+            '--geocoder',
+            help='Dotted path of the geocoder class, defaults to settings.GDD_IMPORT_GEOCODER',
+            type=str,
+        )
+
+        parser.add_argument(
+            '--geocode-workers',
+            help='Number of addresses geocoded concurrently',
+            type=int,
+            default=8,
+        )
+
+        parser.add_argument(
+            '--geocode-cache',
+            help='JSON file where geocoding results are kept between runs',
+            type=str,
+            default=settings.GDD_GEOCODE_CACHE,
+        )
+
+        parser.add_argument(
+            '--restart',
+            help='Start from the first row instead of the checkpoint of a previous run. Rows already imported are still skipped',
             action='store_true',
         )
 
@@ -52,180 +141,428 @@ class Command(BaseCommand):
 
         logger.addHandler(console)
         self.dry_run = not options['run']
-        self._process_csv(options['file'])
+        self.batch_size = options['batch_size']
+        if self.batch_size < 1:
+            raise CommandError('--batch-size must be a positive number')
+
+        self.causes = {cause.name: cause for cause in Cause.objects.filter(channel__slug='gdd')}
+
+        if self.dry_run:
+            report = self._validate(options['file'])
+            output = json.dumps(report, indent=2, ensure_ascii=False)
+            if options['report']:
+                with open(options['report'], 'w') as report_file:
+                    report_file.write(output)
+            else:
+                self.stdout.write(output)
+
+            if report['errors']:
+                raise CommandError('{} errors found in {}'.format(len(report['errors']), options['file']))
+            return
+
+        self.channel = Channel.objects.get(slug='gdd')
+        self.users = {}
+        self.organizations = {}
+        self.address_components = {}
+        self.address_component_types = {}
+        self.geocoding_cache = GeocodingCache(options['geocode_cache'])
+
+        addresses = self._read_addresses(options['file'])
+        self.checkpoint = self._get_checkpoint(options['file'], options['restart'])
+        offset = self.checkpoint.row_offset
+        if offset:
+            self.stdout.write(f'Resuming from row {offset}')
+
+        self._geocode(addresses[offset:], get_geocoder(options['geocoder']), options['geocode_workers'])
+        self._process_csv(options['file'], offset, len(addresses))
+
+        self.checkpoint.finished_date = timezone.now()
+        self.checkpoint.save()
+
+    def _validate(self, file_path: str) -> dict:
+        """
+        Validate every row of the file in a single pass, against reference
+        data loaded once, without writing to the database
+        """
+        emails = set(User.objects.filter(channel__slug='gdd').values_list('email', flat=True))
+        organization_names = set(Organization.objects.filter(channel__slug='gdd').values_list('name', flat=True))
+
+        errors = []
+        new_emails = set()
+        new_organizations = set()
+        rows = 0
 
-    def _process_csv(self, file_path: str) -> None:
         with open(file_path) as csv_file:
             spamreader = csv.DictReader(csv_file, delimiter=',', quotechar='"')
-            for row in spamreader:
-                self._process_row(row)
-
-    def _process_row(self, row: OrderedDict):
-        logging.debug('Processing project {}'.format(row['Project: Project Name']))
-
-        # User data
-        user_data: dict = {
-            'email': row['C Email'],
-            'name': f"{row['C First Name']} {row['C last Name']}",
-            'phone': row['C_phone']
+            missing_fields = [field for field in REQUIRED_FIELDS if field not in (spamreader.fieldnames or [])]
+            if missing_fields:
+                return {
+                    'file': file_path,
+                    'rows': 0,
+                    'errors': [{'row': 1, 'field': field, 'value': None, 'error': 'Missing column'} for field in missing_fields],
+                }
+
+            # Row 1 is the header
+            for line, row in enumerate(spamreader, 2):
+                rows += 1
+                for field, value, error in self._validate_row(row):
+                    errors.append({'row': line, 'field': field, 'value': value, 'error': error})
+
+                email = row.get('C Email')
+                if email and email not in emails:
+                    new_emails.add(email)
+                organization_name = row.get('Organization: Organization Name')
+                if organization_name and organization_name not in organization_names:
+                    new_organizations.add(organization_name)
+
+        return {
+            'file': file_path,
+            'rows': rows,
+            'new_users': len(new_emails),
+            'new_organizations': len(new_organizations),
+            'errors': errors,
         }
-        user: User = self._get_or_create_user(user_data)
 
-        # Organization address data
-        address_data: dict = {
+    def _validate_row(self, row: OrderedDict):
+        """ Yield (field, value, error) for every problem found in a row """
+        # csv fills the fields of rows shorter than the header with None
+        missing = [field for field in REQUIRED_FIELDS if row.get(field) is None]
+        for field in missing:
+            yield field, None, 'Missing, the row has fewer columns than the header'
+
+        def value(field):
+            return (row.get(field) or '').strip()
+
+        for field in ['Project: Project Name', 'Organization: Organization Name', 'C Email']:
+            if field not in missing and not value(field):
+                yield field, row[field], 'Required'
+
+        if value('C Email') and '@' not in value('C Email'):
+            yield 'C Email', row['C Email'], 'Invalid email'
+
+        if 'Language' not in missing and row['Language'] not in ROLE_LANGUAGES:
+            yield 'Language', row['Language'], 'Unknown language, expected one of {}'.format(', '.join(sorted(ROLE_LANGUAGES)))
+
+        if 'Type' not in missing:
+            for cause in [x.strip() for x in row['Type'].split(';')]:
+                if cause not in CAUSE_MAPPING:
+                    yield 'Type', cause, 'Unknown cause'
+                elif CAUSE_MAPPING[cause] and CAUSE_MAPPING[cause] not in self.causes:
+                    yield 'Type', cause, 'Cause {} does not exist in the gdd channel'.format(CAUSE_MAPPING[cause])
+
+        if 'Number of Participants Final' not in missing:
+            vacancies = value('Number of Participants Final')
+            if not vacancies.isdigit() or int(vacancies) < 1:
+                yield 'Number of Participants Final', row['Number of Participants Final'], 'Must be a positive number'
+
+        if 'Date of GDD project(s)' not in missing:
+            try:
+                parse(row['Date of GDD project(s)'])
+            except (ValueError, OverflowError):
+                yield 'Date of GDD project(s)', row['Date of GDD project(s)'], 'Invalid date'
+
+    def _read_addresses(self, file_path: str) -> list:
+        """ Typed address of every row of the file, in order """
+        with open(file_path) as csv_file:
+            spamreader = csv.DictReader(csv_file, delimiter=',', quotechar='"')
+            return [self._get_address_data(row)['typed_address'] for row in spamreader]
+
+    def _get_checkpoint(self, file_path: str, restart: bool) -> ImportCheckpoint:
+        """
+        Checkpoints are kept per file content, so a file renamed or copied
+        resumes too while an edited file starts over
+        """
+        file_hash = hashlib.sha256()
+        with open(file_path, 'rb') as csv_file:
+            for block in iter(lambda: csv_file.read(65536), b''):
+                file_hash.update(block)
+
+        checkpoint, created = ImportCheckpoint.objects.get_or_create(file_hash=file_hash.hexdigest(), defaults={'file_name': file_path})
+        if restart and not created:
+            checkpoint.row_offset = 0
+            checkpoint.finished_date = None
+            checkpoint.save()
+        return checkpoint
+
+    def _geocode(self, addresses: list, geocoder, workers: int) -> None:
+        """
+        Geocode every distinct address of the file before importing, so rows
+        don't wait on the geocoder one at a time
+        """
+        errors = geocode_addresses(addresses, geocoder, self.geocoding_cache, workers=workers)
+        for address, error in errors.items():
+            logging.warning(f'Could not geocode {address}: {error}')
+
+        # Addresses are never geocoded again once inserted, failed ones are
+        # retried by running the import again
+        if errors:
+            raise CommandError(f'Could not geocode {len(errors)} addresses, run the import again to retry them')
+
+    def _process_csv(self, file_path: str, offset: int, rows_total: int) -> None:
+        started = time.monotonic()
+        with open(file_path) as csv_file:
+            spamreader = csv.DictReader(csv_file, delimiter=',', quotechar='"')
+            rows_iterator = islice(spamreader, offset, None)
+            processed = 0
+            while True:
+                rows = list(islice(rows_iterator, self.batch_size))
+                if not rows:
+                    break
+                self._process_chunk(rows, offset + processed)
+                processed += len(rows)
+                self._report_progress(offset + processed, rows_total, processed, time.monotonic() - started)
+
+    def _report_progress(self, position: int, rows_total: int, processed: int, elapsed: float) -> None:
+        rate = processed / elapsed if elapsed > 0 else 0
+        remaining = (rows_total - position) / rate if rate else 0
+        self.stdout.write(f'{position}/{rows_total} rows, {rate:.1f} rows/s, {remaining:.0f}s remaining')
+
+    def _get_row_key(self, row: OrderedDict) -> str:
+        """ Idempotency key of a row, from its content """
+        return hashlib.sha256(json.dumps(row, sort_keys=True).encode('utf-8')).hexdigest()
+
+    def _process_chunk(self, rows: list, row_offset: int) -> None:
+        entries = [self._parse_row(row) for row in rows]
+        self._fetch_users([entry['user']['email'] for entry in entries])
+        self._fetch_organizations([entry['organization']['name'] for entry in entries])
+
+        keys = [self._get_row_key(row) for row in rows]
+        imported = set(ImportedRow.objects.filter(key__in=keys).values_list('key', flat=True))
+        new_entries = OrderedDict()
+        for key, entry in zip(keys, entries):
+            if key in imported or key in new_entries:
+                logging.info('Skipping project {}, already imported'.format(entry['project']['name']))
+                continue
+            new_entries[key] = entry
+        entries = list(new_entries.values())
+
+        with transaction.atomic():
+            self._create_users(entries)
+            self._create_organizations(entries)
+            projects = self._create_projects(entries)
+            ImportedRow.objects.bulk_create([
+                ImportedRow(key=key, project=project)
+                for key, project in zip(new_entries, projects)
+            ])
+
+            self.checkpoint.row_offset = row_offset + len(rows)
+            self.checkpoint.save()
+            transaction.on_commit(lambda: self._update_search_index(projects))
+
+        logging.info('Imported {} projects'.format(len(projects)))
+
+    def _get_address_data(self, row: OrderedDict) -> dict:
+        return {
             'typed_address': f"{row['O Street']}, {row['District ']}, {row['O city']}, {row['O_country']}'",
             'typed_address2': row['Add-on']
         }
-        address: GoogleAddress = self._create_address(address_data)
-
-        # Organization data
-        organization_data: dict = {
-            'owner_id': user.pk,
-            'address_id': address.pk,
-            'name': row['Organization: Organization Name'],
-            'contact_name': f"{row['C First Name']} {row['C last Name']}",
-            'contact_email': row['C Email'],
-            'contact_phone': row['C_phone'],
-        }
-        organization: Organization = self._get_or_create_organization(organization_data)
-
-        # Organization address data
-        address: GoogleAddress = self._create_address(address_data)
-
-        # Project data
-        project_data: dict = {
-            'owner_id': user.pk,
-            'address_id': address.pk,
-            'organization_id': organization.pk,
-            'name': row['Project: Project Name'],
-            'description': row['Project Description'],
-            'max_applies': row['Number of Participants Final'],
-            'published': True
-        }
-        role_data = self._get_role_data(row['Language'], row['Number of Participants Final'])
-        causes = self._get_causes(row['Type'].split(';'))
-        job = self._get_job(row['Date of GDD project(s)'])
-        self._create_project(project_data, role_data, causes, job)
-
 
-        print('-------')
-
-    def _get_or_create_user(self, data: dict) -> User:
-        email = data['email']
-        try:
-            logging.debug(f'Getting user {email}')
-            user = User.objects.get(email=email, channel__slug="gdd")
-        except User.DoesNotExist:
-            logging.debug(f'Failed. Creating user {email}')
+    def _parse_row(self, row: OrderedDict) -> dict:
+        return {
+            'user': {
+                'email': row['C Email'],
+                'name': f"{row['C First Name']} {row['C last Name']}",
+                'phone': row['C_phone']
+            },
+            'address': self._get_address_data(row),
+            'organization': {
+                'name': row['Organization: Organization Name'],
+                'contact_name': f"{row['C First Name']} {row['C last Name']}",
+                'contact_email': row['C Email'],
+                'contact_phone': row['C_phone'],
+            },
+            'project': {
+                'name': row['Project: Project Name'],
+                'description': row['Project Description'],
+                'max_applies': row['Number of Participants Final'],
+                'published': True
+            },
+            'role': self._get_role_data(row['Language'], row['Number of Participants Final']),
+            'causes': self._get_causes(row['Type'].split(';')),
+            'date': row['Date of GDD project(s)'],
+        }
 
+    def _fetch_users(self, emails: list) -> None:
+        """ Look up users of the chunk not seen yet in a single query """
+        emails = set(emails) - set(self.users)
+        for user in User.objects.filter(email__in=emails, channel__slug='gdd'):
+            self.users[user.email] = user
+
+    def _fetch_organizations(self, names: list) -> None:
+        """ Look up organizations of the chunk not seen yet in a single query """
+        names = set(names) - set(self.organizations)
+        for organization in Organization.objects.filter(name__in=names, channel__slug='gdd'):
+            self.organizations.setdefault(organization.name, organization)
+
+    def _create_users(self, entries: list) -> None:
+        profiles = []
+        for entry in entries:
+            email = entry['user']['email']
+            if email in self.users:
+                continue
+
+            logging.debug(f'Creating user {email}')
             password = ''.join([random.choice(string.ascii_letters + string.digits) for i in range(12)])
             self.pwdict[email] = password
 
-            user = User(**data)
-
-            if not self.dry_run:
-                user.save(object_channel="gdd")
-
-            profile = UserProfile(user = user)
-            if not self.dry_run:
-                profile.save(object_channel="gdd")
-
-        return user
-
-    def _get_or_create_organization(self, data: dict) -> Organization:
-        name = data['name']
-        try:
-            logging.debug(f'Getting organization {name}')
-            organization = Organization.objects.get(name=name, channel__slug="gdd")
-        except Organization.DoesNotExist:
-            logging.debug(f'Failed. Creating organization {name}')
-
-            organization = Organization(**data)
-
-            if not self.dry_run:
-                organization.save(object_channel="gdd")
-
-        return organization
-
-    def _create_address(self, address_data: dict) -> GoogleAddress:
-        logging.debug(f'Creating address {address_data["typed_address"]}')
-        address = GoogleAddress(**address_data)
-        if not self.dry_run:
-            address.save(object_channel="gdd")
-        return address
-
-    def _create_project(self, project_data: dict, role_data: dict, causes: list, job: Job) -> Project:
-        logging.debug(f'Creating project {project_data["name"]}')
-        project = Project(**project_data)
-        if not self.dry_run:
-            project.save(object_channel="gdd")
-            role_data['project_id'] = project.pk
-
-        role = VolunteerRole(**role_data)
-        if not self.dry_run:
-            role.save(object_channel="gdd")
-
-            for cause in causes:
-                project.causes.add(cause)
-
-            job.project = project
-            job.save()
-
-
-        return project
+            user = User(**entry['user'])
+            user.save(object_channel='gdd')
+            self.users[email] = user
+            profiles.append(UserProfile(user=user, channel=self.channel))
+
+        UserProfile.objects.bulk_create(profiles)
+
+    def _create_organizations(self, entries: list) -> None:
+        new_entries = OrderedDict()
+        for entry in entries:
+            name = entry['organization']['name']
+            if name not in self.organizations:
+                new_entries.setdefault(name, entry)
+
+        addresses = self._create_addresses([entry['address'] for entry in new_entries.values()])
+        for (name, entry), address in zip(new_entries.items(), addresses):
+            logging.debug(f'Creating organization {name}')
+            organization = Organization(
+                owner_id=self.users[entry['user']['email']].pk,
+                address_id=address.pk,
+                **entry['organization']
+            )
+            organization.save(object_channel='gdd')
+            self.organizations[name] = organization
+
+    def _create_addresses(self, addresses_data: list) -> list:
+        """
+        Insert addresses in bulk with their geocoding results, instead of
+        saving them one by one and geocoding on save
+        """
+        addresses = []
+        for address_data in addresses_data:
+            logging.debug(f'Creating address {address_data["typed_address"]}')
+            address = GoogleAddress(channel=self.channel, **address_data)
+            result = self.geocoding_cache.get(address_data['typed_address'])
+            if result:
+                address.lat = result['lat']
+                address.lng = result['lng']
+                address.address_line = result['address_line']
+                address.city_state = result['city_state']
+            addresses.append(address)
+
+        addresses = GoogleAddress.objects.bulk_create(addresses)
+
+        through = []
+        countries = []
+        for address in addresses:
+            result = self.geocoding_cache.get(address.typed_address) or {'components': []}
+            country_code = ''
+            for component in result['components']:
+                through.append(GoogleAddress.address_components.through(
+                    googleaddress_id=address.pk,
+                    addresscomponent_id=self._get_address_component(component).pk
+                ))
+                if 'country' in component['types']:
+                    country_code = component['short_name']
+            countries.append(AddressCountry(address_id=address.pk, country_code=country_code))
+
+        GoogleAddress.address_components.through.objects.bulk_create(through)
+        AddressCountry.objects.bulk_create(countries)
+        return addresses
+
+    def _get_address_component(self, component: dict) -> AddressComponent:
+        """
+        Address components are shared by every address using them, across
+        runs too
+        """
+        key = (component['long_name'], component['short_name'], tuple(sorted(component['types'])))
+        if key not in self.address_components:
+            candidates = AddressComponent.objects \
+                .filter(channel=self.channel, long_name=component['long_name'], short_name=component['short_name']) \
+                .prefetch_related('types')
+            for candidate in candidates:
+                if tuple(sorted(component_type.name for component_type in candidate.types.all())) == key[2]:
+                    self.address_components[key] = candidate
+                    break
+            else:
+                address_component = AddressComponent(long_name=component['long_name'], short_name=component['short_name'])
+                address_component.save(object_channel='gdd')
+                for name in component['types']:
+                    address_component.types.add(self._get_address_component_type(name))
+                self.address_components[key] = address_component
+        return self.address_components[key]
+
+    def _get_address_component_type(self, name: str) -> AddressComponentType:
+        if name not in self.address_component_types:
+            component_type = AddressComponentType.objects.filter(name=name).first()
+            if not component_type:
+                component_type = AddressComponentType(name=name)
+                component_type.save(object_channel='gdd')
+            self.address_component_types[name] = component_type
+        return self.address_component_types[name]
+
+    def _create_projects(self, entries: list) -> list:
+        """
+        Save projects one by one, as saving generates their slug, then insert
+        roles, causes, jobs and job dates of the whole chunk in bulk
+        """
+        projects = []
+        addresses = self._create_addresses([entry['address'] for entry in entries])
+        for entry, address in zip(entries, addresses):
+            logging.debug(f'Creating project {entry["project"]["name"]}')
+            project = Project(
+                owner_id=self.users[entry['user']['email']].pk,
+                organization_id=self.organizations[entry['organization']['name']].pk,
+                address_id=address.pk,
+                **entry['project']
+            )
+            project.save(object_channel='gdd')
+            projects.append(project)
+
+        VolunteerRole.objects.bulk_create([
+            VolunteerRole(project_id=project.pk, channel=self.channel, **entry['role'])
+            for project, entry in zip(projects, entries)
+        ])
+
+        Project.causes.through.objects.bulk_create([
+            Project.causes.through(project_id=project.pk, cause_id=cause.pk)
+            for project, entry in zip(projects, entries)
+            for cause in entry['causes']
+        ])
+
+        # bulk_create skips JobDate.save(), which sets the dates of the job
+        dates = [self._get_job_dates(entry['date']) for entry in entries]
+        jobs = Job.objects.bulk_create([
+            Job(project=project, channel=self.channel, **job_dates)
+            for project, job_dates in zip(projects, dates)
+        ])
+        JobDate.objects.bulk_create([
+            JobDate(job=job, channel=self.channel, **job_dates)
+            for job, job_dates in zip(jobs, dates)
+        ])
+
+        return projects
+
+    def _update_search_index(self, projects: list) -> None:
+        """ Roles, causes and jobs were inserted after the projects were indexed """
+        index = connections['default'].get_unified_index().get_index(Project)
+        connections['default'].get_backend().update(index, Project.objects.filter(pk__in=[project.pk for project in projects]))
 
     def _get_causes(self, causes_field: str) -> list:
-        cause_mapping = {
-            'Environment': 'Environment',
-            'Elderly care': 'Elders',
-            'Education': 'Education',
-            'Special populations': 'Citizen Participation',
-            'Animals': 'Animal Protection',
-            'Other': None
-        }
         causes_names = [x.strip() for x in causes_field]
         causes = []
         for cause in causes_names:
-            print(cause)
-            name = cause_mapping[cause]
+            name = CAUSE_MAPPING[cause]
             if name:
-                causes.append(
-                    Cause.objects.get(name=name, channel__slug='gdd')
-                )
+                if name not in self.causes:
+                    raise CommandError(f'Cause {name} does not exist in the gdd channel')
+                causes.append(self.causes[name])
         return causes
 
     def _get_role_data(self, language, vacancies):
-        languages = {
-            'en-us': {
-                'name': 'Volunteer',
-                'prerequisites': 'Have full day disponibility on Good Deeds Day',
-            },
-            'es-ar': {
-                'name': 'Voluntario',
-                'prerequisites': 'Tener disponibilidad de día completo en el día de buenas acciones',
-            },
-            'pt-br': {
-                'name': 'Voluntário',
-                'prerequisites': 'Tener disponibilidad de día completo en el día de buenas acciones',
-            }
-        }
-
-        role_data = copy.deepcopy(languages[language])
+        role_data = copy.deepcopy(ROLE_LANGUAGES[language])
         role_data['vacancies'] = vacancies
         return role_data
 
-    def _get_job(self, date):
-        job = Job()
-
-        if not self.dry_run:
-            job.save(object_channel="gdd")
-
+    def _get_job_dates(self, date) -> dict:
         tz = pytz.timezone('America/Argentina/Buenos_Aires' )
         start_date = tz.localize(parse(date))
         end_date = start_date + relativedelta(hours=24)
-        jobdate = JobDate(start_date=start_date, end_date=end_date, job=job)
-
-        if not self.dry_run:
-            jobdate.save(object_channel="gdd")
-
-        return job
+        return {'start_date': start_date, 'end_date': end_date}
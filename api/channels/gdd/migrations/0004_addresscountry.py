@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_auto_20171005_1902'),
+        ('gdd', '0002_groups_pt'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AddressCountry',
+            fields=[
+                ('address', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='gdd_country', serialize=False, to='core.GoogleAddress')),
+                ('country_code', models.CharField(blank=True, db_index=True, max_length=2)),
+            ],
+        ),
+    ]
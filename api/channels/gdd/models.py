@@ -0,0 +1,31 @@
+from django.db import models
+
+
+class AddressCountry(models.Model):
+  """
+  Country code of a GoogleAddress, denormalized from its address components
+  so GDD signal handlers can read it with a single indexed lookup
+  """
+  address = models.OneToOneField('core.GoogleAddress', primary_key=True, related_name='gdd_country', on_delete=models.CASCADE)
+  country_code = models.CharField(max_length=2, blank=True, db_index=True)
+
+
+class ImportCheckpoint(models.Model):
+  """
+  Progress of import_gdd_projects on a file, identified by its content hash
+  """
+  file_hash = models.CharField(max_length=64, unique=True)
+  file_name = models.CharField(max_length=300)
+  row_offset = models.PositiveIntegerField(default=0)
+  created_date = models.DateTimeField(auto_now_add=True)
+  modified_date = models.DateTimeField(auto_now=True)
+  finished_date = models.DateTimeField(null=True, blank=True)
+
+
+class ImportedRow(models.Model):
+  """
+  Idempotency key of a CSV row already imported by import_gdd_projects
+  """
+  key = models.CharField(max_length=64, unique=True)
+  project = models.ForeignKey('projects.Project', null=True, blank=True, related_name='+', on_delete=models.SET_NULL)
+  created_date = models.DateTimeField(auto_now_add=True)
@@ -1,31 +1,28 @@
-from django.contrib.auth import get_user_model
+import logging
+
 from ovp.apps.projects.models import Project
 from ovp.apps.core.models import GoogleAddress
+from django.db import transaction
+from django.db.models.signals import m2m_changed
 from django.db.models.signals import post_save
-from channels.gdd.emails import GDDMail
-from ovp.apps.projects.models.category import Category
+from channels.gdd import tasks
+from channels.gdd.helpers import get_project_country_code
+from channels.gdd.helpers import update_address_country
+from channels.cache import category_ids
 
-User = get_user_model()
+logger = logging.getLogger(__name__)
 
 def send_email_to_manager(sender, *args, **kwargs):
   """
-  Schedule task for 7 days after apply asking if user has received contact from organization
+  Notify country managers when a project is created, in a celery task
   """
   instance = kwargs["instance"]
 
   if instance.channel.slug == "gdd" and kwargs["created"] and not kwargs["raw"]:
-    if not instance.address:
-        return None
-    address = GoogleAddress.objects.get(pk=instance.address.pk)
-    country = address.address_components.filter(types__name='country').first()
-    if country:
-        country = country.short_name
-    else:
+    if not instance.address_id:
         return None
-    managers = User.objects.filter(groups__name="mng-{}".format(country.lower()))
-
-    for manager in managers:
-      GDDMail(manager, async_mail=True).sendProjectCreatedToCountryManager({'project': instance})
+    project_pk = instance.pk
+    transaction.on_commit(lambda: tasks.send_project_created_to_country_managers.delay(project_pk))
 post_save.connect(send_email_to_manager, sender=Project)
 
 def add_to_gdd_brasil_category(sender, *args, **kwargs):
@@ -35,13 +32,33 @@ def add_to_gdd_brasil_category(sender, *args, **kwargs):
   instance = kwargs["instance"]
 
   if instance.channel.slug == "gdd" and not kwargs["raw"]:
-    if not instance.address:
+    if not instance.address_id:
         return None
 
-    category = Category.objects.get(slug="dba-2020")
-    address = GoogleAddress.objects.get(pk=instance.address.pk)
-    country = address.address_components.filter(types__name='country').first()
-
-    if country and country.short_name == "BR":
-        instance.categories.add(category)
+    if get_project_country_code(instance) == "BR":
+        category_id = category_ids.get("dba-2020")
+        if category_id is None:
+            logger.warning("Category dba-2020 does not exist, project %s was not added to it", instance.pk)
+            return None
+        instance.categories.add(category_id)
 post_save.connect(add_to_gdd_brasil_category, sender=Project)
+
+def store_address_country(sender, *args, **kwargs):
+  """
+  Keep the denormalized country code of gdd addresses up to date, once
+  their address components are saved
+  """
+  if kwargs["action"] not in ("post_add", "post_remove", "post_clear"):
+    return None
+
+  instance = kwargs["instance"]
+  if kwargs["reverse"]:
+    address_ids = GoogleAddress.objects.filter(pk__in=kwargs["pk_set"] or [], channel__slug="gdd").values_list("pk", flat=True)
+  elif instance.channel.slug == "gdd":
+    address_ids = [instance.pk]
+  else:
+    return None
+
+  for address_id in address_ids:
+    update_address_country(address_id)
+m2m_changed.connect(store_address_country, sender=GoogleAddress.address_components.through)
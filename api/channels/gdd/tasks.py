@@ -0,0 +1,45 @@
+from __future__ import absolute_import
+
+import logging
+
+from django.contrib.auth import get_user_model
+from ovp.apps.projects.models import Project
+
+from channels.email_backends import shared_connection
+from channels.gdd.emails import GDDMail
+from channels.gdd.helpers import get_project_country_code
+from celery import task
+
+User = get_user_model()
+logger = logging.getLogger(__name__)
+
+@task(name='channels.gdd.tasks.send_project_created_to_country_managers')
+def send_project_created_to_country_managers(project_pk):
+  """
+  Notify the managers of a project's country that it was created
+
+  Managers are loaded with a single query and emails are sent synchronously
+  over a single connection. Returns the result for each manager.
+  """
+  try:
+    project = Project.objects.select_related("owner", "organization").get(pk=project_pk)
+  except Project.DoesNotExist:
+    return []
+
+  country = get_project_country_code(project)
+  if not country:
+    return []
+
+  managers = User.objects.filter(groups__name="mng-{}".format(country.lower())).select_related("channel").distinct()
+
+  results = []
+  with shared_connection():
+    for manager in managers:
+      try:
+        sent = GDDMail(manager, async_mail=False).sendProjectCreatedToCountryManager({'project': project})
+        results.append({"pk": manager.pk, "email": manager.email, "sent": bool(sent), "error": None})
+      except Exception as e:
+        logger.exception("Failed notifying country manager %s about project %s", manager.pk, project_pk)
+        results.append({"pk": manager.pk, "email": manager.email, "sent": False, "error": str(e)})
+
+  return results
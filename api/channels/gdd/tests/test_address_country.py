@@ -0,0 +1,98 @@
+from io import StringIO
+
+from django.core.management import call_command
+from django.test import TestCase
+
+from ovp.apps.channels.models import Channel
+from ovp.apps.core.models import AddressComponent
+from ovp.apps.core.models import AddressComponentType
+from ovp.apps.core.models import GoogleAddress
+from ovp.apps.organizations.models import Organization
+from ovp.apps.projects.models import Project
+from ovp.apps.users.models import User
+
+from channels.gdd.helpers import get_project_country_code
+from channels.gdd.models import AddressCountry
+
+def create_component(short_name, type_name, channel):
+  component_type = AddressComponentType(name=type_name)
+  component_type.save(object_channel=channel)
+  component = AddressComponent(long_name=short_name, short_name=short_name)
+  component.save(object_channel=channel)
+  component.types.add(component_type)
+  return component
+
+class AddressCountryTestCase(TestCase):
+  def create_address(self, channel="gdd"):
+    return GoogleAddress.objects.bulk_create([GoogleAddress(typed_address="Rua A", channel=Channel.objects.get(slug=channel))])[0]
+
+  def test_country_is_stored_once_components_are_added(self):
+    address = self.create_address()
+    self.assertFalse(AddressCountry.objects.filter(address=address).exists())
+
+    address.address_components.add(create_component("BR", "country", "gdd"))
+    self.assertEqual(AddressCountry.objects.get(address=address).country_code, "BR")
+
+    address.address_components.clear()
+    self.assertEqual(AddressCountry.objects.get(address=address).country_code, "")
+
+  def test_country_is_not_stored_for_other_channels(self):
+    address = self.create_address("default")
+    address.address_components.add(create_component("BR", "country", "default"))
+    self.assertFalse(AddressCountry.objects.filter(address=address).exists())
+
+class ProjectCountryCodeTestCase(TestCase):
+  def setUp(self):
+    self.user = User.objects.create_user(name="a", email="owner@gdd.test", password="test_returned", object_channel="gdd")
+    self.organization = Organization.objects.create(name="test org", owner=self.user, object_channel="gdd")
+    self.address = GoogleAddress.objects.bulk_create([GoogleAddress(typed_address="Rua A", channel=Channel.objects.get(slug="gdd"))])[0]
+    self.project = Project.objects.create(name="test project", slug="test-slug", details="abc", description="abc", owner=self.user, organization=self.organization, object_channel="gdd")
+
+  def test_project_without_address(self):
+    self.assertIsNone(get_project_country_code(self.project))
+
+  def test_country_code_is_read_once_per_project(self):
+    AddressCountry.objects.create(address=self.address, country_code="AR")
+    self.project.address = self.address
+
+    self.assertEqual(get_project_country_code(self.project), "AR")
+    with self.assertNumQueries(0):
+      self.assertEqual(get_project_country_code(self.project), "AR")
+
+  def test_country_code_falls_back_to_components(self):
+    GoogleAddress.address_components.through.objects.create(googleaddress_id=self.address.pk, addresscomponent_id=create_component("BR", "country", "gdd").pk)
+    self.project.address = self.address
+
+    self.assertEqual(get_project_country_code(self.project), "BR")
+    self.assertEqual(AddressCountry.objects.get(address=self.address).country_code, "BR")
+
+  def test_address_without_country_is_not_computed_again(self):
+    AddressCountry.objects.create(address=self.address, country_code="")
+    GoogleAddress.address_components.through.objects.create(googleaddress_id=self.address.pk, addresscomponent_id=create_component("BR", "country", "gdd").pk)
+    self.project.address = self.address
+
+    with self.assertNumQueries(1):
+      self.assertIsNone(get_project_country_code(self.project))
+
+class BackfillAddressCountriesTestCase(TestCase):
+  def setUp(self):
+    channel = Channel.objects.get(slug="gdd")
+    self.addresses = GoogleAddress.objects.bulk_create([GoogleAddress(typed_address=str(i), channel=channel) for i in range(3)])
+    country = create_component("BR", "country", "gdd")
+    GoogleAddress.address_components.through.objects.bulk_create([
+      GoogleAddress.address_components.through(googleaddress_id=address.pk, addresscomponent_id=country.pk)
+      for address in self.addresses[:2]
+    ])
+
+  def test_backfill(self):
+    call_command("backfill_address_countries", "--batch-size", "2", stdout=StringIO())
+
+    codes = dict(AddressCountry.objects.values_list("address_id", "country_code"))
+    self.assertEqual(codes, {self.addresses[0].pk: "BR", self.addresses[1].pk: "BR", self.addresses[2].pk: ""})
+
+  def test_backfill_missing_only(self):
+    AddressCountry.objects.create(address=self.addresses[0], country_code="AR")
+    call_command("backfill_address_countries", "--missing-only", stdout=StringIO())
+
+    self.assertEqual(AddressCountry.objects.get(address=self.addresses[0]).country_code, "AR")
+    self.assertEqual(AddressCountry.objects.get(address=self.addresses[1]).country_code, "BR")
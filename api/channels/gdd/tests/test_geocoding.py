@@ -0,0 +1,55 @@
+import os
+import tempfile
+
+from django.test import TestCase
+
+from channels.gdd.geocoding import GeocodingCache
+from channels.gdd.geocoding import StubGeocoder
+from channels.gdd.geocoding import geocode_addresses
+from channels.gdd.geocoding import parse_google_result
+
+class FailingGeocoder(StubGeocoder):
+  def geocode(self, address):
+    raise Exception("OVER_QUERY_LIMIT")
+
+class GeocodeAddresses(TestCase):
+  def setUp(self):
+    self.path = os.path.join(tempfile.mkdtemp(), "cache.json")
+
+  def test_addresses_are_geocoded_once(self):
+    geocoder = StubGeocoder()
+    cache = GeocodingCache(self.path)
+    errors = geocode_addresses(["a", "b", "a", "c", "b"], geocoder, cache, workers=2)
+
+    self.assertEqual(errors, {})
+    self.assertEqual(sorted(geocoder.calls), ["a", "b", "c"])
+    self.assertEqual(cache.get("a")["components"][0]["short_name"], "BR")
+
+  def test_cache_is_persisted(self):
+    geocode_addresses(["a"], StubGeocoder(), GeocodingCache(self.path))
+
+    geocoder = StubGeocoder()
+    cache = GeocodingCache(self.path)
+    geocode_addresses(["a", "b"], geocoder, cache)
+    self.assertEqual(geocoder.calls, ["b"])
+
+  def test_failures_are_not_cached(self):
+    cache = GeocodingCache(self.path)
+    errors = geocode_addresses(["a"], FailingGeocoder(), cache)
+
+    self.assertEqual(errors, {"a": "OVER_QUERY_LIMIT"})
+    self.assertNotIn("a", cache)
+
+  def test_parse_google_result(self):
+    result = parse_google_result({
+      "formatted_address": "Rua A, São Paulo - SP, Brazil",
+      "geometry": {"location": {"lat": -23.5, "lng": -46.6}},
+      "address_components": [
+        {"long_name": "São Paulo", "short_name": "São Paulo", "types": ["locality", "political"]},
+        {"long_name": "São Paulo", "short_name": "SP", "types": ["administrative_area_level_1", "political"]},
+        {"long_name": "Brazil", "short_name": "BR", "types": ["country", "political"]},
+      ]
+    })
+    self.assertEqual(result["city_state"], "São Paulo, SP")
+    self.assertEqual(result["lat"], -23.5)
+    self.assertEqual(len(result["components"]), 3)
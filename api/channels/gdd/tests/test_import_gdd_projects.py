@@ -0,0 +1,190 @@
+import csv
+import json
+import os
+import tempfile
+from datetime import datetime
+from datetime import timedelta
+from io import StringIO
+
+from django.core.management import call_command
+from django.core.management.base import CommandError
+from django.test import TestCase
+
+import pytz
+
+from ovp.apps.core.models import AddressComponent
+from ovp.apps.core.models import Cause
+from ovp.apps.core.models import GoogleAddress
+from ovp.apps.projects.models import Job
+from ovp.apps.projects.models import JobDate
+from ovp.apps.projects.models import Project
+from ovp.apps.projects.models import VolunteerRole
+
+from channels.gdd.models import ImportCheckpoint
+from channels.gdd.models import ImportedRow
+from channels.gdd.management.commands.import_gdd_projects import Command
+from channels.gdd.management.commands.import_gdd_projects import REQUIRED_FIELDS
+
+class Interrupted(Exception):
+  pass
+
+class InterruptedCommand(Command):
+  """ Import failing on its second chunk """
+  chunks = 0
+
+  def _create_projects(self, entries):
+    self.chunks += 1
+    if self.chunks == 2:
+      raise Interrupted()
+    return super()._create_projects(entries)
+
+class ImportGDDProjects(TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    self.path = os.path.join(self.directory, 'projects.csv')
+    self.write_csv([self.get_row(i) for i in range(3)])
+
+  def write_csv(self, rows):
+    with open(self.path, 'w') as csv_file:
+      writer = csv.DictWriter(csv_file, fieldnames=REQUIRED_FIELDS)
+      writer.writeheader()
+      for row in rows:
+        writer.writerow(row)
+
+  def get_row(self, i):
+    return {
+      'Project: Project Name': 'Project {}'.format(i),
+      'Project Description': 'Description',
+      'Number of Participants Final': '10',
+      'Language': 'en-us',
+      'Type': 'Other',
+      'Date of GDD project(s)': '2020-04-05',
+      'Organization: Organization Name': 'Organization',
+      'C Email': 'contact@gdd.test',
+      'C First Name': 'First',
+      'C last Name': 'Last',
+      'C_phone': '123',
+      'O Street': 'Street {}'.format(i),
+      'District ': 'District',
+      'O city': 'City',
+      'O_country': 'Country',
+      'Add-on': '',
+    }
+
+  def run_import(self, *args):
+    call_command('import_gdd_projects', self.path, '--run', '--batch-size', '2',
+                 '--geocoder', 'channels.gdd.geocoding.StubGeocoder',
+                 '--geocode-cache', os.path.join(self.directory, 'cache.json'), *args, stdout=StringIO())
+
+  def test_import_is_checkpointed(self):
+    self.run_import()
+    self.assertEqual(Project.objects.filter(channel__slug='gdd').count(), 3)
+    self.assertEqual(ImportedRow.objects.count(), 3)
+
+    checkpoint = ImportCheckpoint.objects.get()
+    self.assertEqual(checkpoint.row_offset, 3)
+    self.assertIsNotNone(checkpoint.finished_date)
+
+  def test_projects_are_imported_with_roles_causes_and_job_dates(self):
+    Cause.objects.create(name='Environment', object_channel='gdd')
+    row = self.get_row(0)
+    row['Type'] = 'Environment;Other'
+    self.write_csv([row, self.get_row(1)])
+    self.run_import()
+
+    project = Project.objects.get(channel__slug='gdd', name='Project 0')
+    role = VolunteerRole.objects.get(project=project)
+    self.assertEqual((role.name, role.vacancies), ('Volunteer', 10))
+    self.assertEqual([cause.name for cause in project.causes.all()], ['Environment'])
+    self.assertEqual(Project.objects.get(channel__slug='gdd', name='Project 1').causes.count(), 0)
+
+    start_date = pytz.timezone('America/Argentina/Buenos_Aires').localize(datetime(2020, 4, 5))
+    job = Job.objects.get(project=project)
+    self.assertEqual((job.start_date, job.end_date), (start_date, start_date + timedelta(hours=24)))
+    job_date = JobDate.objects.get(job=job)
+    self.assertEqual((job_date.start_date, job_date.end_date), (job.start_date, job.end_date))
+
+  def test_geocoding_errors_stop_the_import(self):
+    with self.assertRaises(CommandError):
+      self.run_import('--geocoder', 'channels.gdd.tests.test_geocoding.FailingGeocoder')
+    self.assertEqual(Project.objects.filter(channel__slug='gdd').count(), 0)
+
+    self.run_import()
+    self.assertEqual(Project.objects.filter(channel__slug='gdd').count(), 3)
+    self.assertFalse(GoogleAddress.objects.filter(channel__slug='gdd', lat__isnull=True).exists())
+
+  def test_address_components_are_reused_across_runs(self):
+    self.run_import()
+    self.write_csv([self.get_row(i) for i in range(3, 5)])
+    self.run_import()
+    self.assertEqual(AddressComponent.objects.filter(channel__slug='gdd', short_name='BR').count(), 1)
+
+  def test_interrupted_import_resumes_from_checkpoint(self):
+    self.write_csv([self.get_row(i) for i in range(5)])
+    with self.assertRaises(Interrupted):
+      call_command(InterruptedCommand(), self.path, '--run', '--batch-size', '2',
+                   '--geocoder', 'channels.gdd.geocoding.StubGeocoder',
+                   '--geocode-cache', os.path.join(self.directory, 'cache.json'), stdout=StringIO())
+    self.assertEqual(Project.objects.filter(channel__slug='gdd').count(), 2)
+    self.assertEqual(ImportCheckpoint.objects.get().row_offset, 2)
+
+    out = StringIO()
+    call_command('import_gdd_projects', self.path, '--run', '--batch-size', '2',
+                 '--geocoder', 'channels.gdd.geocoding.StubGeocoder',
+                 '--geocode-cache', os.path.join(self.directory, 'cache.json'), stdout=out)
+    self.assertIn('Resuming from row 2', out.getvalue())
+    self.assertEqual(
+      sorted(Project.objects.filter(channel__slug='gdd').values_list('name', flat=True)),
+      ['Project {}'.format(i) for i in range(5)]
+    )
+    self.assertEqual(ImportedRow.objects.count(), 5)
+    self.assertIsNotNone(ImportCheckpoint.objects.get().finished_date)
+
+  def test_rerun_does_not_duplicate_projects(self):
+    self.run_import()
+    self.run_import('--restart')
+    self.assertEqual(Project.objects.filter(channel__slug='gdd').count(), 3)
+
+  def test_dry_run_validates_without_writing(self):
+    out = StringIO()
+    with self.assertNumQueries(3):
+      call_command('import_gdd_projects', self.path, stdout=out)
+
+    report = json.loads(out.getvalue())
+    self.assertEqual(report['rows'], 3)
+    self.assertEqual(report['new_users'], 1)
+    self.assertEqual(report['new_organizations'], 1)
+    self.assertEqual(report['errors'], [])
+
+  def test_dry_run_reports_errors(self):
+    row = self.get_row(0)
+    row.update({'Language': 'xx', 'Type': 'Unknown', 'Number of Participants Final': 'ten', 'Date of GDD project(s)': 'someday'})
+    self.write_csv([self.get_row(1), row])
+    report_path = os.path.join(self.directory, 'report.json')
+
+    with self.assertRaises(CommandError):
+      call_command('import_gdd_projects', self.path, '--report', report_path, stdout=StringIO())
+
+    with open(report_path) as report_file:
+      report = json.load(report_file)
+    self.assertEqual(set(error['row'] for error in report['errors']), {3})
+    self.assertEqual(
+      sorted(error['field'] for error in report['errors']),
+      ['Date of GDD project(s)', 'Language', 'Number of Participants Final', 'Type']
+    )
+
+  def test_dry_run_reports_truncated_rows(self):
+    self.write_csv([self.get_row(0)])
+    with open(self.path, 'a') as csv_file:
+      csv_file.write('Project 1,Description,10\n')
+    report_path = os.path.join(self.directory, 'report.json')
+
+    with self.assertRaises(CommandError):
+      call_command('import_gdd_projects', self.path, '--report', report_path, stdout=StringIO())
+
+    with open(report_path) as report_file:
+      report = json.load(report_file)
+    self.assertEqual(report['rows'], 2)
+    self.assertEqual(set(error['row'] for error in report['errors']), {3})
+    self.assertEqual(sorted(error['field'] for error in report['errors']), sorted(REQUIRED_FIELDS[3:]))
+    self.assertTrue(all(error['value'] is None for error in report['errors']))
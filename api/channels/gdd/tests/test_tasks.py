@@ -1,11 +1,16 @@
 from datetime import timedelta
 
+from django.contrib.auth.models import Group
+from django.db import transaction
 from django.test import TestCase
+from django.test import TransactionTestCase
 from django.test.utils import override_settings
 from django.utils import timezone
 from django.core import mail
 
+from ovp.apps.channels.models import Channel
 from ovp.apps.core.helpers import get_email_subject
+from ovp.apps.core.models import GoogleAddress
 from ovp.apps.users.models import User
 from ovp.apps.organizations.models import Organization
 from ovp.apps.projects.models import Project
@@ -13,6 +18,7 @@ from ovp.apps.projects.models import Apply
 from ovp.apps.projects.models import Job
 from ovp.apps.projects.models import Work
 
+from channels.gdd.models import AddressCountry
 from server.celery import app
 
 @override_settings(DEFAULT_SEND_EMAIL="sync",
@@ -76,4 +82,50 @@ class TestEmailTriggers(TestCase):
 
     self.assertTrue(len(mail.outbox) == 3)
     self.assertTrue(mail.outbox[2].subject == "Tá na hora de contar pra gente como foi")
-    self.assertTrue(">test project<" in mail.outbox[2].alternatives[0][0])
\ No newline at end of file
+    self.assertTrue(">test project<" in mail.outbox[2].alternatives[0][0])
+
+class Rollback(Exception):
+  pass
+
+@override_settings(DEFAULT_SEND_EMAIL="sync",
+                    CELERY_TASK_EAGER_PROPAGATES_EXCEPTIONS=True,
+                    CELERY_TASK_ALWAYS_EAGER=True)
+class TestCountryManagerNotification(TransactionTestCase):
+  # Notifications are dispatched on commit, which TestCase never does
+  serialized_rollback = True
+
+  def setUp(self):
+    channel = Channel.objects.get(slug="gdd")
+    self.user = User.objects.create_user(name="a", email="owner@gdd.test", password="test_returned", object_channel="gdd")
+    self.organization = Organization.objects.create(name="test org", owner=self.user, object_channel="gdd")
+    self.address = GoogleAddress.objects.bulk_create([GoogleAddress(typed_address="Rua A, São Paulo", channel=channel)])[0]
+    AddressCountry.objects.create(address=self.address, country_code="BR")
+
+    manager = User.objects.create_user(name="br", email="manager-br@gdd.test", password="test_returned", object_channel="gdd")
+    manager.groups.add(Group.objects.create(name="mng-br"))
+    other_manager = User.objects.create_user(name="ar", email="manager-ar@gdd.test", password="test_returned", object_channel="gdd")
+    other_manager.groups.add(Group.objects.create(name="mng-ar"))
+
+  def create_project(self):
+    return Project.objects.create(name="test project", slug="test-slug", details="abc", description="abc", owner=self.user, organization=self.organization, address=self.address, object_channel="gdd")
+
+  def get_recipients(self):
+    return [address for message in mail.outbox for address in message.to]
+
+  def test_managers_of_the_project_country_are_notified_on_commit(self):
+    mail.outbox = []
+    with transaction.atomic():
+      self.create_project()
+      self.assertNotIn("manager-br@gdd.test", self.get_recipients())
+
+    self.assertIn("manager-br@gdd.test", self.get_recipients())
+    self.assertNotIn("manager-ar@gdd.test", self.get_recipients())
+
+  def test_managers_are_not_notified_on_rollback(self):
+    mail.outbox = []
+    with self.assertRaises(Rollback):
+      with transaction.atomic():
+        self.create_project()
+        raise Rollback()
+
+    self.assertNotIn("manager-br@gdd.test", self.get_recipients())
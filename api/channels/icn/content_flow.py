@@ -2,26 +2,21 @@ from haystack.query import SQ
 from django.db.models import Q
 from ovp.apps.core.models import Cause
 from ovp.apps.core.models import Skill
-from ovp.apps.projects.models import Category
 from ovp.apps.projects.models import Project
-from ovp.apps.projects.models import Apply
 from ovp.apps.organizations.models import Organization
 
-from ovp.apps.channels.content_flow import BaseContentFlow
 from ovp.apps.channels.content_flow import NoContentFlow
 from ovp.apps.channels.content_flow import CFM
 
-class ICNContentFlow(BaseContentFlow):
+from channels.content_flow import CategoryContentFlow
+
+class ICNContentFlow(CategoryContentFlow):
   source = "default"
   destination = "icn"
 
-  def __init__(self):
-    try:
-      self.category_id = Category.objects.get(slug="instituto-center-norte").pk
-    except:
-      self.category_id = None
+  category_slug = "instituto-center-norte"
 
-  def get_filter_searchqueryset_q_obj(self, model_class):
+  def build_filter_searchqueryset_q_obj(self, model_class):
     if model_class == Project:
       return SQ(organization_categories=self.category_id)
 
@@ -30,16 +25,18 @@ class ICNContentFlow(BaseContentFlow):
 
     raise NoContentFlow
 
-  def get_filter_queryset_q_obj(self, model_class):
-    if model_class in [Cause, Skill]:
-      return Q()
-    elif model_class == Project:
+  def get_membership_q_obj(self, model_class):
+    if model_class == Project:
       return Q(organization__categories=self.category_id)
     elif model_class == Organization:
       return Q(categories=self.category_id)
-    elif model_class == Apply:
-      return Q(project__organization__categories=self.category_id)
 
     raise NoContentFlow
 
+  def build_filter_queryset_q_obj(self, model_class):
+    if model_class in [Cause, Skill]:
+      return Q()
+
+    return super().build_filter_queryset_q_obj(model_class)
+
 CFM.add_flow(ICNContentFlow())
@@ -0,0 +1,404 @@
+"""
+Request metrics per channel, view, method and status
+
+MetricsMiddleware records request latency, database query counts and
+database time into the registry of each process. Processes write their
+registry to METRICS_DIR every METRICS_FLUSH_INTERVAL seconds, so the
+metrics endpoint and the dump_metrics command report every worker.
+
+Files are named after the process id and start time, so a process reusing
+the id of an exited one doesn't overwrite its counts. Files of exited
+processes are added to metrics-exited.json when collecting, so totals
+never go backwards and files don't pile up.
+
+Clearing writes the time of the reset to RESET_FILE. Processes started
+counting before it reset their registry before flushing again.
+"""
+import atexit
+import fcntl
+import glob
+import json
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.http import Http404
+from django.http import HttpResponse
+from django.http import HttpResponseForbidden
+from django.utils.crypto import constant_time_compare
+
+LATENCY_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 5, 10, 25, 50, 100, 250)
+LABELS = ("channel", "view", "method", "status")
+PROCESS_FILE_RE = re.compile(r"metrics-(?P<pid>\d+)-(?P<token>\w+)\.json$")
+EXITED_FILE = "metrics-exited.json"
+RESET_FILE = "metrics-reset"
+
+
+def _new_entry():
+  return {
+    "count": 0,
+    "duration_sum": 0.0,
+    "duration_buckets": [0] * (len(LATENCY_BUCKETS) + 1),
+    "queries_sum": 0,
+    "queries_buckets": [0] * (len(QUERY_BUCKETS) + 1),
+    "db_duration_sum": 0.0,
+  }
+
+
+def _bucket(buckets, value):
+  for i, bound in enumerate(buckets):
+    if value <= bound:
+      return i
+  return len(buckets)
+
+
+def merge(*snapshots):
+  """
+  Add snapshots up, entry by entry
+  """
+  merged = {}
+  for snapshot in snapshots:
+    for key, entry in snapshot.items():
+      total = merged.setdefault(key, _new_entry())
+      for name, value in entry.items():
+        if isinstance(value, list):
+          total[name] = [a + b for a, b in zip(total[name], value)]
+        else:
+          total[name] += value
+  return merged
+
+
+def get_start_token(pid):
+  """
+  Return the start time of a process from /proc, None when unknown
+  """
+  try:
+    with open("/proc/{}/stat".format(pid)) as f:
+      # Fields after the command name, which may contain spaces
+      return f.read().rsplit(")", 1)[1].split()[19]
+  except (OSError, IndexError):
+    return None
+
+
+def is_running(pid, token):
+  try:
+    os.kill(pid, 0)
+  except ProcessLookupError:
+    return False
+  except PermissionError:
+    pass
+
+  current = get_start_token(pid)
+  return current is None or current == token
+
+
+def _read(path, since=0):
+  """
+  Return the data of a file, None when it was written before since
+  """
+  try:
+    with open(path) as f:
+      if os.fstat(f.fileno()).st_mtime < since:
+        return None
+      return json.load(f)
+  except (OSError, ValueError):
+    # Removed or being replaced by its process
+    return None
+
+
+def _write(path, data):
+  fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+  with os.fdopen(fd, "w") as f:
+    json.dump(data, f)
+  os.replace(tmp_path, path)
+
+
+@contextmanager
+def _locked():
+  """
+  Hold the lock of METRICS_DIR
+  """
+  os.makedirs(settings.METRICS_DIR, exist_ok=True)
+  with open(os.path.join(settings.METRICS_DIR, ".lock"), "w") as lock:
+    fcntl.flock(lock, fcntl.LOCK_EX)
+    yield
+
+
+def get_reset_time():
+  """
+  Return when metrics of every process were last cleared, 0 when never
+  """
+  return _read(os.path.join(settings.METRICS_DIR, RESET_FILE)) or 0
+
+
+class MetricsRegistry():
+  """
+  Metrics of this process, keyed by "channel|view|method|status"
+  """
+  def __init__(self):
+    self._entries = {}
+    self._lock = threading.Lock()
+    self._pending = False
+    self._flusher_pid = None
+    self._token = None
+    self._token_pid = None
+    self._started = time.time()
+
+  def observe(self, channel, view, method, status, duration, queries, db_duration):
+    key = "|".join(str(label) for label in (channel, view, method, status))
+    with self._lock:
+      entry = self._entries.get(key)
+      if entry is None:
+        entry = self._entries[key] = _new_entry()
+      entry["count"] += 1
+      entry["duration_sum"] += duration
+      entry["duration_buckets"][_bucket(LATENCY_BUCKETS, duration)] += 1
+      entry["queries_sum"] += queries
+      entry["queries_buckets"][_bucket(QUERY_BUCKETS, queries)] += 1
+      entry["db_duration_sum"] += db_duration
+      self._pending = True
+
+    self._start_flusher()
+
+  def _start_flusher(self):
+    """
+    Flush from a thread of each process, idle ones included. Threads don't
+    survive forks, so one is started by the first observation of a process.
+    """
+    if self._flusher_pid == os.getpid():
+      return
+    self._flusher_pid = os.getpid()
+    threading.Thread(target=self._flush_periodically, name="metrics-flush", daemon=True).start()
+
+  def _flush_periodically(self):
+    pid = os.getpid()
+    while self._flusher_pid == pid:
+      time.sleep(getattr(settings, "METRICS_FLUSH_INTERVAL", 10))
+      self.flush_pending()
+
+  def snapshot(self):
+    with self._lock:
+      return json.loads(json.dumps(self._entries))
+
+  def reset(self):
+    with self._lock:
+      self._entries = {}
+      self._pending = False
+      self._started = time.time()
+
+  def reset_if_cleared(self):
+    """
+    Reset this process' metrics when every process' were cleared since it
+    started counting
+    """
+    if get_reset_time() > self._started:
+      self.reset()
+
+  def get_token(self):
+    if self._token_pid != os.getpid():
+      self._token_pid = os.getpid()
+      self._token = get_start_token(self._token_pid) or uuid.uuid4().hex
+    return self._token
+
+  def get_path(self, pid=None):
+    if pid is None:
+      pid, token = os.getpid(), self.get_token()
+    else:
+      token = get_start_token(pid) or "0"
+    return os.path.join(settings.METRICS_DIR, "metrics-{}-{}.json".format(pid, token))
+
+  def flush(self):
+    """
+    Write this process' metrics to METRICS_DIR
+    """
+    with self._lock:
+      self._pending = False
+    if not getattr(settings, "METRICS_DIR", None):
+      return
+
+    os.makedirs(settings.METRICS_DIR, exist_ok=True)
+    self.reset_if_cleared()
+    _write(self.get_path(), self.snapshot())
+
+  def flush_pending(self):
+    """
+    Flush when metrics were observed since the last flush
+    """
+    if self._pending:
+      self.flush()
+
+  def _prune(self, paths, since):
+    """
+    Add files of exited processes written since the last reset to
+    EXITED_FILE and remove them, returning the files left
+    """
+    exited = []
+    running = []
+    for path in paths:
+      match = PROCESS_FILE_RE.search(os.path.basename(path))
+      if match and not is_running(int(match.group("pid")), match.group("token")):
+        exited.append(path)
+      else:
+        running.append(path)
+
+    if exited:
+      exited_path = os.path.join(settings.METRICS_DIR, EXITED_FILE)
+      snapshots = [_read(path, since) for path in [exited_path] + exited]
+      _write(exited_path, merge(*[snapshot for snapshot in snapshots if snapshot]))
+      for path in exited:
+        os.remove(path)
+    return running
+
+  def collect(self):
+    """
+    Return the metrics of every process, this one up to date
+    """
+    if not getattr(settings, "METRICS_DIR", None):
+      return merge(self.snapshot())
+
+    skipped = (self.get_path(), os.path.join(settings.METRICS_DIR, EXITED_FILE))
+    # Processes collecting at once would add exited files twice
+    with _locked():
+      self.reset_if_cleared()
+      snapshots = [self.snapshot()]
+      # Files written before the reset by processes which hadn't seen it yet
+      # are left out
+      since = get_reset_time()
+      paths = [path for path in glob.glob(os.path.join(settings.METRICS_DIR, "metrics-*.json")) if path not in skipped]
+      for path in self._prune(paths, since) + [skipped[1]]:
+        snapshot = _read(path, since)
+        if snapshot:
+          snapshots.append(snapshot)
+    return merge(*snapshots)
+
+  def clear(self):
+    """
+    Drop metrics of every process
+
+    Other processes keep theirs in memory until they find RESET_FILE
+    before their next flush.
+    """
+    if not getattr(settings, "METRICS_DIR", None):
+      self.reset()
+      return
+
+    with _locked():
+      _write(os.path.join(settings.METRICS_DIR, RESET_FILE), time.time())
+      self.reset()
+      for path in glob.glob(os.path.join(settings.METRICS_DIR, "metrics-*.json")):
+        os.remove(path)
+
+registry = MetricsRegistry()
+atexit.register(registry.flush)
+
+
+def _format_labels(key, **extra):
+  labels = OrderedDict(zip(LABELS, key.split("|", 3)))
+  labels.update(extra)
+  return ",".join('{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"')) for name, value in labels.items())
+
+
+def _format_histogram(lines, name, key, buckets, counts, total):
+  cumulative = 0
+  for bound, count in zip(list(buckets) + ["+Inf"], counts):
+    cumulative += count
+    lines.append("{}_bucket{{{}}} {}".format(name, _format_labels(key, le=bound), cumulative))
+  lines.append("{}_sum{{{}}} {}".format(name, _format_labels(key), total))
+  lines.append("{}_count{{{}}} {}".format(name, _format_labels(key), cumulative))
+
+
+def render_prometheus(metrics):
+  """
+  Return metrics in the Prometheus text exposition format
+  """
+  lines = [
+    "# HELP http_request_duration_seconds Request latency",
+    "# TYPE http_request_duration_seconds histogram",
+  ]
+  for key in sorted(metrics):
+    entry = metrics[key]
+    _format_histogram(lines, "http_request_duration_seconds", key, LATENCY_BUCKETS, entry["duration_buckets"], entry["duration_sum"])
+
+  lines += [
+    "# HELP http_request_db_queries Database queries per request",
+    "# TYPE http_request_db_queries histogram",
+  ]
+  for key in sorted(metrics):
+    entry = metrics[key]
+    _format_histogram(lines, "http_request_db_queries", key, QUERY_BUCKETS, entry["queries_buckets"], entry["queries_sum"])
+
+  lines += [
+    "# HELP http_request_db_duration_seconds_total Time spent in database queries",
+    "# TYPE http_request_db_duration_seconds_total counter",
+  ]
+  for key in sorted(metrics):
+    lines.append("http_request_db_duration_seconds_total{{{}}} {}".format(_format_labels(key), metrics[key]["db_duration_sum"]))
+
+  return "\n".join(lines) + "\n"
+
+
+def estimate_quantile(buckets, counts, q):
+  """
+  Estimate a quantile from histogram buckets, interpolating linearly
+  inside the bucket as Prometheus' histogram_quantile does
+  """
+  total = sum(counts)
+  if not total:
+    return None
+
+  rank = q * total
+  cumulative = 0
+  lower = 0
+  for bound, count in zip(buckets, counts):
+    if cumulative + count >= rank:
+      return lower + (bound - lower) * ((rank - cumulative) / count if count else 0)
+    cumulative += count
+    lower = bound
+  return buckets[-1]
+
+
+def summarize(metrics):
+  """
+  Return one row per channel, view, method and status, slowest overall
+  first
+  """
+  rows = []
+  for key, entry in metrics.items():
+    count = entry["count"]
+    if not count:
+      continue
+    row = OrderedDict(zip(LABELS, key.split("|", 3)))
+    row.update([
+      ("count", count),
+      ("total_s", entry["duration_sum"]),
+      ("mean_ms", entry["duration_sum"] / count * 1000),
+      ("p95_ms", estimate_quantile(LATENCY_BUCKETS, entry["duration_buckets"], 0.95) * 1000),
+      ("queries", entry["queries_sum"] / count),
+      ("db_ms", entry["db_duration_sum"] / count * 1000),
+    ])
+    rows.append(row)
+  return sorted(rows, key=lambda row: row["total_s"], reverse=True)
+
+
+def metrics_view(request):
+  """
+  Metrics of every process for Prometheus
+
+  Requires "Authorization: Bearer <METRICS_TOKEN>". Without METRICS_TOKEN
+  the endpoint only exists in DEBUG.
+  """
+  token = getattr(settings, "METRICS_TOKEN", None)
+  if not token:
+    if not settings.DEBUG:
+      raise Http404
+  elif not constant_time_compare(request.META.get("HTTP_AUTHORIZATION", ""), "Bearer {}".format(token)):
+    return HttpResponseForbidden()
+
+  return HttpResponse(render_prometheus(registry.collect()), content_type="text/plain; version=0.0.4; charset=utf-8")
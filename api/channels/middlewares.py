@@ -0,0 +1,95 @@
+import threading
+import time
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.db import connections
+
+from channels.metrics import registry
+
+_state = threading.local()
+
+
+def get_current_channel():
+  """
+  Return the channel of the request being processed by this thread
+  """
+  return getattr(_state, "channel", None)
+
+
+class CurrentChannelMiddleware():
+  """
+  Make the request channel available to code without access to the
+  request, such as search backends
+
+  Must come after ChannelRecognizerMiddleware, which sets request.channel.
+  """
+  def __init__(self, get_response):
+    self.get_response = get_response
+
+  def __call__(self, request):
+    _state.channel = getattr(request, "channel", None)
+    try:
+      return self.get_response(request)
+    finally:
+      _state.channel = None
+
+
+class QueryTimer():
+  """
+  Database execute wrapper counting and timing queries
+  """
+  def __init__(self):
+    self.count = 0
+    self.duration = 0.0
+
+  def __call__(self, execute, sql, params, many, context):
+    started = time.perf_counter()
+    try:
+      return execute(sql, params, many, context)
+    finally:
+      self.count += 1
+      self.duration += time.perf_counter() - started
+
+
+def get_view_name(request):
+  resolver_match = getattr(request, "resolver_match", None)
+  if resolver_match is None:
+    return "<unresolved>"
+  return resolver_match.view_name
+
+
+class MetricsMiddleware():
+  """
+  Record latency and database queries of every request per channel, view,
+  method and status, see channels.metrics
+
+  Comes right after StatsMiddleware, so it measures what it measures.
+  """
+  methods = {"GET", "HEAD", "POST", "PUT", "PATCH", "DELETE", "OPTIONS"}
+
+  def __init__(self, get_response):
+    self.get_response = get_response
+
+  def __call__(self, request):
+    if not getattr(settings, "METRICS_ENABLED", True):
+      return self.get_response(request)
+
+    timer = QueryTimer()
+    started = time.perf_counter()
+    with ExitStack() as stack:
+      for connection in connections.all():
+        stack.enter_context(connection.execute_wrapper(timer))
+      response = self.get_response(request)
+    duration = time.perf_counter() - started
+
+    registry.observe(
+      channel=getattr(request, "channel", None) or "-",
+      view=get_view_name(request),
+      method=request.method if request.method in self.methods else "OTHER",
+      status=response.status_code,
+      duration=duration,
+      queries=timer.count,
+      db_duration=timer.duration,
+    )
+    return response
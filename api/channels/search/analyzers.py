@@ -0,0 +1,114 @@
+"""
+Elasticsearch analysis profiles
+
+Haystack maps text fields to the "snowball" analyzer, EdgeNgramField to
+"edgengram_analyzer" and NgramField to "ngram_analyzer". Profiles keep
+those names and change what they do, so indexes don't need changes.
+"""
+import copy
+
+FILTERS = {
+  "haystack_ngram": {
+    "type": "nGram",
+    "min_gram": 3,
+    "max_gram": 15
+  },
+  "haystack_edgengram": {
+    "type": "edgeNGram",
+    "min_gram": 2,
+    "max_gram": 15
+  },
+  "shingle": {
+    "type": "shingle",
+    "min_shingle_size": 2,
+    "max_shingle_size": 3
+  },
+  "portuguese_stop": {
+    "type": "stop",
+    "stopwords": "_portuguese_"
+  },
+  "portuguese_stemmer": {
+    "type": "stemmer",
+    "language": "light_portuguese"
+  },
+  "spanish_stop": {
+    "type": "stop",
+    "stopwords": "_spanish_"
+  },
+  "spanish_stemmer": {
+    "type": "stemmer",
+    "language": "light_spanish"
+  },
+}
+
+TOKENIZERS = {
+  "haystack_ngram_tokenizer": {
+    "type": "nGram",
+    "min_gram": 3,
+    "max_gram": 15,
+  },
+  "haystack_edgengram_tokenizer": {
+    "type": "edgeNGram",
+    "min_gram": 2,
+    "max_gram": 15,
+    "side": "front"
+  }
+}
+
+def _analyzer(*filters):
+  return {
+    "type": "custom",
+    "tokenizer": "standard",
+    "filter": list(filters)
+  }
+
+EDGENGRAM = _analyzer("haystack_edgengram", "lowercase", "asciifolding")
+
+PROFILES = {
+  # n-grams of 3 to 15 characters on n-gram fields, the original settings
+  "ngram": {
+    "ngram_analyzer": _analyzer("haystack_ngram"),
+    "edgengram_analyzer": EDGENGRAM,
+    "snowball": _analyzer("lowercase", "asciifolding"),
+  },
+  # Prefixes only, a fraction of the terms of full n-grams
+  "edgengram": {
+    "ngram_analyzer": EDGENGRAM,
+    "edgengram_analyzer": EDGENGRAM,
+    "snowball": _analyzer("lowercase", "asciifolding"),
+  },
+  # Prefixes on names, word pairs and triples on full text for phrase matches
+  "shingle": {
+    "ngram_analyzer": EDGENGRAM,
+    "edgengram_analyzer": EDGENGRAM,
+    "snowball": _analyzer("lowercase", "asciifolding", "shingle"),
+  },
+  "portuguese": {
+    "ngram_analyzer": EDGENGRAM,
+    "edgengram_analyzer": EDGENGRAM,
+    "snowball": _analyzer("lowercase", "portuguese_stop", "portuguese_stemmer", "asciifolding"),
+  },
+  "spanish": {
+    "ngram_analyzer": EDGENGRAM,
+    "edgengram_analyzer": EDGENGRAM,
+    "snowball": _analyzer("lowercase", "spanish_stop", "spanish_stemmer", "asciifolding"),
+  },
+}
+
+
+def get_index_settings(profile):
+  """
+  Return ELASTICSEARCH_INDEX_SETTINGS for an analysis profile
+  """
+  if profile not in PROFILES:
+    raise ValueError("Unknown analysis profile {}, expected one of {}".format(profile, ", ".join(sorted(PROFILES))))
+
+  return {
+    "settings": {
+      "analysis": {
+        "analyzer": copy.deepcopy(PROFILES[profile]),
+        "tokenizer": copy.deepcopy(TOKENIZERS),
+        "filter": copy.deepcopy(FILTERS),
+      }
+    }
+  }
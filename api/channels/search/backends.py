@@ -0,0 +1,209 @@
+import hashlib
+import threading
+from collections import Counter
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.cache import caches
+from haystack import connections
+from haystack.backends.whoosh_backend import WhooshEngine
+from haystack.backends.whoosh_backend import WhooshSearchBackend
+from haystack.constants import ID
+from haystack.exceptions import SkipDocument
+from ovp.apps.search.backends import ConfigurableElasticSearchEngine
+from whoosh.writing import AsyncWriter
+
+from channels.middlewares import get_current_channel
+
+_search_cache_stats = defaultdict(Counter)
+_search_cache_stats_lock = threading.Lock()
+
+
+def get_search_cache_stats():
+  """
+  Return search cache hits, misses and hit ratio per channel
+  """
+  with _search_cache_stats_lock:
+    stats = {channel: dict(counter) for channel, counter in _search_cache_stats.items()}
+
+  for counter in stats.values():
+    total = counter.get("hits", 0) + counter.get("misses", 0)
+    counter["ratio"] = counter.get("hits", 0) / total if total else 0
+  return stats
+
+
+def reset_search_cache_stats():
+  with _search_cache_stats_lock:
+    _search_cache_stats.clear()
+
+
+def _normalize(value):
+  if isinstance(value, dict):
+    return sorted((repr(_normalize(k)), _normalize(v)) for k, v in value.items())
+  if isinstance(value, (set, frozenset)):
+    return sorted(repr(_normalize(item)) for item in value)
+  if isinstance(value, (list, tuple)):
+    return [_normalize(item) for item in value]
+  if isinstance(value, type):
+    return "{}.{}".format(value.__module__, value.__qualname__)
+  return value
+
+
+class CachedSearchBackendMixin():
+  """
+  Search backend caching results for SEARCH_CACHE_TTL seconds
+
+  Results are keyed by query string and search arguments, which hold the
+  channel and content flow filters and the requested page. Each indexed
+  model has a cache generation, in the SEARCH_CACHE_ALIAS cache shared by
+  every process. Writing objects of a model to the index starts a new
+  generation of that model, so results never outlive a change to the
+  models they were searched in, while searches in other models stay
+  cached.
+  """
+  def get_search_cache(self):
+    return caches[getattr(settings, "SEARCH_CACHE_ALIAS", "default")]
+
+  def get_generation_key(self, label):
+    return "search-cache-generation:{}:{}".format(self.connection_alias, label)
+
+  def get_labels(self, models=None):
+    if not models:
+      models = connections[self.connection_alias].get_unified_index().get_indexed_models()
+    return sorted(model._meta.label_lower for model in models)
+
+  def get_search_cache_key(self, cache, query_string, kwargs):
+    keys = [self.get_generation_key(label) for label in self.get_labels(kwargs.get("models"))]
+    generations = cache.get_many(keys)
+    generation = ".".join(str(generations.get(key, 0)) for key in keys)
+    query_string = " ".join(query_string.split())
+    digest = hashlib.sha1(repr((query_string, _normalize(kwargs))).encode("utf-8")).hexdigest()
+    return "search-cache:{}:{}:{}".format(self.connection_alias, generation, digest)
+
+  def invalidate_search_cache(self, labels=None):
+    """
+    Start a new generation for some model labels, every indexed model by
+    default
+    """
+    cache = self.get_search_cache()
+    for label in labels or self.get_labels():
+      try:
+        cache.incr(self.get_generation_key(label))
+      except ValueError:
+        cache.set(self.get_generation_key(label), 1, None)
+
+  def search(self, query_string, **kwargs):
+    ttl = getattr(settings, "SEARCH_CACHE_TTL", 0)
+    if not ttl:
+      return super().search(query_string, **kwargs)
+
+    cache = self.get_search_cache()
+    key = self.get_search_cache_key(cache, query_string, kwargs)
+    results = cache.get(key)
+
+    with _search_cache_stats_lock:
+      _search_cache_stats[get_current_channel() or "-"]["hits" if results is not None else "misses"] += 1
+
+    if results is None:
+      results = super().search(query_string, **kwargs)
+      cache.set(key, results, ttl)
+    return results
+
+  def update(self, index, *args, **kwargs):
+    try:
+      return super().update(index, *args, **kwargs)
+    finally:
+      self.invalidate_search_cache([index.get_model()._meta.label_lower])
+
+  def remove(self, obj_or_string, *args, **kwargs):
+    try:
+      return super().remove(obj_or_string, *args, **kwargs)
+    finally:
+      if isinstance(obj_or_string, str):
+        # "app_label.model_name.pk"
+        self.invalidate_search_cache([obj_or_string.rsplit(".", 1)[0]])
+      else:
+        self.invalidate_search_cache([obj_or_string._meta.label_lower])
+
+  def clear(self, models=None, *args, **kwargs):
+    try:
+      return super().clear(models, *args, **kwargs)
+    finally:
+      self.invalidate_search_cache(self.get_labels(models))
+
+
+def cached_backend(backend_class):
+  return type("Cached{}".format(backend_class.__name__), (CachedSearchBackendMixin, backend_class), {})
+
+
+class PersistentWhooshSearchBackend(WhooshSearchBackend):
+  """
+  Whoosh backend for deployments without Elasticsearch
+
+  Updates are committed every COMMIT_BATCH_SIZE documents instead of once
+  at the end, so a long update keeps what it indexed so far and doesn't
+  hold every pending document in memory. Batches large enough are written
+  by PROCS processes, each writing its own segment.
+  """
+  min_documents_per_proc = 100
+  lock_timeout = 30.0
+
+  def __init__(self, connection_alias, **connection_options):
+    super().__init__(connection_alias, **connection_options)
+    self.procs = int(connection_options.get("PROCS", 1))
+    self.commit_batch_size = int(connection_options.get("COMMIT_BATCH_SIZE", 1000))
+    self.limitmb = int(connection_options.get("LIMITMB", 128))
+
+  def get_writer(self, size):
+    if self.use_file_storage and self.procs > 1 and size >= self.procs * self.min_documents_per_proc:
+      return self.index.writer(procs=self.procs, multisegment=True, limitmb=self.limitmb, timeout=self.lock_timeout)
+    return AsyncWriter(self.index)
+
+  def write(self, index, documents):
+    writer = self.get_writer(len(documents))
+    for document in documents:
+      try:
+        writer.update_document(**document)
+      except Exception as e:
+        if not self.silently_fail:
+          raise
+
+        self.log.error("%s while preparing object for update", e.__class__.__name__,
+                       exc_info=True, extra={"data": {"index": index, "object": document[ID]}})
+
+    writer.commit()
+    if getattr(writer, "ident", None) is not None:
+      writer.join()
+
+  def update(self, index, iterable, commit=True):
+    if not self.setup_complete:
+      self.setup()
+
+    self.index = self.index.refresh()
+    documents = []
+    for obj in iterable:
+      try:
+        document = index.full_prepare(obj)
+      except SkipDocument:
+        self.log.debug("Indexing for object `%s` skipped", obj)
+        continue
+
+      documents.append({key: self._from_python(value) for key, value in document.items() if key != "boost"})
+      if len(documents) >= self.commit_batch_size:
+        self.write(index, documents)
+        documents = []
+
+    if documents:
+      self.write(index, documents)
+
+
+class PersistentWhooshEngine(WhooshEngine):
+  backend = PersistentWhooshSearchBackend
+
+
+class CachedConfigurableElasticSearchEngine(ConfigurableElasticSearchEngine):
+  backend = cached_backend(ConfigurableElasticSearchEngine.backend)
+
+
+class CachedWhooshEngine(PersistentWhooshEngine):
+  backend = cached_backend(PersistentWhooshSearchBackend)
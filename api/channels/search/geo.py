@@ -0,0 +1,193 @@
+"""
+Distance search on project and organization addresses
+
+Elasticsearch indexes addresses as a geo_point and sorts by distance.
+Other search backends, such as Whoosh, search the database instead: a
+bounding box on the lat/lng index narrows addresses down before distances
+are computed. So do Elasticsearch indexes built before the geo_point was
+mapped, until rebuild_search_index rebuilds them.
+"""
+import logging
+import math
+import time
+
+from django.db.models import F
+from django.db.models import FloatField
+from django.db.models import ExpressionWrapper
+from django.db.models import Value
+from django.db.models.functions import ACos
+from django.db.models.functions import Cos
+from django.db.models.functions import Least
+from django.db.models.functions import Radians
+from django.db.models.functions import Sin
+from elasticsearch.exceptions import NotFoundError
+from haystack import indexes
+from haystack.constants import DJANGO_CT
+from haystack.constants import DJANGO_ID
+from haystack.utils import get_model_ct
+
+EARTH_RADIUS_KM = 6371.0
+LOCATION_FIELD = "location"
+LOCATION_CHECK_TTL = 300
+
+# Elasticsearch refuses pages past index.max_result_window
+MAX_RESULT_WINDOW = 10000
+MAX_PAGES = 3
+
+logger = logging.getLogger(__name__)
+
+
+class GeoPointField(indexes.SearchField):
+  """
+  "lat,lng" indexed as a geo_point
+
+  Unlike haystack's LocationField values aren't converted to GEOS points,
+  which need the GEOS library installed.
+  """
+  field_type = "location"
+
+  def convert(self, value):
+    return value
+
+
+def get_location(address):
+  """
+  Return an address as "lat,lng", or None when it wasn't geocoded
+  """
+  if address is None or address.lat is None or address.lng is None:
+    return None
+  return "{},{}".format(address.lat, address.lng)
+
+
+def haversine(lat1, lng1, lat2, lng2):
+  """
+  Return the great-circle distance between two points in km
+  """
+  lat1, lng1, lat2, lng2 = map(math.radians, (lat1, lng1, lat2, lng2))
+  a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lng2 - lng1) / 2) ** 2
+  return 2 * EARTH_RADIUS_KM * math.asin(min(1, math.sqrt(a)))
+
+
+def bounding_box(lat, lng, radius_km):
+  """
+  Return (min_lat, max_lat, min_lng, max_lng) around every point within
+  radius_km. Boxes reaching a pole or crossing the antimeridian span all
+  longitudes.
+  """
+  angle = radius_km / EARTH_RADIUS_KM
+  min_lat = max(-90.0, lat - math.degrees(angle))
+  max_lat = min(90.0, lat + math.degrees(angle))
+
+  if min_lat == -90.0 or max_lat == 90.0 or math.sin(angle) >= math.cos(math.radians(lat)):
+    return min_lat, max_lat, -180.0, 180.0
+
+  delta_lng = math.degrees(math.asin(math.sin(angle) / math.cos(math.radians(lat))))
+  if lng - delta_lng < -180.0 or lng + delta_lng > 180.0:
+    return min_lat, max_lat, -180.0, 180.0
+  return min_lat, max_lat, lng - delta_lng, lng + delta_lng
+
+
+def filter_nearby(queryset, lat, lng, radius_km, address_field="address"):
+  """
+  Filter queryset to objects within radius_km of a point, closest first,
+  annotated with their distance in km
+  """
+  prefix = "{}__".format(address_field) if address_field else ""
+  min_lat, max_lat, min_lng, max_lng = bounding_box(lat, lng, radius_km)
+
+  object_lat = Radians(F(prefix + "lat"))
+  object_lng = Radians(F(prefix + "lng"))
+  cosine = Value(math.cos(math.radians(lat))) * Cos(object_lat) * Cos(object_lng - Value(math.radians(lng))) \
+    + Value(math.sin(math.radians(lat))) * Sin(object_lat)
+  distance = ExpressionWrapper(Value(EARTH_RADIUS_KM) * ACos(Least(Value(1.0), cosine)), output_field=FloatField())
+
+  return queryset.filter(**{
+    prefix + "lat__range": (min_lat, max_lat),
+    prefix + "lng__range": (min_lng, max_lng),
+  }).annotate(distance=distance).filter(distance__lte=radius_km).order_by("distance")
+
+
+def search_nearby(backend, searchqueryset, queryset, lat, lng, radius_km, limit):
+  """
+  Return up to limit objects of queryset within radius_km of a point,
+  closest first, sorted by Elasticsearch
+
+  Hits are filtered in Elasticsearch by the same fields as searchqueryset.
+  Hits missing from queryset, changed since they were indexed, are skipped
+  and replaced from the next page, up to MAX_PAGES pages.
+  """
+  point = {"lat": lat, "lon": lng}
+  query = {"bool": {"filter": [
+    {"term": {DJANGO_CT: get_model_ct(queryset.model)}},
+    {"query_string": {"query": searchqueryset.query.build_query()}},
+    {"geo_distance": {"distance": "{}km".format(radius_km), LOCATION_FIELD: point}},
+  ]}}
+  offset = 0
+  results = []
+
+  for page in range(MAX_PAGES):
+    size = min(limit, MAX_RESULT_WINDOW - offset)
+    if len(results) >= limit or size <= 0:
+      break
+
+    response = backend.conn.search(index=backend.index_name, body={
+      "query": query,
+      "sort": [{"_geo_distance": {LOCATION_FIELD: point, "order": "asc", "unit": "km"}}],
+      "_source": [DJANGO_ID],
+      "from": offset,
+      "size": size,
+    })
+    hits = response["hits"]["hits"]
+    distances = [(int(hit["_source"][DJANGO_ID]), hit["sort"][0]) for hit in hits]
+    objects = queryset.in_bulk([pk for pk, distance in distances])
+
+    for pk, distance in distances:
+      if pk in objects:
+        objects[pk].distance = distance
+        results.append(objects[pk])
+
+    if len(hits) < size:
+      break
+    offset += size
+
+  return results[:limit]
+
+
+def has_location(backend):
+  """
+  Return whether the index maps LOCATION_FIELD as a geo_point
+
+  Mappings can't change in place, so indexes created before the field was
+  added don't have it. Once found, the mapping isn't checked again, a
+  missing one is checked again after LOCATION_CHECK_TTL seconds.
+  """
+  checked = getattr(backend, "_location_checked", None)
+  if checked is not None and (checked[0] or time.monotonic() - checked[1] < LOCATION_CHECK_TTL):
+    return checked[0]
+
+  try:
+    mappings = backend.conn.indices.get_mapping(index=backend.index_name)
+  except NotFoundError:
+    mappings = {}
+
+  found = bool(mappings) and all(
+    mapping["mappings"].get("properties", {}).get(LOCATION_FIELD, {}).get("type") == "geo_point"
+    for mapping in mappings.values()
+  )
+  backend._location_checked = (found, time.monotonic())
+  return found
+
+
+def nearby(queryset, searchqueryset, lat, lng, radius_km, limit):
+  """
+  Return up to limit objects of queryset within radius_km of a point,
+  closest first, each with a distance attribute in km
+
+  searchqueryset filters the same objects as queryset in the search index.
+  """
+  backend = searchqueryset.query.backend
+  if hasattr(backend, "conn") and hasattr(backend.conn, "indices"):
+    if has_location(backend):
+      return search_nearby(backend, searchqueryset, queryset, lat, lng, radius_km, limit)
+    logger.warning("%s has no %s geo_point, searching the database until it is rebuilt with rebuild_search_index", backend.index_name, LOCATION_FIELD)
+  return list(filter_nearby(queryset, lat, lng, radius_km)[:limit])
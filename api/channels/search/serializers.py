@@ -0,0 +1,28 @@
+from ovp.apps.core.models import GoogleAddress
+from ovp.apps.organizations.models import Organization
+from ovp.apps.projects.models import Project
+from rest_framework import serializers
+
+
+class NearbyAddressSerializer(serializers.ModelSerializer):
+  class Meta:
+    model = GoogleAddress
+    fields = ["typed_address", "address_line", "city_state", "lat", "lng"]
+
+
+class NearbyProjectSerializer(serializers.ModelSerializer):
+  address = NearbyAddressSerializer(read_only=True)
+  distance = serializers.FloatField(read_only=True)
+
+  class Meta:
+    model = Project
+    fields = ["id", "slug", "name", "address", "distance"]
+
+
+class NearbyOrganizationSerializer(serializers.ModelSerializer):
+  address = NearbyAddressSerializer(read_only=True)
+  distance = serializers.FloatField(read_only=True)
+
+  class Meta:
+    model = Organization
+    fields = ["id", "slug", "name", "address", "distance"]
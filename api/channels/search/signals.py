@@ -0,0 +1,78 @@
+from collections import OrderedDict
+
+from django.apps import apps
+from django.conf import settings
+from haystack import connection_router
+from haystack import connections
+from haystack.exceptions import NotHandled
+from ovp.apps.search.signals import TiedModelRealtimeSignalProcessor
+
+from channels.default.models import SearchIndexQueue
+
+
+class QueuedSignalProcessor(TiedModelRealtimeSignalProcessor):
+  """
+  Signal processor recording changed objects in SearchIndexQueue instead of
+  indexing them while the request or import is running
+
+  The flush_search_index_queue task indexes queued objects in bulk. With
+  SEARCH_INDEX_SYNC objects are indexed right away, as the realtime
+  processor does.
+  """
+  def is_indexed(self, sender, instance):
+    for using in self.connection_router.for_write(instance=instance):
+      if sender in self.connections[using].get_unified_index().get_indexed_models():
+        return True
+    return False
+
+  def handle_save(self, sender, instance, **kwargs):
+    if settings.SEARCH_INDEX_SYNC:
+      return super().handle_save(sender, instance, **kwargs)
+
+    if self.is_indexed(sender, instance):
+      SearchIndexQueue.enqueue(sender, instance.pk, SearchIndexQueue.UPDATE)
+
+  def handle_delete(self, sender, instance, **kwargs):
+    if settings.SEARCH_INDEX_SYNC:
+      return super().handle_delete(sender, instance, **kwargs)
+
+    if self.is_indexed(sender, instance):
+      SearchIndexQueue.enqueue(sender, instance.pk, SearchIndexQueue.DELETE)
+
+
+def index_queued_objects(rows, backends=None):
+  """
+  Update or remove queued objects, with one bulk update per model and
+  search backend
+
+  backends are (backend, unified index) pairs, those of every search
+  connection written to by default.
+  """
+  pks = OrderedDict()
+  for row in rows:
+    model_class = apps.get_model(row.model)
+    updates, deletes = pks.setdefault(model_class, ([], []))
+    if row.action == SearchIndexQueue.UPDATE:
+      updates.append(row.object_id)
+    else:
+      deletes.append(row.object_id)
+
+  if backends is None:
+    backends = [(connections[using].get_backend(), connections[using].get_unified_index()) for using in connection_router.for_write()]
+
+  for backend, unified_index in backends:
+    for model_class, (updates, deletes) in pks.items():
+      try:
+        index = unified_index.get_index(model_class)
+      except NotHandled:
+        continue
+
+      instances = list(model_class._default_manager.filter(pk__in=updates)) if updates else []
+      to_update = [instance for instance in instances if index.should_update(instance)]
+      if to_update:
+        backend.update(index, to_update)
+
+      # Objects deleted after being queued for an update are removed too
+      found = set(instance.pk for instance in instances)
+      for pk in deletes + [pk for pk in updates if pk not in found]:
+        backend.remove("{}.{}".format(model_class._meta.label_lower, pk))
@@ -0,0 +1,8 @@
+from django.conf.urls import url
+
+from channels.search import views
+
+urlpatterns = [
+  url(r'^projects/$', views.NearbyProjectsView.as_view(), name='search-nearby-projects'),
+  url(r'^organizations/$', views.NearbyOrganizationsView.as_view(), name='search-nearby-organizations'),
+]
@@ -0,0 +1,76 @@
+from haystack.query import SearchQuerySet
+from ovp.apps.channels.content_flow import CFM
+from ovp.apps.organizations.models import Organization
+from ovp.apps.projects.models import Project
+from rest_framework import permissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from channels.search import serializers
+from channels.search.geo import nearby
+
+DEFAULT_RADIUS_KM = 10
+MAX_RADIUS_KM = 500
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+
+
+def _get_float(params, name, default=None, minimum=None, maximum=None):
+  value = params.get(name, default)
+  if value is None:
+    raise ValidationError({name: "This parameter is required."})
+
+  try:
+    value = float(value)
+  except (TypeError, ValueError):
+    raise ValidationError({name: "A number is required."})
+
+  if (minimum is not None and value < minimum) or (maximum is not None and value > maximum):
+    raise ValidationError({name: "Must be between {} and {}.".format(minimum, maximum)})
+  return value
+
+
+class NearbyView(APIView):
+  """
+  Published objects of the channel within radius km of lat, lng, closest
+  first
+
+  Query parameters: lat, lng, radius (km, default 10) and limit (default 20).
+  """
+  permission_classes = (permissions.AllowAny,)
+  model = None
+  serializer_class = None
+
+  def get_queryset(self):
+    queryset = self.model.objects.filter(published=True, deleted=False).select_related("address")
+    return CFM.filter_queryset(self.request.channel, queryset)
+
+  def get_searchqueryset(self):
+    searchqueryset = SearchQuerySet().models(self.model).filter(published=True, deleted=False)
+    return CFM.filter_searchqueryset(self.request.channel, searchqueryset)
+
+  def get(self, request, *args, **kwargs):
+    lat = _get_float(request.query_params, "lat", minimum=-90, maximum=90)
+    lng = _get_float(request.query_params, "lng", minimum=-180, maximum=180)
+    radius = _get_float(request.query_params, "radius", DEFAULT_RADIUS_KM, minimum=0, maximum=MAX_RADIUS_KM)
+    limit = int(_get_float(request.query_params, "limit", DEFAULT_LIMIT, minimum=1, maximum=MAX_LIMIT))
+
+    objects = nearby(self.get_queryset(), self.get_searchqueryset(), lat, lng, radius, limit)
+    return Response(self.serializer_class(objects, many=True, context={"request": request}).data)
+
+
+class NearbyProjectsView(NearbyView):
+  model = Project
+  serializer_class = serializers.NearbyProjectSerializer
+
+  def get_queryset(self):
+    return super().get_queryset().filter(closed=False)
+
+  def get_searchqueryset(self):
+    return super().get_searchqueryset().filter(closed=False)
+
+
+class NearbyOrganizationsView(NearbyView):
+  model = Organization
+  serializer_class = serializers.NearbyOrganizationSerializer
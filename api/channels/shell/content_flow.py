@@ -2,26 +2,21 @@ from haystack.query import SQ
 from django.db.models import Q
 from ovp.apps.core.models import Cause
 from ovp.apps.core.models import Skill
-from ovp.apps.projects.models import Category
 from ovp.apps.projects.models import Project
-from ovp.apps.projects.models import Apply
 from ovp.apps.organizations.models import Organization
 
-from ovp.apps.channels.content_flow import BaseContentFlow
 from ovp.apps.channels.content_flow import NoContentFlow
 from ovp.apps.channels.content_flow import CFM
 
-class ShellContentFlow(BaseContentFlow):
+from channels.content_flow import CategoryContentFlow
+
+class ShellContentFlow(CategoryContentFlow):
   source = "default"
   destination = "shell"
 
-  def __init__(self):
-    try:
-      self.category_id = Category.objects.get(slug="atados-to-shell").pk
-    except:
-      self.category_id = None
+  category_slug = "atados-to-shell"
 
-  def get_filter_searchqueryset_q_obj(self, model_class):
+  def build_filter_searchqueryset_q_obj(self, model_class):
     if model_class == Project:
       return SQ(categories=self.category_id)
 
@@ -30,16 +25,18 @@ class ShellContentFlow(BaseContentFlow):
 
     raise NoContentFlow
 
-  def get_filter_queryset_q_obj(self, model_class):
-    if model_class in [Cause, Skill]:
-      return Q()
-    elif model_class == Project:
+  def get_membership_q_obj(self, model_class):
+    if model_class == Project:
       return Q(categories=self.category_id)
     elif model_class == Organization:
       return Q(project__categories=self.category_id)
-    elif model_class == Apply:
-      return Q(project__categories=self.category_id)
 
     raise NoContentFlow
 
+  def build_filter_queryset_q_obj(self, model_class):
+    if model_class in [Cause, Skill]:
+      return Q()
+
+    return super().build_filter_queryset_q_obj(model_class)
+
 CFM.add_flow(ShellContentFlow())
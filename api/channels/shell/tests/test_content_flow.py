@@ -0,0 +1,95 @@
+from django.db import migrations
+from django.test import TestCase
+
+from ovp.apps.organizations.models import Organization
+from ovp.apps.users.models import User
+from ovp.apps.projects.models import Category
+from ovp.apps.projects.models import Project
+from ovp.apps.projects.models import Apply
+
+from channels.content_flow import build_memberships_after_migrate
+from channels.content_flow import get_filter_cache_stats
+from channels.content_flow import materialized_flows
+from channels.content_flow import reset_filter_cache_stats
+from channels.content_flow import rebuild_memberships
+from channels.default.models import ContentFlowMembership
+from channels.default.tasks import rebuild_content_flow_memberships
+
+class ContentFlowMemberships(TestCase):
+  def setUp(self):
+    self.flow = [flow for flow in materialized_flows if flow.destination == "shell"][0]
+    self.category = Category.objects.get(slug="atados-to-shell")
+    self.user = User.objects.create_user(name="a", email="testmail-projects@test.com", password="test_returned", object_channel="default")
+    self.organization = Organization.objects.create(name="test org", owner=self.user, object_channel="default")
+    self.project = Project.objects.create(name="test project", slug="test-slug", details="abc", description="abc", owner=self.user, organization=self.organization, published=True, object_channel="default")
+    self.apply = Apply.objects.create(user=self.user, project=self.project, object_channel="default")
+
+  def filter(self, model_class):
+    return model_class.objects.filter(self.flow.get_filter_queryset_q_obj(model_class))
+
+  def test_category_changes_update_memberships(self):
+    self.assertEqual(self.filter(Project).count(), 0)
+
+    self.project.categories.add(self.category)
+    self.assertEqual(list(self.filter(Project)), [self.project])
+    self.assertEqual(list(self.filter(Organization)), [self.organization])
+    self.assertEqual(list(self.filter(Apply)), [self.apply])
+
+    self.project.categories.remove(self.category)
+    self.assertEqual(self.filter(Project).count(), 0)
+    self.assertEqual(self.filter(Organization).count(), 0)
+    self.assertEqual(self.filter(Apply).count(), 0)
+
+  def test_rebuild_memberships(self):
+    self.project.categories.add(self.category)
+    ContentFlowMembership.objects.all().delete()
+    self.assertEqual(self.filter(Project).count(), 0)
+
+    rebuild_memberships()
+    self.assertEqual(list(self.filter(Project)), [self.project])
+    self.assertEqual(list(self.filter(Organization)), [self.organization])
+
+  def test_memberships_are_built_after_migrating(self):
+    self.project.categories.add(self.category)
+    ContentFlowMembership.objects.all().delete()
+
+    build_memberships_after_migrate(None, plan=[(migrations.Migration("0012_searchindexqueue", "default"), False)])
+    self.assertEqual(self.filter(Project).count(), 0)
+
+    build_memberships_after_migrate(None, plan=[(migrations.Migration("0009_contentflowmembership", "default"), False)])
+    self.assertEqual(list(self.filter(Project)), [self.project])
+
+  def test_category_rebuild_only_rebuilds_its_flows(self):
+    self.project.categories.add(self.category)
+    other_flow = [flow for flow in materialized_flows if flow.category_slug != self.flow.category_slug][0]
+    other = ContentFlowMembership.objects.create(source=other_flow.source, destination=other_flow.destination, model="projects.project", object_id=self.project.pk)
+    ContentFlowMembership.objects.filter(destination="shell").delete()
+
+    rebuild_content_flow_memberships(["atados-to-shell"])
+    self.assertEqual(list(self.filter(Project)), [self.project])
+    self.assertTrue(ContentFlowMembership.objects.filter(pk=other.pk).exists())
+
+  def test_filter_is_a_single_semi_join(self):
+    sql = str(self.filter(Organization).query)
+    self.assertIn(ContentFlowMembership._meta.db_table, sql)
+    self.assertNotIn(Category._meta.db_table, sql)
+
+
+class ContentFlowFilterMemoization(TestCase):
+  def setUp(self):
+    self.flow = [flow for flow in materialized_flows if flow.destination == "shell"][0]
+    self.flow.__dict__.pop("_filter_cache", None)
+    reset_filter_cache_stats()
+
+  def test_filters_are_built_once(self):
+    q_obj = self.flow.get_filter_queryset_q_obj(Project)
+    self.assertIs(self.flow.get_filter_queryset_q_obj(Project), q_obj)
+    self.assertEqual(get_filter_cache_stats()["shell"], {"misses": 1, "hits": 1})
+
+  def test_category_change_invalidates_filters(self):
+    self.flow.get_filter_searchqueryset_q_obj(Project)
+    Category.objects.get(slug="atados-to-shell").delete()
+    Category.objects.create(name="Export to shell", slug="atados-to-shell", object_channel="default")
+
+    self.flow.get_filter_searchqueryset_q_obj(Project)
+    self.assertEqual(get_filter_cache_stats()["shell"], {"misses": 2})
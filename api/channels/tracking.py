@@ -0,0 +1,53 @@
+from django.db.models.signals import post_init
+from django.db.models.signals import post_save
+
+ORIGINAL_VALUES_ATTR = "_tracked_original_values"
+
+_tracked_fields = {}
+
+
+def _store_original_values(sender, instance, **kwargs):
+  fields = _tracked_fields.get(sender, ())
+  deferred = instance.get_deferred_fields()
+  instance.__dict__[ORIGINAL_VALUES_ATTR] = {field: instance.__dict__.get(field) for field in fields if field not in deferred}
+
+
+def track_fields(model, *fields):
+  """
+  Track the values fields had when an instance was loaded or last saved
+
+  Signal handlers can then compare an instance against its stored state
+  with get_original_value or has_changed without querying the database.
+  Tracking the same model from several channels merges the field lists.
+  """
+  if model not in _tracked_fields:
+    post_init.connect(_store_original_values, sender=model, dispatch_uid="channels_tracking_post_init_{}".format(model._meta.label))
+    post_save.connect(_store_original_values, sender=model, dispatch_uid="channels_tracking_post_save_{}".format(model._meta.label))
+    _tracked_fields[model] = ()
+
+  _tracked_fields[model] = tuple(set(_tracked_fields[model]) | set(fields))
+
+
+def get_original_value(instance, field):
+  """
+  Return the value a field had when the instance was loaded or last saved
+
+  Falls back to a database query if the field is not tracked or was deferred
+  when the instance was loaded.
+  """
+  original_values = instance.__dict__.get(ORIGINAL_VALUES_ATTR, {})
+  if field in original_values:
+    return original_values[field]
+
+  if instance.pk is None:
+    return None
+
+  model = instance.__class__
+  return model._default_manager.filter(pk=instance.pk).values_list(field, flat=True).first()
+
+
+def has_changed(instance, field):
+  """
+  Return whether a field differs from its original value
+  """
+  return getattr(instance, field) != get_original_value(instance, field)
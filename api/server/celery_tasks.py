@@ -1,6 +1,8 @@
 from __future__ import absolute_import, unicode_literals
 import os
 from celery import Celery
+from celery.signals import worker_process_init
+from celery.signals import worker_process_shutdown
 
 # set the default Django settings module for the 'celery' program.
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'server.settings')
@@ -16,6 +18,23 @@ app.config_from_object('django.conf:settings', namespace='CELERY')
 # Load task modules from all registered Django app configs.
 app.autodiscover_tasks()
 
+@worker_process_init.connect
+def enable_email_connection_pool(**kwargs):
+    # Each worker process keeps its own SMTP connection open between emails
+    from channels.email_backends import connection_pool
+    connection_pool.enable()
+
+@worker_process_init.connect
+def load_content_flow_rules(**kwargs):
+    # Web processes load content flow rules when a request starts
+    from channels.content_flow import register_content_flow_rules
+    register_content_flow_rules()
+
+@worker_process_shutdown.connect
+def close_email_connection_pool(**kwargs):
+    from channels.email_backends import connection_pool
+    connection_pool.close()
+
 @app.task(bind=True)
 def debug_task(self):
     print('Request: {0!r}'.format(self.request))
@@ -104,6 +104,8 @@ SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
 
 # Email
 EMAIL_BACKEND = 'email_log.backends.EmailBackend'
+EMAIL_LOG_BACKEND = 'channels.email_backends.SharedConnectionEmailBackend'
+EMAIL_DELIVERY_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 DEFAULT_FROM_EMAIL="Atados <noreply@atados.email>"
 
 # Media and static files
@@ -111,7 +113,7 @@ MEDIA_ROOT = '/tmp'
 
 HAYSTACK_CONNECTIONS = {
     'default': {
-        'ENGINE': 'ovp.apps.search.backends.ConfigurableElasticSearchEngine',
+        'ENGINE': 'channels.search.backends.CachedConfigurableElasticSearchEngine',
         'URL': 'http://%s/' % (
             os.environ.get('HS_SEARCH_ENDPOINT', '127.0.0.1:9200')
         ),
@@ -4,7 +4,12 @@ PRJ=`pwd | rev | cut -d "/" -f3 | rev`
 celery multi stopwait worker1 \
     --logfile="$HOME/api/logs/celery/%n%I.log" \
     --pidfile="/tmp/celery.%n.pid"
-celery multi start worker1 -A server.celery_tasks \
+# -B runs celery beat inside the worker, it sends the CELERY_BEAT_SCHEDULE
+# periodic tasks. There must be a single beat, don't add it to more workers.
+celery multi start worker1 -A server.celery_tasks -B \
+    --schedule="/tmp/celerybeat-schedule" \
     --logfile="$HOME/api/logs/celery/%n%I.log" \
     --pidfile="/tmp/celery.%n.pid"
+# Email bodies are served with their CSS inlined ahead of time
+python manage.py compile_email_templates
 gunicorn server.wsgi:application -w 5 --timeout 300 --limit-request-line 16382 --bind unix:/tmp/api.$PRJ.socket
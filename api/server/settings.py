@@ -17,6 +17,7 @@ from corsheaders.defaults import default_headers
 
 from dotenv import load_dotenv
 from django.utils.translation import gettext_lazy as _
+from channels.search.analyzers import get_index_settings
 
 from dotenv import load_dotenv
 
@@ -86,9 +87,11 @@ INSTALLED_APPS = get_core_apps() + [
 
 MIDDLEWARE = [
     'ovp.apps.channels.middlewares.channel.StatsMiddleware',
+    'channels.middlewares.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'ovp.apps.channels.middlewares.channel.ChannelRecognizerMiddleware',
+    'channels.middlewares.CurrentChannelMiddleware',
     'corsheaders.middleware.CorsMiddleware',
     'debug_toolbar.middleware.DebugToolbarMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -100,8 +103,25 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
+# Request metrics, see channels.metrics. Every process writes its metrics
+# to METRICS_DIR, /metrics/ requires METRICS_TOKEN outside DEBUG.
+METRICS_ENABLED = bool(int(os.getenv('METRICS_ENABLED', 1)))
+METRICS_DIR = os.getenv('METRICS_DIR', os.path.join('/tmp', 'atados_metrics'))
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 10))
+METRICS_TOKEN = os.getenv('METRICS_TOKEN', None)
+
 ROOT_URLCONF = 'server.urls'
 
+TEMPLATE_LOADERS = [
+    # Serves channel email bodies with their CSS already inlined
+    ('channels.email_templates.Loader', [
+        'django.template.loaders.filesystem.Loader',
+        'django.template.loaders.app_directories.Loader',
+    ]),
+]
+if not DEBUG:
+    TEMPLATE_LOADERS = [('django.template.loaders.cached.Loader', TEMPLATE_LOADERS)]
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -112,8 +132,8 @@ TEMPLATES = [
             os.path.join(BASE_DIR, 'channels', 'gdd', 'templates'),
             os.path.join(BASE_DIR, 'channels', 'rrp', 'templates')
         ],
-        'APP_DIRS': True,
         'OPTIONS': {
+            'loaders': TEMPLATE_LOADERS,
             'context_processors': [
                 'django.template.context_processors.debug',
                 'django.template.context_processors.request',
@@ -223,8 +243,14 @@ EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', None)
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', None)
 DEFAULT_FROM_EMAIL = "{} <{}>".format(EMAIL_NAME, EMAIL_HOST_USER)
 EMAIL_USE_SSL = True
-EMAIL_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
+EMAIL_BACKEND = 'channels.email_backends.SharedConnectionEmailBackend'
+EMAIL_DELIVERY_BACKEND = 'django.core.mail.backends.filebased.EmailBackend'
 EMAIL_FILE_PATH = '/tmp/atados-ovp-messages'
+# Email bodies with inlined CSS written by compile_email_templates, which
+# server.sh runs on deploy
+EMAIL_COMPILED_TEMPLATES_DIR = os.getenv('EMAIL_COMPILED_TEMPLATES_DIR', os.path.join(BASE_DIR, 'compiled_templates'))
+# Seconds a pooled connection may stay idle before it is checked with a NOOP
+EMAIL_POOL_KEEPALIVE = int(os.getenv('EMAIL_POOL_KEEPALIVE', 30))
 NOTIFYBOX_CHANNELS = [ 'default' ]
 
 
@@ -236,68 +262,18 @@ MEDIA_URL = '/media/'
 
 # Haystack
 
-ELASTICSEARCH_INDEX_SETTINGS = {
-    "settings": {
-        "analysis": {
-            "analyzer": {
-                "ngram_analyzer": {
-                    "type": "custom",
-                    "tokenizer": "standard",
-                    "filter": ["haystack_ngram"]
-                },
-                "edgengram_analyzer": {
-                    "type": "custom",
-                    "tokenizer": "standard",
-                    "filter": [
-                        "haystack_edgengram",
-                        "lowercase",
-                        "asciifolding"
-                    ]
-                },
-                "snowball": {
-                    "type": "custom",
-                    "tokenizer": "standard",
-                    "filter": [
-                        "lowercase",
-                        "asciifolding"
-                    ]
-                }
-            },
-            "tokenizer": {
-                "haystack_ngram_tokenizer": {
-                    "type": "nGram",
-                    "min_gram": 3,
-                    "max_gram": 15,
-                },
-                "haystack_edgengram_tokenizer": {
-                    "type": "edgeNGram",
-                    "min_gram": 2,
-                    "max_gram": 15,
-                    "side": "front"
-                }
-            },
-            "filter": {
-                "haystack_ngram": {
-                    "type": "nGram",
-                    "min_gram": 3,
-                    "max_gram": 15
-                },
-                "haystack_edgengram": {
-                    "type": "edgeNGram",
-                    "min_gram": 2,
-                    "max_gram": 15
-                }
-            }
-        }
-    }
-}
+# Analysis profile of the search index, see channels.search.analyzers.
+# "ngram" indexes 3 to 15 character n-grams, compare profiles with
+# benchmark_search_analyzers and rebuild the index after changing it.
+SEARCH_ANALYZER_PROFILE = os.getenv('SEARCH_ANALYZER_PROFILE', 'ngram')
+ELASTICSEARCH_INDEX_SETTINGS = get_index_settings(SEARCH_ANALYZER_PROFILE)
 
 HS_ENDPOINT = os.environ.get('HS_SEARCH_ENDPOINT', None)
 
 if HS_ENDPOINT:
     HAYSTACK_CONNECTIONS = {
         'default': {
-            'ENGINE': 'ovp.apps.search.backends.ConfigurableElasticSearchEngine',
+            'ENGINE': 'channels.search.backends.CachedConfigurableElasticSearchEngine',
             'URL': 'http://%s/' % (
                 os.environ.get('HS_SEARCH_ENDPOINT', '127.0.0.1:9200')
             ),
@@ -305,14 +281,59 @@ if HS_ENDPOINT:
         },
     }
 else:
+    # Whoosh for development, CI and single node deployments. The index is
+    # kept at WHOOSH_INDEX_PATH, rebuild it with rebuild_whoosh_index, which
+    # makes WHOOSH_INDEX_PATH a symlink to the latest build.
     HAYSTACK_CONNECTIONS = {
         'default': {
-            'ENGINE': 'haystack.backends.whoosh_backend.WhooshEngine',
-            'PATH': os.path.join('/tmp', 'atados_whoosh_index'),
+            'ENGINE': 'channels.search.backends.CachedWhooshEngine',
+            'PATH': os.getenv('WHOOSH_INDEX_PATH', os.path.join(BASE_DIR, 'whoosh_index')),
+            'PROCS': int(os.getenv('WHOOSH_PROCS', 1)),
+            'COMMIT_BATCH_SIZE': int(os.getenv('WHOOSH_COMMIT_BATCH_SIZE', 1000)),
         },
     }
 
-HAYSTACK_SIGNAL_PROCESSOR = 'ovp.apps.search.signals.TiedModelRealtimeSignalProcessor'
+# channels.default.search_indexes adds addresses as geo points to these.
+# Elasticsearch indexes created before need rebuild_search_index, distance
+# searches use the database until then.
+HAYSTACK_EXCLUDED_INDEXES = [
+    'ovp.apps.search.search_indexes.ProjectIndex',
+    'ovp.apps.search.search_indexes.OrganizationIndex',
+]
+
+HAYSTACK_SIGNAL_PROCESSOR = 'channels.search.signals.QueuedSignalProcessor'
+
+# Saved objects are queued and indexed in bulk by flush_search_index_queue,
+# which celery beat runs every SEARCH_INDEX_QUEUE_INTERVAL seconds.
+# server.test_settings indexes synchronously.
+SEARCH_INDEX_SYNC = bool(int(os.getenv('SEARCH_INDEX_SYNC', 0)))
+SEARCH_INDEX_QUEUE_INTERVAL = float(os.getenv('SEARCH_INDEX_QUEUE_INTERVAL', 5))
+SEARCH_INDEX_QUEUE_BATCH_SIZE = int(os.getenv('SEARCH_INDEX_QUEUE_BATCH_SIZE', 500))
+
+# Seconds search results are cached, 0 disables the cache. Writes to the
+# index invalidate cached results of the model written right away.
+SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', 30))
+
+# Index writes happen in celery workers and invalidate results cached by
+# web workers, so the search cache must be shared by every process. Files
+# are shared by the processes of a host, set MEMCACHED_LOCATION when the
+# api runs on several hosts.
+SEARCH_CACHE_ALIAS = 'search'
+MEMCACHED_LOCATION = os.getenv('MEMCACHED_LOCATION')
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'search': {
+        'BACKEND': 'django.core.cache.backends.memcached.MemcachedCache',
+        'LOCATION': MEMCACHED_LOCATION,
+    } if MEMCACHED_LOCATION else {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.getenv('SEARCH_CACHE_DIR', os.path.join('/tmp', 'atados_search_cache')),
+        'OPTIONS': {'MAX_ENTRIES': 10000},
+    },
+}
 
 # Authentication backends
 
@@ -420,6 +441,45 @@ SALESFORCE_INTEGRATION={
     }
 }
 
+# Celery beat
+
+CELERY_BEAT_SCHEDULE = {
+    'dispatch-scheduled-notifications': {
+        'task': 'channels.default.tasks.dispatch_scheduled_notifications',
+        'schedule': 60.0,
+    },
+    'prune-scheduled-notifications': {
+        'task': 'channels.default.tasks.prune_scheduled_notifications',
+        'schedule': 24 * 60 * 60.0,
+    },
+    'flush-search-index-queue': {
+        'task': 'channels.default.tasks.flush_search_index_queue',
+        'schedule': SEARCH_INDEX_QUEUE_INTERVAL,
+    },
+}
+
+# Scheduled notifications are read from the database in batches of this size
+SCHEDULED_NOTIFICATIONS_BATCH_SIZE = int(os.getenv('SCHEDULED_NOTIFICATIONS_BATCH_SIZE', 500))
+# Days dispatched notifications are kept, a notification can't be scheduled
+# twice for the same object meanwhile
+SCHEDULED_NOTIFICATIONS_RETENTION_DAYS = int(os.getenv('SCHEDULED_NOTIFICATIONS_RETENTION_DAYS', 30))
+
+# Ratings
+# "incremental" keeps running aggregates per rated object, "database" averages
+# answers on every update. Run rebuild_rating_aggregates when switching back
+# to "incremental", aggregates are not maintained in "database" mode.
+RATINGS_SCORE_MODE = os.getenv('RATINGS_SCORE_MODE', 'incremental')
+
+# Content flows
+# Seconds ContentFlowRule rows are cached by each process before being read again
+CONTENT_FLOW_RULES_TTL = int(os.getenv('CONTENT_FLOW_RULES_TTL', 60))
+
+# GDD importer
+# Same key ovp geocodes addresses with
+GOOGLE_MAPS_KEY = os.getenv('GOOGLE_MAPS_KEY')
+GDD_IMPORT_GEOCODER = os.getenv('GDD_IMPORT_GEOCODER', 'channels.gdd.geocoding.GoogleGeocoder')
+GDD_GEOCODE_CACHE = os.getenv('GDD_GEOCODE_CACHE', os.path.join(BASE_DIR, 'gdd_geocode_cache.json'))
+
 # OVP Test channels
 TEST_CHANNELS = ["test-channel", "channel1"]
 
@@ -427,3 +487,8 @@ if env == 'production':
     from .production import *
 else:
     from .dev import *
+
+if not DEBUG:
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', TEMPLATES[0]['OPTIONS']['loaders']),
+    ]
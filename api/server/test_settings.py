@@ -0,0 +1,20 @@
+"""
+Settings for running tests:
+
+  python manage.py test --settings=server.test_settings
+"""
+from .settings import *
+
+# Objects are indexed right away instead of being queued for
+# flush_search_index_queue, and searches are not cached
+SEARCH_INDEX_SYNC = bool(int(os.getenv('SEARCH_INDEX_SYNC', 1)))
+SEARCH_CACHE_TTL = int(os.getenv('SEARCH_CACHE_TTL', 0))
+
+# Tests enabling the search cache start from an empty one
+CACHES['search'] = {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    'LOCATION': 'search',
+}
+
+if 'PATH' in HAYSTACK_CONNECTIONS['default']:
+    HAYSTACK_CONNECTIONS['default']['PATH'] = os.getenv('WHOOSH_INDEX_PATH', os.path.join('/tmp', 'atados_whoosh_index'))
@@ -23,6 +23,7 @@ from rest_framework import permissions
 from ovp.apps.channels.admin import admin_site
 
 from sandbox.urls import core_urls
+from channels.metrics import metrics_view
 
 schema_view = get_schema_view(
    openapi.Info(
@@ -44,6 +45,12 @@ urlpatterns = core_urls + [
     url(r'^swagger/$', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     url(r'^redoc/$', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
 
+    # Request metrics
+    url(r'^metrics/$', metrics_view, name='metrics'),
+
+    # Distance search
+    url(r'^search/nearby/', include('channels.search.urls')),
+
     # Admin
     url(r'^jet/', include('jet.urls', 'jet')),
     url(r'^jet/dashboard/', include('jet.dashboard.urls', 'jet-dashboard')),